@@ -0,0 +1,150 @@
+"""
+Memory and payload size of the chunks of a document, as plain dicts (every chunk carrying
+url, type, filename and the full text of its table, copied once more by format_data)
+against chunk_model.Chunk (shared document fields, table text stored once per table,
+expanded only while serialized), and the bulk payload with the table text on every chunk
+against DB_UPLOAD_SHARED_TABLES. Also measured after a round trip through the ingestion
+cache, where every table text used to be read back once per chunk.
+
+    python benchmarks/chunk_payload.py --text-chunks 2000 --tables 50 --table-rows 200
+"""
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+SYLLABLES = "ba ce di fo gu la me ni po ru sa te vi zo ca de fi lo mu na pe ri so tu".split()
+
+def make_document(text_chunks: int, tables: int, table_rows: int, seed: int) -> list[tuple[str, int, str | None, str | None]]:
+    """
+    (text, page_number, table_id, table_text) of every chunk. A table is chunked by rows,
+    about 20 rows per chunk, and every chunk of it references the whole markdown table.
+    """
+    rng = random.Random(seed)
+    word = lambda: "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+    chunks = []
+    for number in range(text_chunks):
+        chunks.append((" ".join(word() for _ in range(rng.randint(60, 110))), number // 5 + 1, None, None))
+
+    for table in range(tables):
+        rows = [" | ".join(f"{word()} {rng.randint(0, 99999)}" for _ in range(6)) for _ in range(table_rows)]
+        table_text = "\n".join(f"| {row} |" for row in rows)
+        table_id = f"table-{table}"
+        for start in range(0, table_rows, 20):
+            chunks.append((" ".join(rows[start:start + 20]), table + 1, table_id, table_text))
+    return chunks
+
+def build_dicts(document: list, index: str) -> tuple[list[dict], list[dict]]:
+    chunks = [
+        {
+            "id": f"chunk-{number}",
+            "text": text,
+            "url": "",
+            "type": "pdf",
+            "filename": "report.pdf",
+            "page_number": page_number,
+            "table_id": table_id,
+            "table_text": table_text,
+        }
+        for number, (text, page_number, table_id, table_text) in enumerate(document)
+    ]
+    return chunks, [{"_index": index, "_id": chunk["id"]} | chunk for chunk in chunks]
+
+def build_chunks(document: list, index: str) -> tuple[list, list]:
+    from chunk_model import Chunk, ChunkSource
+
+    source = ChunkSource("", "pdf", "report.pdf")
+    chunks = []
+    for number, (text, page_number, table_id, table_text) in enumerate(document):
+        if table_id is not None:
+            source.tables.setdefault(table_id, table_text)
+        chunks.append(Chunk(f"chunk-{number}", text, page_number, table_id, source))
+    return chunks, [chunk.for_index(index) for chunk in chunks]
+
+def measure_memory(build) -> tuple[object, int]:
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def serialize(documents: list, batch_size: int, shared_tables: bool = False) -> tuple[int, float]:
+    """
+    Bytes of the bulk requests (like db_client.db_upload) and the time to produce them.
+    """
+    from chunk_model import share_tables, to_json
+
+    start = time.perf_counter()
+    size = 0
+    for offset in range(0, len(documents), batch_size):
+        body = {"id": "benchmark", "content": documents[offset:offset + batch_size]}
+        if shared_tables:
+            body["content"], body["tables"] = share_tables(body["content"])
+        size += len(json.dumps(body, allow_nan=False, default=to_json).encode("utf-8"))
+    return size, time.perf_counter() - start
+
+def cache_lines(chunks: list, compact_tables: bool) -> list[str]:
+    from chunk_model import compact
+
+    tables_written = set()
+    return [
+        json.dumps(compact(chunk, tables_written) if compact_tables else dict(chunk), ensure_ascii=False)
+        for chunk in chunks
+    ]
+
+def main() -> None:
+    from chunk_model import Chunk, ChunkSource
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-chunks", type=int, default=2000)
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--table-rows", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    document = make_document(args.text_chunks, args.tables, args.table_rows, args.seed)
+    # the texts exist either way, only the structures around them are measured
+    _, dicts_bytes = measure_memory(lambda: build_dicts(document, "benchmark"))
+    _, chunks_bytes = measure_memory(lambda: build_chunks(document, "benchmark"))
+
+    dict_chunks, dict_documents = build_dicts(document, "benchmark")
+    chunks, documents = build_chunks(document, "benchmark")
+    dict_payload, dict_seconds = serialize(dict_documents, args.batch_size)
+    chunk_payload, chunk_seconds = serialize(documents, args.batch_size)
+    if dict_payload != chunk_payload:
+        raise RuntimeError("The bulk payloads of both representations differ")
+    shared_payload, _ = serialize(documents, args.batch_size, shared_tables=True)
+
+    # the ingestion cache: before, every line carried its table and was read back as is
+    full_lines = cache_lines(dict_chunks, compact_tables=False)
+    compact_lines = cache_lines(chunks, compact_tables=True)
+    _, cached_dicts_bytes = measure_memory(lambda: [json.loads(line) for line in full_lines])
+    source = ChunkSource("", "pdf", "report.pdf")
+    _, cached_chunks_bytes = measure_memory(
+        lambda: [Chunk.from_mapping(json.loads(line), source) for line in compact_lines]
+    )
+
+    mb = lambda size: round(size / 1024 ** 2, 2)
+    results = {
+        "chunks": len(document),
+        "table_chunks": sum(1 for chunk in document if chunk[2] is not None),
+        "memory_mb": {"dicts": mb(dicts_bytes), "chunks": mb(chunks_bytes)},
+        "memory_from_cache_mb": {"dicts": mb(cached_dicts_bytes), "chunks": mb(cached_chunks_bytes)},
+        "bulk_payload_mb": {"per_chunk_tables": mb(chunk_payload), "shared_tables": mb(shared_payload)},
+        "serialize_seconds": {"dicts": round(dict_seconds, 3), "chunks": round(chunk_seconds, 3)},
+        "cache_entry_mb": {
+            "full": mb(len(gzip.compress("\n".join(full_lines).encode("utf-8")))),
+            "compact": mb(len(gzip.compress("\n".join(compact_lines).encode("utf-8")))),
+        },
+    }
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Reproducible synthetic PDFs for the benchmarks, generated with PyMuPDF. The same kind,
+page count and seed always produce the same document.
+
+    python benchmarks/corpus.py --output benchmarks/corpus
+"""
+import argparse
+import random
+from pathlib import Path
+import pymupdf
+
+WORDS = (
+    "societatea raport financiar venituri cheltuieli profit exercitiul anual capital "
+    "active datorii consiliul administratie actionari dividende trimestrul situatii "
+    "consolidate rezultatul net operational investitii credite furnizori clienti "
+    "contract prestari servicii conform legii articolul prevederile aprobat adunarea "
+    "generala ordinara extraordinara conducere strategie dezvoltare piata energie"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = pymupdf.paper_size("a4")
+MARGIN = 56
+
+# kind -> default number of pages
+KINDS = {
+    "text": 10,
+    "tables": 10,
+    "scanned": 5,
+    "long": 300,
+}
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 24))
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+def _write_text_page(page: pymupdf.Page, rng: random.Random, title: str) -> None:
+    rect = pymupdf.Rect(MARGIN, MARGIN, PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN)
+    text = title + "\n\n" + "\n\n".join(_paragraph(rng) for _ in range(5))
+    page.insert_textbox(rect, text, fontsize=10, fontname="helv")
+
+def _write_table_page(page: pymupdf.Page, rng: random.Random, title: str) -> None:
+    page.insert_text((MARGIN, MARGIN), title, fontsize=12, fontname="helv")
+
+    cols = rng.randint(4, 7)
+    rows = rng.randint(15, 30)
+    col_width = (PAGE_WIDTH - 2 * MARGIN) / cols
+    row_height = 16
+    top = MARGIN + 20
+
+    for row in range(rows + 1):
+        y = top + row * row_height
+        for col in range(cols):
+            x = MARGIN + col * col_width
+            cell = pymupdf.Rect(x, y, x + col_width, y + row_height)
+            page.draw_rect(cell, color=(0, 0, 0), width=0.5)
+            if row == 0:
+                value = rng.choice(WORDS).capitalize()
+            elif col == 0:
+                value = rng.choice(WORDS)
+            else:
+                value = f"{rng.uniform(-1e6, 1e6):,.2f}"
+            page.insert_text((x + 3, y + 11), value, fontsize=8, fontname="helv")
+
+    # a paragraph below the table, like a note to the financial statements
+    rect = pymupdf.Rect(MARGIN, top + (rows + 2) * row_height, PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN)
+    page.insert_textbox(rect, _paragraph(rng), fontsize=10, fontname="helv")
+
+def _scan_page(document: pymupdf.Document, page: pymupdf.Page, dpi: int = 100) -> None:
+    """
+    Replace the page with a picture of itself, like a scanned document without a text layer.
+    """
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY)
+    number = page.number
+    document.delete_page(number)
+    scanned = document.new_page(number, width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    scanned.insert_image(scanned.rect, stream=pixmap.tobytes("png"))
+
+def generate(kind: str, pages: int | None = None, seed: int = 0) -> bytes:
+    if kind not in KINDS:
+        raise ValueError(f"Unknown document kind {kind!r}, expected one of {sorted(KINDS)}")
+
+    pages = pages or KINDS[kind]
+    rng = random.Random(f"{kind}:{pages}:{seed}")
+    document = pymupdf.open()
+
+    for number in range(pages):
+        page = document.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        title = f"Capitolul {number + 1}. {_sentence(rng)}"
+
+        # long documents mix text with a table every few pages
+        if kind == "tables" or (kind == "long" and number % 5 == 4):
+            _write_table_page(page, rng, title)
+        else:
+            _write_text_page(page, rng, title)
+
+        if kind == "scanned":
+            _scan_page(document, page)
+
+    # fixed metadata, so the output is byte-for-byte reproducible
+    document.set_metadata({"title": f"benchmark-{kind}", "creationDate": "", "modDate": "", "producer": ""})
+    data = document.tobytes(garbage=3, deflate=True, no_new_id=True)
+    document.close()
+
+    return data
+
+def generate_corpus(output_dir: str | Path, kinds: list[str] | None = None, pages: int | None = None, seed: int = 0) -> list[Path]:
+    """
+    Write one PDF per kind into output_dir, reusing the files that already exist.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for kind in kinds or list(KINDS):
+        path = output_dir / f"{kind}-{pages or KINDS[kind]}p-{seed}.pdf"
+        if not path.exists():
+            path.write_bytes(generate(kind, pages, seed))
+        paths.append(path)
+
+    return paths
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=Path(__file__).resolve().parent / "corpus")
+    parser.add_argument("--kinds", nargs="+", choices=sorted(KINDS), default=list(KINDS))
+    parser.add_argument("--pages", type=int, default=None, help="override the page count of every kind")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for path in generate_corpus(args.output, args.kinds, args.pages, args.seed):
+        print(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Embedding throughput of the chunks on CPU: the unbatched fp32 baseline (one text per
+model call, like a downstream embedder called per chunk) against the length-bucketed
+batches of embedder.Embedder on every requested backend. Quantized backends also
+report how close their vectors are to fp32 (cosine similarity).
+
+    python benchmarks/embedding.py --texts 512 --backends torch torch-int8 onnx-int8 --threads 4
+
+The model is loaded from the local caches (HF_HUB_OFFLINE), run once with
+HF_HUB_OFFLINE=0 to download it. The onnx backends need onnxruntime.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import numpy as np
+from corpus import WORDS
+
+def make_texts(count: int, seed: int) -> list[str]:
+    """
+    Chunk-like texts: mostly full chunks, some short ones (titles, table rows, the last
+    chunk of an element), so the lengths vary like in a real document.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = rng.randint(5, 30) if rng.random() < 0.3 else rng.randint(60, 110)
+        texts.append(" ".join(rng.choices(WORDS, k=words)).capitalize() + ".")
+    return texts
+
+def run(embed, texts: list[str], repeat: int) -> tuple[np.ndarray, dict]:
+    # one warm-up call, the first inference allocates the buffers
+    embed(texts[:8])
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        vectors = embed(texts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return vectors, {"seconds": round(best, 4), "texts_per_second": round(len(texts) / best, 1)}
+
+def cosine(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    return (first * second).sum(axis=1) / (np.linalg.norm(first, axis=1) * np.linalg.norm(second, axis=1))
+
+def main() -> None:
+    from embedder import BACKENDS, TORCH, Embedder
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None, help="default: EMBEDDING_THREADS or all cores")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts, args.seed)
+    threads = args.threads or os.cpu_count()
+
+    baseline = Embedder(TORCH, batch_size=1, threads=threads)
+    reference, results = run(lambda batch: np.vstack([baseline.embed([text]) for text in batch]), texts, args.repeat)
+    results = {"texts": args.texts, "threads": threads, "unbatched_fp32": results}
+
+    for backend in args.backends:
+        try:
+            embedder = Embedder(backend, batch_size=args.batch_size, threads=threads)
+        except (ImportError, RuntimeError) as e:
+            results[backend] = f"skipped: {e}"
+            continue
+
+        vectors, result = run(embedder.embed, texts, args.repeat)
+        result["speedup"] = round(results["unbatched_fp32"]["seconds"] / result["seconds"], 1)
+        similarity = cosine(vectors, reference)
+        result["cosine_to_fp32"] = {"min": round(float(similarity.min()), 5), "mean": round(float(similarity.mean()), 5)}
+        results[backend] = result
+
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
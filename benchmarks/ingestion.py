@@ -0,0 +1,259 @@
+"""
+Ingestion pipeline benchmark. Runs every stage of PdfProcessor (partition_pdf, cleanup,
+deduplicate, perform_chunking, format_data) and the bulk upload separately on a synthetic corpus
+(see corpus.py), with the DB and auth services stubbed (see stub_services.py), and
+reports wall time, CPU time, peak RSS and throughput per stage as JSON.
+
+    python benchmarks/ingestion.py --output results.json
+    python benchmarks/ingestion.py --kinds text tables --baseline results.json
+
+With --baseline the run is compared with a previous result and the exit code is 1 if a
+stage got slower or bigger than the tolerance allows. The models are loaded from the
+local caches (HF_HUB_OFFLINE), run once with HF_HUB_OFFLINE=0 to download them.
+CPU time only covers this process, not the partitioning workers (PARTITION_WORKERS > 1).
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+# measure the pipeline itself, not a cache hit
+os.environ.setdefault("INGESTION_CACHE_ENABLED", "false")
+
+from corpus import KINDS, generate_corpus
+from stub_services import StubServices
+
+# metrics compared with the baseline
+COMPARED_METRICS = ("wall_seconds", "cpu_seconds", "peak_rss_bytes")
+
+class _PeakRss:
+    """
+    Samples the RSS from a background thread while a stage runs.
+    """
+    def __init__(self, interval: float = 0.01) -> None:
+        from utils import get_rss_bytes
+
+        self._get_rss = get_rss_bytes
+        self._interval = interval
+        self._stop = threading.Event()
+        self.peak = 0
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._get_rss())
+            self._stop.wait(self._interval)
+
+    def __enter__(self) -> "_PeakRss":
+        self.peak = self._get_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._get_rss())
+
+def _cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+def measure(fn) -> tuple[object, dict]:
+    from utils import get_rss_bytes
+
+    rss_before = get_rss_bytes()
+    with _PeakRss() as peak_rss:
+        cpu_start = _cpu_seconds()
+        start = time.perf_counter()
+        result = fn()
+        wall = time.perf_counter() - start
+        cpu = _cpu_seconds() - cpu_start
+
+    return result, {
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "peak_rss_bytes": peak_rss.peak,
+        "rss_delta_bytes": get_rss_bytes() - rss_before,
+    }
+
+def run_document(path: Path, upload: bool) -> dict:
+    from pdf_processor import PdfProcessor
+    from app.db_client import db_upload_stream
+
+    data = path.read_bytes()
+    processor = PdfProcessor(str(path), "", data=data)
+    stages = {}
+
+    _, stages["partition_pdf"] = measure(processor.partition_pdf)
+    _, stages["cleanup"] = measure(processor.cleanup)
+    _, stages["dedup"] = measure(processor.deduplicate)
+    _, stages["perform_chunking"] = measure(processor.perform_chunking)
+    content, stages["format_data"] = measure(lambda: processor.format_data("benchmark"))
+    if upload:
+        response, stages["upload"] = measure(lambda: db_upload_stream("benchmark", content or []))
+        if response is None:
+            raise RuntimeError("Upload to the stub db-service failed")
+
+    counts = {
+        "pages": processor.num_pages,
+        "elements": len(processor.elements or []),
+        "tables": len(processor.table_models),
+        "chunks": len(processor.chunks),
+        "dedup_bytes_avoided": sum(size for _, size in processor.deduplicator.dropped.values()),
+    }
+    for stage in stages.values():
+        stage["pages_per_second"] = counts["pages"] / stage["wall_seconds"] if stage["wall_seconds"] else None
+        stage["chunks_per_second"] = counts["chunks"] / stage["wall_seconds"] if stage["wall_seconds"] else None
+
+    return {"counts": counts, "stages": stages}
+
+def summarize(runs: list[dict]) -> dict:
+    """
+    Median of every stage metric over the repeated runs.
+    """
+    stages = {}
+    for stage in runs[0]["stages"]:
+        stages[stage] = {
+            metric: statistics.median(run["stages"][stage][metric] for run in runs)
+            if runs[0]["stages"][stage][metric] is not None else None
+            for metric in runs[0]["stages"][stage]
+        }
+
+    total_wall = sum(stage["wall_seconds"] for stage in stages.values())
+    counts = runs[0]["counts"]
+
+    return {
+        "counts": counts,
+        "stages": stages,
+        "total": {
+            "wall_seconds": total_wall,
+            "cpu_seconds": sum(stage["cpu_seconds"] for stage in stages.values()),
+            "peak_rss_bytes": max(stage["peak_rss_bytes"] for stage in stages.values()),
+            "pages_per_second": counts["pages"] / total_wall if total_wall else None,
+            "chunks_per_second": counts["chunks"] / total_wall if total_wall else None,
+        },
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> list[dict]:
+    """
+    Stages (and document totals) whose metrics exceed the baseline by more than the tolerance.
+    Timings below min_seconds in the baseline are too noisy to compare.
+    """
+    regressions = []
+    for document, result in results["documents"].items():
+        base = baseline.get("documents", {}).get(document)
+        if base is None:
+            continue
+
+        sections = {"total": (result["total"], base["total"])}
+        for stage, metrics in result["stages"].items():
+            if stage in base["stages"]:
+                sections[stage] = (metrics, base["stages"][stage])
+
+        for section, (current, previous) in sections.items():
+            for metric in COMPARED_METRICS:
+                if not previous.get(metric):
+                    continue
+                if metric != "peak_rss_bytes" and previous[metric] < min_seconds:
+                    continue
+
+                ratio = current[metric] / previous[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append({
+                        "document": document,
+                        "stage": section,
+                        "metric": metric,
+                        "baseline": previous[metric],
+                        "current": current[metric],
+                        "ratio": round(ratio, 3),
+                    })
+
+    return regressions
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=BENCHMARKS_DIR / "corpus")
+    parser.add_argument("--kinds", nargs="+", choices=sorted(KINDS), default=list(KINDS))
+    parser.add_argument("--pages", type=int, default=None, help="override the page count of every kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="report the median of N runs")
+    parser.add_argument("--no-upload", action="store_true", help="skip the upload to the stub db-service")
+    parser.add_argument("--output", help="write the results to this file (e.g. to use as a baseline)")
+    parser.add_argument("--baseline", help="compare with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown/growth, 0.15 = 15%%")
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.corpus_dir, args.kinds, args.pages, args.seed)
+
+    with StubServices() as stubs:
+        stubs.configure_env()
+
+        from config import Config
+        from model_registry import registry
+
+        _, model_load = measure(registry.warmup)
+
+        documents = {}
+        for path in paths:
+            runs = [run_document(path, upload=not args.no_upload) for _ in range(args.repeat)]
+            documents[path.stem] = summarize(runs)
+            print(f"{path.stem}: {documents[path.stem]['total']['wall_seconds']:.2f}s", file=sys.stderr)
+
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "pipeline_version": Config.PIPELINE_VERSION,
+            "partition_workers": Config.PARTITION_WORKERS,
+            "adaptive_strategy": Config.ADAPTIVE_STRATEGY,
+            "spacy_batch_sentencize": Config.SPACY_BATCH_SENTENCIZE,
+            "dedup_policy": Config.DEDUP_POLICY,
+        },
+        "model_load": model_load,
+        "documents": documents,
+    }
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(
+                "REGRESSION {document} {stage} {metric}: {baseline:.4g} -> {current:.4g} (x{ratio})".format(**regression),
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
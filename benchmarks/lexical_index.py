@@ -0,0 +1,130 @@
+"""
+Local lexical index (lexical_index.LexicalIndex) on a synthetic corpus: indexing time of
+the chunks uploaded document by document (one segment per upload, merged as they pile up),
+size on disk, and search latency of single-term, multi-term and quoted queries, with some
+documents deleted.
+
+    python benchmarks/lexical_index.py --chunks 100000 --chunks-per-document 100
+"""
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import numpy as np
+
+SYLLABLES = "ba ce di fo gu la me ni po ru sa te vi zo ca de fi lo mu na pe ri so tu ar en in or us".split()
+
+def make_vocabulary(size: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+def make_chunks(count: int, per_document: int, vocabulary: list[str], seed: int) -> list[list[dict]]:
+    """
+    Chunks of ~60-110 words drawn from a Zipf-like distribution (few very common words,
+    a long tail), grouped by document.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    documents = []
+    for number in range(0, count, per_document):
+        filename = f"document-{number // per_document:05d}.pdf"
+        chunks = []
+        for index in range(min(per_document, count - number)):
+            text = " ".join(rng.choices(vocabulary, weights, k=rng.randint(60, 110))).capitalize() + "."
+            chunks.append({
+                "_index": "benchmark",
+                "_id": f"{filename}-{index}",
+                "id": f"{filename}-{index}",
+                "text": text,
+                "filename": filename,
+                "page_number": index // 4 + 1,
+            })
+        documents.append(chunks)
+    return documents
+
+def make_queries(count: int, vocabulary: list[str], rng: random.Random) -> dict[str, list[str]]:
+    common, rare = vocabulary[:200], vocabulary[200:]
+    return {
+        "one_term": [rng.choice(rare) for _ in range(count)],
+        "three_terms": [" ".join([rng.choice(common), *rng.sample(rare, 2)]) for _ in range(count)],
+        "common_terms": [" ".join(rng.sample(common, 3)) for _ in range(count)],
+        "quoted": [f'"{rng.choice(rare)}" {rng.choice(common)}' for _ in range(count)],
+    }
+
+def percentiles(latencies: list[float]) -> dict:
+    values = np.array(latencies) * 1000
+    return {f"p{q}_ms": round(float(np.percentile(values, q)), 3) for q in (50, 95, 99)}
+
+def main() -> None:
+    from lexical_index import LexicalIndex, SegmentWriter
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--chunks-per-document", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500, help="per query kind")
+    parser.add_argument("--delete", type=float, default=0.01, help="share of the documents deleted")
+    parser.add_argument("--max-segments", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    documents = make_chunks(args.chunks, args.chunks_per_document, vocabulary, args.seed)
+    queries = make_queries(args.queries, vocabulary, rng)
+    directory = Path(tempfile.mkdtemp(prefix="lexical-index-"))
+
+    try:
+        index = LexicalIndex(directory, max_segments=args.max_segments)
+        start = time.perf_counter()
+        for chunks in documents:
+            segment = SegmentWriter()
+            for chunk in chunks:
+                segment.add(chunk)
+            index.commit(segment)
+        build_seconds = time.perf_counter() - start
+
+        deleted = rng.sample(documents, int(len(documents) * args.delete))
+        start = time.perf_counter()
+        for chunks in deleted:
+            index.commit(delete_filenames=[chunks[0]["filename"]])
+        delete_seconds = time.perf_counter() - start
+
+        size = sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
+        results = {
+            "chunks": args.chunks,
+            "documents": len(documents),
+            "segments": len(json.loads((directory / LexicalIndex.MANIFEST).read_text())["segments"]),
+            "build_seconds": round(build_seconds, 2),
+            "chunks_per_second": round(args.chunks / build_seconds, 1),
+            "delete_ms_per_document": round(delete_seconds / max(len(deleted), 1) * 1000, 2),
+            "index_mb": round(size / 1024 ** 2, 1),
+            "bytes_per_chunk": round(size / args.chunks),
+        }
+
+        # the first search opens the segments
+        index.search(queries["one_term"][0])
+        for kind, texts in queries.items():
+            latencies = []
+            hits = 0
+            for text in texts:
+                start = time.perf_counter()
+                hits += len(index.search(text))
+                latencies.append(time.perf_counter() - start)
+            results[kind] = percentiles(latencies) | {"mean_hits": round(hits / len(texts), 1)}
+
+        print(json.dumps(results, indent=4))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+In-process stand-ins for the db-service and the auth service, so the benchmarks run
+offline. Uploaded documents are counted and dropped, every token is accepted. Bulk
+uploads are read as JSON or NDJSON, plain, gzip or zstd compressed (zstd needs the
+zstandard package), and the bytes received are counted; --legacy answers 415 to anything
+but plain JSON, like a db-service that predates the NDJSON format.
+
+    python benchmarks/stub_services.py --port 5700
+"""
+import argparse
+import json
+import os
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while size := int(self.rfile.readline().split(b";", 1)[0], 16):
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            # trailers, up to the empty line
+            while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return b"".join(parts)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self, body: bytes) -> dict:
+        encoding = self.headers.get("Content-Encoding", "identity")
+        if encoding == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == "zstd":
+            import zstandard
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+        if self.headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            # {"id"} first, then documents, and {"tables"} before the documents that use them
+            lines = [json.loads(line) for line in body.splitlines() if line]
+            content = [line for line in lines[1:] if "tables" not in line]
+            return lines[0] | {"content": content} if lines else {}
+        return json.loads(body) if body else {}
+
+    def _send_json(self, payload, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self) -> None:
+        stubs = self.server.stubs
+        path = self.path.split("?", 1)[0]
+        raw = self._read_body()
+
+        with stubs.lock:
+            stubs.requests[path] = stubs.requests.get(path, 0) + 1
+            stubs.bytes_received += len(raw)
+
+        plain_json = (
+            self.headers.get("Content-Type", "application/json").startswith("application/json")
+            and self.headers.get("Content-Encoding", "identity") == "identity"
+        )
+        if stubs.legacy and not plain_json:
+            return self._send_json({"error": "unsupported media type"}, 415)
+        body = self._read_json(raw)
+
+        if path.endswith("/management/userinfo"):
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self._send_json({"error": "unauthorized"}, 401)
+            return self._send_json({"username": stubs.username, "email": f"{stubs.username}@example.com"})
+
+        if path.endswith("/db-service/upload"):
+            content = body.get("content") or []
+            with stubs.lock:
+                stubs.documents_uploaded += len(content)
+            return self._send_json({"uploaded": len(content), "errors": False})
+
+        if path.endswith("/db-service/get-chunk-ids"):
+            return self._send_json({"ids": []})
+
+        if path.endswith("/db-service/delete-chunks"):
+            return self._send_json({"deleted": len(body.get("ids") or [])})
+
+        if path.endswith("/db-service/search"):
+            return self._send_json([])
+
+        if path.endswith("/db-service/delete"):
+            return self._send_json({"deleted": 0})
+
+        if path.endswith("/db-service/get-documents"):
+            return self._send_json({"documents": []})
+
+        self._send_json({"error": "not found"}, 404)
+
+class StubServices:
+    """
+    Both services on one local port, served from a background thread.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, username: str = "benchmark", legacy: bool = False) -> None:
+        self.username = username
+        self.legacy = legacy
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.documents_uploaded = 0
+        self.bytes_received = 0
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stubs = self
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def configure_env(self) -> None:
+        """
+        Point the service clients at the stubs. Must run before app.http_client is imported.
+        """
+        os.environ["DB_HOST"] = os.environ["AUTH_HOST"] = self.host
+        os.environ["DB_PORT"] = os.environ["AUTH_PORT"] = str(self.port)
+
+    def start(self) -> "StubServices":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServices":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5700)
+    parser.add_argument("--legacy", action="store_true", help="accept plain JSON request bodies only")
+    args = parser.parse_args()
+
+    stubs = StubServices(args.host, args.port, legacy=args.legacy)
+    print(f"Stub db-service and auth service listening on http://{stubs.host}:{stubs.port}")
+    try:
+        stubs._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Compare the table processing of PdfProcessor (TableModel, the HTML is parsed once) with
+the previous BeautifulSoup -> prettify -> pandas.read_html path, on synthetic tables
+shaped like the ones unstructured extracts from financial reports.
+
+    python benchmarks/table_processing.py --tables 200 --rows 30 --cols 6
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from io import StringIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from table_model import TableModel
+
+EMAIL_REGEX = r"[\w\.-]+@[\w\.-]+\.[a-zA-Z]{2,}"
+
+def make_table(rows: int, cols: int, rng: random.Random) -> tuple[str, str]:
+    """
+    HTML of a table and its element text, with the artifacts the cleanup deals with:
+    ' L ' separated cells, stray pipes and an email address read with '(' instead of '@'.
+    """
+    header = "".join(f"<th>Indicator {col}</th>" for col in range(cols))
+    body = []
+    for row in range(rows):
+        cells = []
+        for col in range(cols):
+            value = f"{rng.uniform(-1e6, 1e6):,.2f}"
+            if rng.random() < 0.1:
+                value = f"L {value} L {rng.randint(1, 999)}"
+            elif rng.random() < 0.1:
+                value = f"{value} | {rng.randint(1, 99)}%"
+            cells.append(f"<td>{value}</td>")
+        body.append("<tr>" + "".join(cells) + "</tr>")
+    body.append(f"<tr><td>Contact</td><td colspan=\"{cols - 1}\">investors(xcompany.ro</td></tr>")
+
+    html = f"<table><thead><tr>{header}</tr></thead><tbody>{''.join(body)}</tbody></table>"
+    text = "Contact investors@company.ro"
+
+    return html, text
+
+# ── previous implementation ──────────────────────────────────────────────────
+def legacy_process(html: str, text: str) -> tuple[str, str]:
+    from bs4 import BeautifulSoup
+
+    html = legacy_fix_table_cell_text(html)
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup.find_all(["td", "th"]):
+        element.string = re.sub(r"\|+", " ", element.get_text(strip=True))
+    cleaned_html = soup.prettify()
+
+    for email_address in re.findall(EMAIL_REGEX, text):
+        index = email_address.find("@") + 1
+        domain = email_address[index:]
+        cleaned_html = re.sub(r"\([\w\.-]+{}".format(domain), f"@{domain}", cleaned_html, count=1)
+
+    # _get_table_string and _format_table_text each parsed the HTML with pandas
+    df = legacy_convert_table_to_dataframe(cleaned_html)
+    table_string = ' ; '.join(df.columns.astype(str).values.flatten())
+    table_string += ' ; '.join(df.astype(str).values.flatten())
+
+    markdown = legacy_convert_table_to_dataframe(cleaned_html).to_markdown(index=False)
+    markdown = re.sub(r' +', ' ', markdown)
+    markdown = re.sub(r'\|:[-]{3,}', '|:--', markdown)
+
+    return table_string, markdown
+
+def legacy_fix_table_cell_text(html: str, delimiter: str = " L ") -> str:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    rows = soup.find_all("tr")
+    for row_idx, row in enumerate(rows[:-1]):
+        cells = row.find_all("td")
+        next_row_cells = rows[row_idx + 1].find_all("td")
+        for col_idx, cell in enumerate(cells):
+            if not cell.string:
+                continue
+            cell.string = re.sub(r'^L ', '', cell.string)
+            if delimiter in cell.string:
+                parts = cell.string.rsplit(delimiter)
+                cell.string = parts[0].strip()
+                if col_idx < len(next_row_cells) and next_row_cells[col_idx].string:
+                    next_row_cells[col_idx].string = parts[1].strip() + " " + next_row_cells[col_idx].string
+
+    return str(soup)
+
+def legacy_convert_table_to_dataframe(html: str):
+    import pandas as pd
+
+    df = pd.read_html(StringIO(html), encoding='utf-8')[0]
+    df.columns = ['' if "Unnamed" in str(col) else str(col) for col in df.columns]
+    return df.fillna('')
+
+# ── current implementation ───────────────────────────────────────────────────
+def model_process(html: str, text: str) -> tuple[str, str]:
+    model = TableModel.from_html(html)
+    model.fix_cell_text()
+    model.clean_cells()
+    model.fix_emails(text)
+
+    return model.to_text(), model.to_markdown()
+
+def run(process, tables: list[tuple[str, str]], repeat: int) -> dict:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html, text in tables:
+            process(html, text)
+        best = min(best, time.perf_counter() - start)
+
+    return {
+        "seconds": round(best, 4),
+        "tables_per_second": round(len(tables) / best, 1),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=30)
+    parser.add_argument("--cols", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tables = [make_table(args.rows, args.cols, rng) for _ in range(args.tables)]
+
+    results = {"tables": args.tables, "rows": args.rows, "cols": args.cols}
+    results["table_model"] = run(model_process, tables, args.repeat)
+    try:
+        results["legacy"] = run(legacy_process, tables, args.repeat)
+        results["speedup"] = round(results["legacy"]["seconds"] / results["table_model"]["seconds"], 1)
+    except ImportError as e:
+        results["legacy"] = f"skipped: {e}"
+
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
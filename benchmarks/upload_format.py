@@ -0,0 +1,86 @@
+"""
+End-to-end bulk upload benchmark: the chunks of a synthetic document (see chunk_payload.py)
+uploaded with db_client.db_upload_stream to the stub db-service (see stub_services.py), in
+every wire format - the original JSON requests, NDJSON plain, gzip and zstd compressed -
+with the stdlib json encoder and orjson where installed. Reports the wall time, the bytes
+sent over the wire and the bytes before compression, as JSON. The stub decodes and parses
+every request, so its share of the time is included.
+
+    python benchmarks/upload_format.py --text-chunks 2000 --tables 50 --repeat 3
+    python benchmarks/upload_format.py --shared-tables
+
+Also checks the fallback: against a --legacy stub NDJSON is rejected and JSON is sent.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+from chunk_payload import build_chunks, make_document
+from stub_services import StubServices
+
+def upload(stubs: StubServices, documents: list, batch_size: int, repeat: int) -> dict:
+    from app.db_client import db_upload_stream
+
+    seconds = []
+    for _ in range(repeat):
+        stubs.documents_uploaded = stubs.bytes_received = 0
+        start = time.perf_counter()
+        if db_upload_stream("benchmark", documents, batch_size=batch_size, retries=0) is None:
+            raise RuntimeError("Upload to the stub db-service failed")
+        seconds.append(time.perf_counter() - start)
+        if stubs.documents_uploaded != len(documents):
+            raise RuntimeError(f"The stub received {stubs.documents_uploaded} of {len(documents)} documents")
+
+    return {"best_seconds": round(min(seconds), 3), "wire_mb": round(stubs.bytes_received / 1024 ** 2, 2)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-chunks", type=int, default=2000)
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--table-rows", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--shared-tables", action="store_true", help="send every table text once per request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ["DB_UPLOAD_SHARED_TABLES"] = "true" if args.shared_tables else "false"
+    _, documents = build_chunks(make_document(args.text_chunks, args.tables, args.table_rows, args.seed), "benchmark")
+
+    results = {"chunks": len(documents), "shared_tables": args.shared_tables, "formats": {}}
+    with StubServices() as stubs:
+        stubs.configure_env()
+        from app import bulk_format
+
+        encoders = {"json": None, "orjson": bulk_format.orjson}
+        combinations = [(bulk_format.JSON, bulk_format.IDENTITY)] + [
+            (bulk_format.NDJSON, compression) for compression in bulk_format.COMPRESSIONS
+            if compression != bulk_format.ZSTD or bulk_format.zstandard is not None
+        ]
+        for format, compression in combinations:
+            for encoder, module in encoders.items():
+                if encoder == "orjson" and module is None:
+                    continue
+                bulk_format.orjson = module
+                bulk_format.set_negotiator(bulk_format.Negotiator(format, compression))
+                name = f"{format}+{encoder}" if format == bulk_format.JSON else f"{format}+{compression}+{encoder}"
+                results["formats"][name] = upload(stubs, documents, args.batch_size, args.repeat)
+        bulk_format.orjson = encoders["orjson"]
+
+        # a db-service that only reads JSON: one rejected request, then JSON
+        stubs.legacy = True
+        negotiator = bulk_format.Negotiator(bulk_format.NDJSON)
+        bulk_format.set_negotiator(negotiator)
+        upload(stubs, documents, args.batch_size, 1)
+        results["legacy_fallback"] = "/".join(negotiator.current())
+
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
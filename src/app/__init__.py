@@ -3,14 +3,15 @@ import os
 from dotenv import load_dotenv
 import time
 from flask import request, Response
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-from app import metrics
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+from app import metrics, tracing
+from app.uploads import UploadRequest
 
 load_dotenv()
 
 def create_app(config_filename=None):
     app = Flask(__name__)
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB, adjust as needed
+    app.request_class = UploadRequest
 
     # Load configuration
     if config_filename:
@@ -18,6 +19,17 @@ def create_app(config_filename=None):
     else:
         app.config.from_object('config.Config')
 
+    # Load the NLP models once, before serving any upload - with a dedicated ingestion
+    # runner the web workers never use them, the runner loads them (see app.ingestion_runner)
+    if app.config.get('PRELOAD_MODELS') and app.config.get('INGESTION_RUNNER') != 'process':
+        from model_registry import registry
+        registry.warmup()
+
+    # Resume ingestion jobs left over from a previous run (prefork servers do it per worker)
+    if os.environ.get('DEFER_JOB_RECOVERY', 'false').lower() != 'true':
+        from app.jobs import job_queue
+        job_queue.start()
+
     # Import and register blueprint from routes
     from app.routes import main_bp
     app.register_blueprint(main_bp, url_prefix=os.environ.get('PREFIX'))
@@ -25,28 +37,46 @@ def create_app(config_filename=None):
     @app.before_request
     def _start_timer():
         request._start_time = time.perf_counter()      # high-res timer
+        request._span, request._span_token = tracing.start_span(
+            f"{request.method} {request.url_rule or request.path}",
+            carrier=request.headers,
+            http__method=request.method,
+            http__request_content_length=request.content_length,
+        )
 
     @app.after_request
     def _record_metrics(response):
         elapsed = time.perf_counter() - getattr(request, "_start_time", 0)
         endpoint = request.endpoint or "unknown"
 
-        metrics.HTTP_REQUESTS_TOTAL.labels(
-            method=request.method,
-            endpoint=endpoint,
-            http_status=response.status_code,
-        ).inc()
-
-        metrics.HTTP_REQUEST_LATENCY.labels(
-            method=request.method,
-            endpoint=endpoint,
-        ).observe(elapsed)
+        metrics.observe_request(request.method, endpoint, response.status_code, elapsed)
+        tracing.set_attributes(
+            getattr(request, "_span", tracing.NOOP_SPAN),
+            http__status_code=response.status_code,
+            http__response_content_length=response.content_length,
+        )
 
         return response
 
+    @app.teardown_request
+    def _discard_uploads(exc):
+        # uploaded files the view did not hand over to a job
+        request.discard_uploads()
+
+    @app.teardown_request
+    def _end_span(exc):
+        if hasattr(request, "_span"):
+            tracing.end_span(request._span, request._span_token, exc)
+
     @app.route("/metrics")
     def prometheus_metrics():
         """Prometheus scrape target"""
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            # aggregate the metrics of all worker processes
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
         return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
     return app
\ No newline at end of file
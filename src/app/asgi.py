@@ -0,0 +1,67 @@
+import os
+import time
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, request
+from app import create_app, metrics, tracing
+from app.async_clients import close_clients
+
+def create_asgi_app(config_filename=None):
+    """
+    ASGI application serving the I/O-bound endpoints (/search, /delete, /get-documents,
+    /profile) as coroutines, so a single worker can wait on thousands of upstream calls.
+    Every other route (uploads, jobs, the UI, /metrics) is served by the regular Flask app,
+    run in a thread pool.
+    """
+    flask_app = create_app(config_filename)
+    wsgi_app = WsgiToAsgi(flask_app)
+
+    from app.async_routes import async_bp
+    async_app = Quart(__name__)
+    async_app.config.from_mapping(flask_app.config)
+    prefix = os.environ.get('PREFIX')
+    async_app.register_blueprint(async_bp, url_prefix=prefix)
+
+    @async_app.before_request
+    async def _start_timer():
+        request._start_time = time.perf_counter()
+        request._span, request._span_token = tracing.start_span(
+            f"{request.method} {request.url_rule or request.path}",
+            carrier=request.headers,
+            http__method=request.method,
+            http__request_content_length=request.content_length,
+        )
+
+    @async_app.after_request
+    async def _record_metrics(response):
+        elapsed = time.perf_counter() - getattr(request, "_start_time", 0)
+        endpoint = request.endpoint or "unknown"
+
+        metrics.observe_request(request.method, endpoint, response.status_code, elapsed)
+        tracing.set_attributes(getattr(request, "_span", tracing.NOOP_SPAN), http__status_code=response.status_code)
+
+        return response
+
+    @async_app.teardown_request
+    async def _end_span(exc):
+        if hasattr(request, "_span"):
+            tracing.end_span(request._span, request._span_token, exc)
+
+    @async_app.after_serving
+    async def _close_clients():
+        await close_clients()
+
+    async_paths = {
+        rule.rule
+        for rule in async_app.url_map.iter_rules()
+        if rule.endpoint.startswith(f"{async_bp.name}.")
+    }
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan" or (scope["type"] == "http" and scope["path"] in async_paths):
+            await async_app(scope, receive, send)
+        else:
+            await wsgi_app(scope, receive, send)
+
+    return app
+
+app = create_asgi_app()
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import random
+import time
+import httpx
+from config import Config
+from app import metrics, tracing
+from app.auth_client import REJECTED_STATUSES, get_cache_key, lookup_cached, store_cached
+from app.http_client import IDEMPOTENT_METHODS, RETRY_STATUSES
+from app.ttl_cache import MISSING, AsyncSingleFlight
+import app.logger as logger
+
+class AsyncUpstreamClient:
+    """
+    Non-blocking counterpart of http_client.UpstreamClient, for the ASGI serving path.
+    Same pooling, timeouts, retry policy and metrics; the httpx client is created lazily
+    on the running event loop.
+    """
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        pool_size: int | None = None,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        retries: int | None = None,
+        backoff: float | None = None,
+    ) -> None:
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.timeout = httpx.Timeout(
+            read_timeout or Config.HTTP_READ_TIMEOUT,
+            connect=connect_timeout or Config.HTTP_CONNECT_TIMEOUT,
+        )
+        self.retries = Config.HTTP_RETRIES if retries is None else retries
+        self.backoff = Config.HTTP_BACKOFF if backoff is None else backoff
+        self._inflight = 0
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                # like requests, so both serving paths see the same final response
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+            metrics.UPSTREAM_POOL_SIZE.labels(upstream=self.name).set(self.pool_size)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, endpoint: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", endpoint, **kwargs)
+
+    async def post(self, endpoint: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", endpoint, **kwargs)
+
+    async def request(self, method: str, endpoint: str, idempotent: bool | None = None, **kwargs) -> httpx.Response:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        retries = self.retries if idempotent else 0
+
+        for attempt in range(retries + 1):
+            try:
+                response = await self._send(method, endpoint, **kwargs)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                if attempt == retries:
+                    raise
+                logger.warning("%s %s failed (%s), retrying", method, endpoint, e)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                logger.warning("%s %s answered %s, retrying", method, endpoint, response.status_code)
+
+            metrics.UPSTREAM_RETRIES_TOTAL.labels(upstream=self.name).inc()
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    async def _send(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        client = self._get_client()
+        self._inflight += 1
+        metrics.UPSTREAM_INFLIGHT_REQUESTS.labels(upstream=self.name).inc()
+        if self._inflight > self.pool_size:
+            # waiting for a free connection from the pool
+            metrics.UPSTREAM_POOL_OVERFLOW_TOTAL.labels(upstream=self.name).inc()
+
+        start = time.perf_counter()
+        status = "error"
+        with tracing.span(f"{self.name} {method} {endpoint}", upstream=self.name, http__method=method) as span:
+            try:
+                response = await client.request(method, f"/{endpoint}", **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                self._inflight -= 1
+                metrics.UPSTREAM_INFLIGHT_REQUESTS.labels(upstream=self.name).dec()
+                metrics.UPSTREAM_REQUEST_LATENCY.labels(
+                    upstream=self.name, endpoint=endpoint, http_status=status
+                ).observe(time.perf_counter() - start)
+                span.set_attribute("http.status_code", status)
+
+db = AsyncUpstreamClient(
+    "db",
+    f"http://{os.environ.get('DB_HOST', 'localhost')}:{os.environ.get('DB_PORT', '5700')}",
+    read_timeout=Config.DB_READ_TIMEOUT,
+)
+auth = AsyncUpstreamClient(
+    "auth",
+    f"http://{os.environ.get('AUTH_HOST', 'localhost')}:{os.environ.get('AUTH_PORT', '3000')}",
+)
+
+_userinfo_flight = AsyncSingleFlight()
+
+async def close_clients() -> None:
+    await db.aclose()
+    await auth.aclose()
+
+def _ok(response: httpx.Response) -> bool:
+    """
+    Success as the sync clients see it (bool of a requests.Response): any status below 400.
+    """
+    return not response.is_error
+
+# ── auth service ──────────────────────────────────────────────────────────────
+async def fetch_userinfo(token):
+    headers = {
+        'Authorization': f'Bearer {token}'
+    }
+    try:
+        response = await auth.get("management/userinfo", headers=headers)
+    except httpx.HTTPError as e:
+        logger.error("HTTPError occurred while contacting the auth service: %s", e)
+        return None, False
+
+    if response.status_code != 200:
+        logger.warning("Request to get user info failed with status code: %s", response.status_code)
+        return None, response.status_code in REJECTED_STATUSES
+
+    return response.json(), False
+
+async def get_userinfo(token):
+    user_info, _ = await fetch_userinfo(token)
+    return user_info
+
+async def get_userinfo_cached(token):
+    """
+    Same cache as auth_client.get_userinfo_cached, shared with the WSGI routes.
+    """
+    key = get_cache_key(token)
+
+    cached = lookup_cached(key)
+    if cached is not MISSING:
+        return cached
+
+    async def lookup():
+        user_info, rejected = await fetch_userinfo(token)
+        store_cached(key, token, user_info, rejected)
+        return user_info
+
+    return await _userinfo_flight.do(key, lookup)
+
+# ── db service ────────────────────────────────────────────────────────────────
+async def db_delete(id: str, filename: str):
+    body = {
+        "id": id,
+        "filename": filename
+    }
+
+    response = await db.get("db-service/delete", json=body)
+    if _ok(response):
+        return response.json()
+
+    return None
+
+async def db_search(id: str, query: str, timeout: float | None = None):
+    body = {
+        "id": id,
+        "query": query
+    }
+
+    # with a deadline (the local index answers otherwise): a shorter read timeout, no retries
+    kwargs = {"timeout": httpx.Timeout(timeout, connect=Config.HTTP_CONNECT_TIMEOUT), "idempotent": False} if timeout else {}
+    response = await db.get("db-service/search", json=body, **kwargs)
+    logger.info(response.status_code)
+    if _ok(response):
+        return response.json()
+
+    return None
+
+async def db_get_documents(id: str):
+    body = {
+        "id": id,
+    }
+
+    response = await db.get("db-service/get-documents", json=body)
+    if _ok(response):
+        return response.json()["documents"]
+
+    return None
@@ -0,0 +1,100 @@
+import asyncio
+from functools import wraps
+from quart import Blueprint, request, jsonify, g
+from config import Config
+from app import metrics
+from app.async_clients import db_delete, db_get_documents, db_search, get_userinfo, get_userinfo_cached
+from app.local_search import search_async as search_chunks
+from app.search_cache import invalidate_user
+from dedup import forget_document
+from lexical_index import remove_document
+import app.logger as logger
+import json
+
+# same blueprint name as the WSGI routes, so the endpoint labels of the metrics match
+async_bp = Blueprint('main', __name__)
+
+def async_auth_route(f):
+    """
+    auth_route for coroutine views: the token lookup does not block the event loop.
+    """
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            logger.warning("Missing Authorization header in the request")
+            return jsonify({"error": "Missing Authorization header"}), 400
+
+        if not auth_header.startswith('Bearer '):
+            logger.warning("Invalid Authorization header format")
+            return jsonify({"error": "Invalid Authorization header format"}), 400
+
+        token = auth_header.split(' ')[1]
+
+        if Config.AUTH_CACHE_TTL > 0:
+            user_credentials = await get_userinfo_cached(token)
+        else:
+            user_credentials = await get_userinfo(token)
+        if not user_credentials:
+            logger.error("Failed to retrieve user credentials")
+            return jsonify({"error": "Failed to retrieve user credentials"}), 403
+
+        g.user = user_credentials
+        return await f(*args, **kwargs)
+    return decorated_function
+
+@async_bp.route('/delete', methods=['POST'])
+@async_auth_route
+async def delete():
+    id = g.user.get('username', 'User')
+    filename = (await request.form).get('filename')
+
+    if not filename:
+        return "No filename provided", 400
+
+    response = await db_delete(id, filename)
+    if response:
+        await asyncio.to_thread(invalidate_user, id)
+        await asyncio.to_thread(forget_document, id, filename)
+        await asyncio.to_thread(remove_document, id, filename)
+
+    metrics.PDF_DELETE_TOTAL.labels(
+        status="success" if response else "error"
+    ).inc()
+
+    logger.info(json.dumps(response, indent=4))
+
+    return jsonify({"content": response}), 200
+
+@async_bp.route('/search', methods=['POST'])
+@async_auth_route
+async def search():
+    id = g.user.get('username', 'User')
+    query = (await request.form).get('query')
+
+    response = await search_chunks(id, query, db_search)
+
+    metrics.SEARCH_TOTAL.labels(
+        status="success" if response else "error"
+    ).inc()
+
+    return jsonify({"content": response}), 200
+
+@async_bp.route('/get-documents', methods=['GET'])
+@async_auth_route
+async def get_documents():
+    id = g.user.get('username', 'User')
+
+    response = await db_get_documents(id)
+
+    if not response:
+        return jsonify({"documents": []}), 200
+
+    return jsonify(response), 200
+
+@async_bp.route('/profile', methods=['GET'])
+@async_auth_route
+async def get_profile():
+    id = g.user.get('username', 'User')
+
+    return jsonify({ "username": id }), 200
@@ -1,30 +1,106 @@
 import requests
 import os
+import base64
+import hashlib
+import json
+import time
 import app.logger as logger
+from config import Config
+from app import metrics
+from app.http_client import auth
+from app.ttl_cache import MISSING, SingleFlight, TTLCache
 
-AUTH_HOST = os.environ.get('AUTH_HOST', 'localhost')
-AUTH_PORT = os.environ.get('AUTH_PORT', '3000')
+# answers of the auth service meaning "this token is not valid"
+REJECTED_STATUSES = (401, 403)
+REJECTED = object()
+
+_userinfo_cache = TTLCache(maxsize=Config.AUTH_CACHE_SIZE, ttl=Config.AUTH_CACHE_TTL)
+_userinfo_flight = SingleFlight()
 
 def build_url(endpoint):
-    return f'http://{AUTH_HOST}:{AUTH_PORT}/{endpoint}'
+    return auth.build_url(endpoint)
 
 def get_userinfo(token):
+    user_info, _ = fetch_userinfo(token)
+    return user_info
+
+def fetch_userinfo(token):
+    """
+    Ask the auth service for the user behind a token.
+    Returns the user info (None on failure) and whether the token was explicitly rejected.
+    """
     headers = {
         'Authorization': f'Bearer {token}'
     }
     url = build_url("management/userinfo")
     logger.info("Sending request to get user info from %s", url)
     try:
-        response = requests.get(url, headers=headers)
+        response = auth.get("management/userinfo", headers=headers)
         logger.debug("Received response with status code: %s", response.status_code)
     except requests.exceptions.RequestException as e:
         logger.error("RequestException occurred while contacting %s: %s", url, e)
-        return None
+        return None, False
 
     if response.status_code != 200:
         logger.warning("Request to %s failed with status code: %s", url, response.status_code)
-        return None
+        return None, response.status_code in REJECTED_STATUSES
 
     user_info = response.json()
     logger.info("Successfully retrieved user info: %s", user_info)
-    return user_info
+    return user_info, False
+
+def get_userinfo_cached(token):
+    """
+    get_userinfo backed by an in-process TTL cache keyed by the token hash. Rejected tokens
+    are cached for AUTH_NEGATIVE_CACHE_TTL, failures to reach the auth service are not cached.
+    Concurrent lookups of the same token share a single request.
+    """
+    key = get_cache_key(token)
+
+    cached = lookup_cached(key)
+    if cached is not MISSING:
+        return cached
+
+    def lookup():
+        user_info, rejected = fetch_userinfo(token)
+        store_cached(key, token, user_info, rejected)
+        return user_info
+
+    return _userinfo_flight.do(key, lookup)
+
+def get_cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def lookup_cached(key):
+    """
+    The cached user info (None for a rejected token), MISSING if the token is not cached.
+    """
+    cached = _userinfo_cache.get(key)
+    if cached is REJECTED:
+        metrics.AUTH_CACHE_TOTAL.labels(result="negative_hit").inc()
+        return None
+    if cached is not MISSING:
+        metrics.AUTH_CACHE_TOTAL.labels(result="hit").inc()
+        return cached
+
+    metrics.AUTH_CACHE_TOTAL.labels(result="miss").inc()
+    return MISSING
+
+def store_cached(key, token, user_info, rejected):
+    if user_info is not None:
+        _userinfo_cache.set(key, user_info, ttl=_get_ttl(token))
+    elif rejected:
+        _userinfo_cache.set(key, REJECTED, ttl=Config.AUTH_NEGATIVE_CACHE_TTL)
+
+    metrics.AUTH_CACHE_ENTRIES.set(len(_userinfo_cache))
+
+def _get_ttl(token):
+    """
+    Never keep a token cached past its own expiry (exp claim of a JWT, if there is one).
+    """
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return max(min(Config.AUTH_CACHE_TTL, float(claims['exp']) - time.time()), 0)
+    except (IndexError, KeyError, TypeError, ValueError):
+        return Config.AUTH_CACHE_TTL
@@ -0,0 +1,188 @@
+import json
+import threading
+import zlib
+from typing import Any, Iterator
+from config import Config
+from chunk_model import Chunk, share_tables, to_json
+import app.logger as logger
+
+try:
+    import orjson
+except ImportError:  # the standard json encoder is used instead
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is skipped
+    zstandard = None
+
+# one JSON document {"id", "content": [...]}, the original format
+JSON = "json"
+# a header line {"id"}, then one line per document
+NDJSON = "ndjson"
+FORMATS = (JSON, NDJSON)
+
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+COMPRESSIONS = (IDENTITY, GZIP, ZSTD)
+
+CONTENT_TYPES = {JSON: "application/json", NDJSON: "application/x-ndjson"}
+
+# answer of a db-service that does not understand a format or compression - a 400 or 422
+# is a bad document and must not switch the whole process back to JSON
+UNSUPPORTED_STATUSES = frozenset([415])
+
+# compressed bytes are sent in pieces of at least this size (chunked transfer encoding)
+PIECE_BYTES = 64 * 1024
+
+def dumps(value: Any, fast: bool = True) -> bytes:
+    """
+    Compact UTF-8 JSON of a value, chunks expanded on the way - with orjson if installed.
+    """
+    if fast and orjson is not None:
+        return orjson.dumps(value, default=to_json)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False, default=to_json).encode("utf-8")
+
+def _compressor(compression: str, level: int | None):
+    if compression == GZIP:
+        return zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == ZSTD:
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compressobj()
+    return None
+
+class NdjsonBody:
+    """
+    Request body of a bulk upload in NDJSON, encoded and compressed line by line while it
+    is sent, so the whole body never exists at once. Iterating again (a retried request)
+    encodes it again. With shared_tables the table texts are sent as {"tables": {...}}
+    lines before the first document of each table, instead of with every document.
+    Counts the bytes before and after compression.
+    """
+    def __init__(
+        self,
+        id: str,
+        documents: list,
+        compression: str = IDENTITY,
+        level: int | None = None,
+        shared_tables: bool = False,
+        fast: bool = True,
+    ) -> None:
+        self.id = id
+        self.documents = documents
+        self.compression = compression
+        self.level = level
+        self.shared_tables = shared_tables
+        self.fast = fast
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def _lines(self) -> Iterator[bytes]:
+        yield dumps({"id": self.id}, self.fast)
+        tables_sent = set()
+        for document in self.documents:
+            if not self.shared_tables:
+                yield dumps(document, self.fast)
+                continue
+
+            data = document.to_dict() if isinstance(document, Chunk) else dict(document)
+            table_id, table_text = data.get("table_id"), data.pop("table_text", None)
+            if table_id is not None and table_text is not None and table_id not in tables_sent:
+                tables_sent.add(table_id)
+                yield dumps({"tables": {table_id: table_text}}, self.fast)
+            yield dumps(data, self.fast)
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.raw_bytes = self.wire_bytes = 0
+        compressor = _compressor(self.compression, self.level)
+        pending = []
+        pending_bytes = 0
+
+        for line in self._lines():
+            line += b"\n"
+            self.raw_bytes += len(line)
+            data = compressor.compress(line) if compressor else line
+            if data:
+                pending.append(data)
+                pending_bytes += len(data)
+            if pending_bytes >= PIECE_BYTES:
+                yield self._piece(pending)
+                pending, pending_bytes = [], 0
+
+        if compressor:
+            pending.append(compressor.flush())
+        if pending:
+            yield self._piece(pending)
+
+    def _piece(self, parts: list[bytes]) -> bytes:
+        piece = b"".join(parts)
+        self.wire_bytes += len(piece)
+        return piece
+
+def encode_json(id: str, documents: list, shared_tables: bool = False, fast: bool = True) -> bytes:
+    """
+    The original request body: one JSON document, chunks expanded while it is serialized
+    (with orjson if installed, like the NDJSON lines).
+    """
+    body = {"id": id, "content": documents}
+    if shared_tables:
+        # each table text once per request instead of once per chunk of the table
+        body["content"], body["tables"] = share_tables(documents)
+    return dumps(body, fast)
+
+class Negotiator:
+    """
+    The upload formats to try, best first: NDJSON with the configured compression (zstd
+    falls back to gzip without the zstandard package), NDJSON uncompressed, then JSON.
+    A combination the db-service rejects is not tried again by this process.
+    """
+    def __init__(self, format: str | None = None, compression: str | None = None) -> None:
+        format = format or Config.DB_UPLOAD_FORMAT
+        compression = compression or Config.DB_UPLOAD_COMPRESSION
+        if format not in FORMATS:
+            raise ValueError(f"Unknown upload format {format!r}, expected one of {FORMATS}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown upload compression {compression!r}, expected one of {COMPRESSIONS}")
+
+        if compression == ZSTD and zstandard is None:
+            compression = GZIP
+        candidates = []
+        if format == NDJSON:
+            candidates = [(NDJSON, compression), (NDJSON, IDENTITY)]
+        candidates.append((JSON, IDENTITY))
+        # unique, in order
+        self._candidates = list(dict.fromkeys(candidates))
+        self._lock = threading.Lock()
+
+    def current(self) -> tuple[str, str]:
+        with self._lock:
+            return self._candidates[0]
+
+    def reject(self, format: str, compression: str, status: int) -> bool:
+        """
+        Drop a rejected combination. False if it was the last one (JSON), nothing else to try.
+        """
+        with self._lock:
+            if (format, compression) not in self._candidates or len(self._candidates) == 1:
+                return False
+            self._candidates.remove((format, compression))
+            logger.warning(
+                "db-service answered %s to %s uploads (%s), falling back to %s",
+                status, format, compression, "/".join(self._candidates[0]),
+            )
+            return True
+
+_negotiator = None
+
+def get_negotiator() -> Negotiator:
+    global _negotiator
+    if _negotiator is None:
+        _negotiator = Negotiator()
+    return _negotiator
+
+def set_negotiator(negotiator: Negotiator | None) -> None:
+    """
+    Start the negotiation again (e.g. with other preferences).
+    """
+    global _negotiator
+    _negotiator = negotiator
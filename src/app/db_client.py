@@ -1,51 +1,143 @@
 import requests
 import os
+import time
+from itertools import islice
+from typing import Iterable
 from flask import g
+from config import Config
+from app import metrics
+from app.bulk_format import CONTENT_TYPES, IDENTITY, NDJSON, UNSUPPORTED_STATUSES, NdjsonBody, encode_json, get_negotiator
 import app.logger as logger
-
-DB_HOST = os.environ.get('DB_HOST', 'localhost')
-DB_PORT = os.environ.get('DB_PORT', '5700')
+from app.http_client import db
 
 def build_url(endpoint):
-    return f'http://{DB_HOST}:{DB_PORT}/{endpoint}'
+    return db.build_url(endpoint)
 
 def db_upload(id, content):
-    url = build_url("db-service/upload")
-
+    negotiator = get_negotiator()
+    while True:
+        format, compression = negotiator.current()
+        headers = {"Content-Type": CONTENT_TYPES[format]}
+        if format == NDJSON:
+            # encoded and compressed while it is sent, the chunks are expanded line by line
+            data = NdjsonBody(
+                id, content, compression, Config.DB_UPLOAD_COMPRESSION_LEVEL, Config.DB_UPLOAD_SHARED_TABLES
+            )
+            if compression != IDENTITY:
+                headers["Content-Encoding"] = compression
+        else:
+            # the chunks are expanded into the bulk format only here, while being serialized
+            data = encode_json(id, content, Config.DB_UPLOAD_SHARED_TABLES)
+
+        # not retried here: db_upload_stream retries the whole batch (DB_UPLOAD_RETRIES), a
+        # retry at both levels would send a failing batch up to (retries + 1) ** 2 times
+        response = db.post("db-service/upload", data=data, headers=headers, idempotent=False)
+        if response.status_code in UNSUPPORTED_STATUSES and negotiator.reject(format, compression, response.status_code):
+            continue
+
+        raw, wire = (data.raw_bytes, data.wire_bytes) if format == NDJSON else (len(data), len(data))
+        metrics.DB_UPLOAD_BYTES_TOTAL.labels(format=format, compression=compression, stage="raw").inc(raw)
+        metrics.DB_UPLOAD_BYTES_TOTAL.labels(format=format, compression=compression, stage="wire").inc(wire)
+        if response:
+            return response.json()
+
+        return None
+
+def db_upload_stream(id, content: Iterable[dict], batch_size: int | None = None, retries: int | None = None):
+    """
+    Upload documents in fixed-size bulk requests while they are being produced, so only one
+    batch is ever held in memory. Every batch is retried with exponential backoff - documents
+    carry their own ids, so sending a batch twice is harmless.
+    Returns the responses of all batches, or None if a batch could not be uploaded.
+    """
+    batch_size = batch_size or Config.DB_UPLOAD_BATCH_SIZE
+    retries = Config.DB_UPLOAD_RETRIES if retries is None else retries
+    content = iter(content)
+    responses = []
+
+    while batch := list(islice(content, batch_size)):
+        for attempt in range(retries + 1):
+            try:
+                response = db_upload(id, batch)
+            except requests.exceptions.RequestException as e:
+                logger.warning("Bulk upload of %d documents failed: %s", len(batch), e)
+                response = None
+
+            if response is not None:
+                break
+
+            if attempt < retries:
+                time.sleep(2 ** attempt)
+        else:
+            logger.error("Giving up on bulk upload after %d attempts", retries + 1)
+            return None
+
+        responses.append(response)
+        logger.info("Uploaded batch of %d documents to %s", len(batch), id)
+
+    return responses
+
+def db_get_chunk_ids(id: str, filename: str) -> set[str] | None:
+    """
+    Ids of the chunks stored for a file, None if the DB service could not tell.
+    """
     body = {
         "id": id,
-        "content": content
+        "filename": filename
     }
 
-    response = requests.post(url, json=body)
+    response = db.get("db-service/get-chunk-ids", json=body)
     if response:
-        return response.json()
+        return set(response.json()["ids"])
 
     return None
 
-def db_delete(id: str, filename: str):
-    url = build_url("db-service/delete")
+def db_delete_chunks(id: str, ids: Iterable[str], batch_size: int | None = None):
+    """
+    Delete chunks by id, in bulk requests of batch_size ids.
+    Returns the responses of all batches, or None if a batch could not be deleted.
+    """
+    batch_size = batch_size or Config.DB_UPLOAD_BATCH_SIZE
+    ids = iter(ids)
+    responses = []
+
+    while batch := list(islice(ids, batch_size)):
+        body = {
+            "id": id,
+            "ids": batch
+        }
 
+        # deleting the same ids twice is harmless
+        response = db.post("db-service/delete-chunks", json=body, idempotent=True)
+        if not response:
+            logger.error("Deleting %d chunks of %s failed with status %s", len(batch), id, response.status_code)
+            return None
+
+        responses.append(response.json())
+
+    return responses
+
+def db_delete(id: str, filename: str):
     body = {
         "id": id,
         "filename": filename
     }
 
-    response = requests.get(url, json=body)
+    response = db.get("db-service/delete", json=body)
     if response:
         return response.json()
 
     return None
 
-def db_search(id: str, query: str):
-    url = build_url("db-service/search")
-
+def db_search(id: str, query: str, timeout: float | None = None):
     body = {
         "id": id,
         "query": query
     }
 
-    response = requests.get(url, json=body)
+    # with a deadline (the local index answers otherwise): a shorter read timeout, no retries
+    kwargs = {"timeout": (Config.HTTP_CONNECT_TIMEOUT, timeout), "idempotent": False} if timeout else {}
+    response = db.get("db-service/search", json=body, **kwargs)
     logger.info(response.text)
     logger.info(response.status_code)
     if response:
@@ -54,13 +146,11 @@ def db_search(id: str, query: str):
     return None
 
 def db_get_documents(id: str):
-    url = build_url("db-service/get-documents")
-
     body = {
         "id": id,
     }
 
-    response = requests.get(url, json=body)
+    response = db.get("db-service/get-documents", json=body)
     if response:
         response_json = response.json()
         return response_json["documents"]
@@ -1,6 +1,7 @@
 from functools import wraps
 from flask import request, jsonify, g
-from app.auth_client import get_userinfo
+from app.auth_client import get_userinfo, get_userinfo_cached
+from config import Config
 import sys
 if '..' not in sys.path: sys.path.append('..')
 from utils import get_logger
@@ -25,7 +26,10 @@ def auth_route(f):
         token = auth_header.split(' ')[1]
         logger.debug("Extracted token: %s", token)
 
-        user_credentials = get_userinfo(token)
+        if Config.AUTH_CACHE_TTL > 0:
+            user_credentials = get_userinfo_cached(token)
+        else:
+            user_credentials = get_userinfo(token)
         if not user_credentials:
             logger.error("Failed to retrieve user credentials for token: %s", token)
             return jsonify({"error": "Failed to retrieve user credentials"}), 403
@@ -36,6 +40,23 @@ def auth_route(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_route(f):
+    """
+    auth_route restricted to the users listed in ADMIN_USERS.
+    """
+    @wraps(f)
+    @auth_route
+    def decorated_function(*args, **kwargs):
+        if not is_admin(g.user):
+            logger.warning("Admin route %s refused to %s", request.path, g.user.get("username", "unknown"))
+            return jsonify({"error": "Admin privileges required"}), 403
+
+        return f(*args, **kwargs)
+    return decorated_function
+
+def is_admin(user: dict) -> bool:
+    return user.get("username") in Config.ADMIN_USERS
+
 def require_request_params(*parameters):
     def wrapper(f):
         @wraps(f)
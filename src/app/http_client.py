@@ -0,0 +1,132 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from app import metrics, tracing
+import app.logger as logger
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP client for one upstream service, backed by a bounded connection pool.
+    Idempotent requests are retried on connection errors, timeouts and 502/503/504 answers,
+    with exponential backoff and jitter. Latency, in-flight requests and pool overflows are
+    exported per upstream.
+    """
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        pool_size: int | None = None,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        retries: int | None = None,
+        backoff: float | None = None,
+    ) -> None:
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.timeout = (
+            connect_timeout or Config.HTTP_CONNECT_TIMEOUT,
+            read_timeout or Config.HTTP_READ_TIMEOUT,
+        )
+        self.retries = Config.HTTP_RETRIES if retries is None else retries
+        self.backoff = Config.HTTP_BACKOFF if backoff is None else backoff
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._session = self._create_session()
+
+        metrics.UPSTREAM_POOL_SIZE.labels(upstream=name).set(self.pool_size)
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def reset(self) -> None:
+        """
+        Drop all pooled connections, e.g. in a freshly forked child process.
+        """
+        self._session = self._create_session()
+        self._inflight = 0
+
+    def build_url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint}"
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def request(self, method: str, endpoint: str, idempotent: bool | None = None, **kwargs) -> requests.Response:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        retries = self.retries if idempotent else 0
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.build_url(endpoint)
+
+        for attempt in range(retries + 1):
+            try:
+                response = self._send(method, url, endpoint, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == retries:
+                    raise
+                logger.warning("%s %s failed (%s), retrying", method, url, e)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                logger.warning("%s %s answered %s, retrying", method, url, response.status_code)
+
+            metrics.UPSTREAM_RETRIES_TOTAL.labels(upstream=self.name).inc()
+            # full jitter around the exponential backoff
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def _send(self, method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+        with self._lock:
+            self._inflight += 1
+            inflight = self._inflight
+        metrics.UPSTREAM_INFLIGHT_REQUESTS.labels(upstream=self.name).inc()
+        if inflight > self.pool_size:
+            # more concurrent requests than pooled connections, the extra ones are not reused
+            metrics.UPSTREAM_POOL_OVERFLOW_TOTAL.labels(upstream=self.name).inc()
+
+        start = time.perf_counter()
+        status = "error"
+        with tracing.span(f"{self.name} {method} {endpoint}", upstream=self.name, http__method=method) as span:
+            try:
+                response = self._session.request(method, url, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                with self._lock:
+                    self._inflight -= 1
+                metrics.UPSTREAM_INFLIGHT_REQUESTS.labels(upstream=self.name).dec()
+                metrics.UPSTREAM_REQUEST_LATENCY.labels(
+                    upstream=self.name, endpoint=endpoint, http_status=status
+                ).observe(time.perf_counter() - start)
+                span.set_attribute("http.status_code", status)
+
+db = UpstreamClient(
+    "db",
+    f"http://{os.environ.get('DB_HOST', 'localhost')}:{os.environ.get('DB_PORT', '5700')}",
+    read_timeout=Config.DB_READ_TIMEOUT,
+)
+auth = UpstreamClient(
+    "auth",
+    f"http://{os.environ.get('AUTH_HOST', 'localhost')}:{os.environ.get('AUTH_PORT', '3000')}",
+)
+
+def _reset_clients() -> None:
+    db.reset()
+    auth.reset()
+
+# pooled sockets must not be shared with forked children (ingestion workers, prefork servers)
+os.register_at_fork(after_in_child=_reset_clients)
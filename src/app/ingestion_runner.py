@@ -0,0 +1,128 @@
+"""
+Dedicated ingestion process for the prefork server: it owns the pool of ingestion
+workers, so recycling a web worker (gunicorn max_requests) never takes running jobs
+down with it. The web workers only queue jobs in the JobStore, the runner picks them up.
+
+    python -m app.ingestion_runner
+
+The NLP models are loaded once, before the pool of ingestion workers is forked, so the
+workers share them copy-on-write.
+
+At most one runner per jobs database: it holds an exclusive lock on a file next to it,
+which the system releases whenever the runner exits, however it exits. ensure_running
+starts a runner when nobody holds the lock.
+"""
+import atexit
+import fcntl
+import gc
+import os
+import signal
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from config import Config
+import app.logger as logger
+
+# the runner this process started last
+_started = None
+
+def get_lock_path() -> Path:
+    return Config.JOBS_DB.with_name(Config.JOBS_DB.name + ".runner.lock")
+
+def _try_lock(path: Path):
+    """
+    The open lock file, exclusively locked - None if another process holds the lock.
+    """
+    lock_file = open(path, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def ensure_running() -> bool:
+    """
+    Start a runner in its own session (it must outlive the calling web worker) unless one
+    is running. Returns True if one was started.
+    """
+    global _started
+    if _started is not None and _started.poll() is None:
+        # started here and still alive, maybe still taking the lock
+        return False
+
+    lock_file = _try_lock(get_lock_path())
+    if lock_file is None:
+        return False
+    lock_file.close()
+
+    # two workers may get here at once, the runner that loses the lock exits right away
+    _started = subprocess.Popen(
+        [sys.executable, "-m", "app.ingestion_runner"],
+        cwd=str(Config.SRC_DIR),
+        start_new_session=True,
+        stdin=subprocess.DEVNULL,
+    )
+    logger.info("Started the ingestion runner")
+    return True
+
+def stop() -> None:
+    """
+    Ask the running runner, if any, to stop (e.g. when the server shuts down).
+    """
+    try:
+        pid = int(get_lock_path().read_text().strip())
+    except (OSError, ValueError):
+        return
+    lock_file = _try_lock(get_lock_path())
+    if lock_file is not None:
+        # nobody holds the lock, the pid is stale
+        lock_file.close()
+        return
+
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+def main() -> None:
+    from app import metrics
+    from app.jobs import JobQueue
+
+    lock_file = _try_lock(get_lock_path())
+    if lock_file is None:
+        logger.info("Another ingestion runner is active, exiting")
+        return
+
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    atexit.register(metrics.mark_process_dead, os.getpid())
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    if Config.PRELOAD_MODELS:
+        from model_registry import registry
+        registry.warmup()
+        # moved out of the GC's reach, so collections in the pool workers don't copy the model pages
+        gc.collect()
+        gc.freeze()
+
+    queue = JobQueue(runner=False)
+    queue.start()
+    logger.info("Ingestion runner %d polling %s", os.getpid(), Config.JOBS_DB)
+    while not stopping.wait(Config.INGESTION_POLL_INTERVAL):
+        try:
+            queue.dispatch_queued()
+        except Exception as e:
+            logger.error("Dispatching queued ingestion jobs failed: %s", e)
+
+    # the running jobs are finished, the queued ones stay queued for the next runner
+    logger.info("Ingestion runner %d stopping", os.getpid())
+    queue.shutdown(wait=True, cancel_futures=True)
+
+if __name__ == "__main__":
+    main()
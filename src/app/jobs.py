@@ -0,0 +1,809 @@
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Iterator
+from config import Config
+import app.logger as logger
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# update: send only the chunks that changed since the stored version of the file
+# replace: delete the stored version and send every chunk
+UPDATE = "update"
+REPLACE = "replace"
+UPLOAD_MODES = (UPDATE, REPLACE)
+
+class QueueFullError(Exception):
+    pass
+
+class JobStore:
+    """
+    SQLite-backed store of ingestion jobs, shared by the web workers and the ingestion
+    worker processes. Every call opens its own connection, so the store can be used from
+    any thread or process.
+    """
+    COLUMNS = (
+        "id", "user", "filename", "path", "file_hash", "status", "stage", "pages_total", "pages_done",
+        "error", "result", "owner_pid", "owner_token", "trace_context", "profile", "mode", "batch_id",
+        "created_at", "updated_at",
+    )
+    # columns added after the first release, created on stores that predate them
+    ADDED_COLUMNS = {
+        "file_hash": "TEXT",
+        "trace_context": "TEXT",
+        "profile": "TEXT",
+        "mode": "TEXT",
+        "batch_id": "TEXT",
+        "owner_token": "TEXT",
+    }
+
+    def __init__(self, db_path: str | Path | None = None) -> None:
+        self.db_path = str(db_path or Config.JOBS_DB)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id          TEXT PRIMARY KEY,
+                    user        TEXT NOT NULL,
+                    filename    TEXT NOT NULL,
+                    path        TEXT NOT NULL,
+                    status      TEXT NOT NULL,
+                    stage       TEXT,
+                    pages_total INTEGER,
+                    pages_done  INTEGER NOT NULL DEFAULT 0,
+                    error       TEXT,
+                    result      TEXT,
+                    owner_pid   INTEGER,
+                    created_at  REAL NOT NULL,
+                    updated_at  REAL NOT NULL
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, type in self.ADDED_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).rowcount
+        finally:
+            conn.close()
+
+    def _to_dict(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["trace_context"] = json.loads(job["trace_context"]) if job["trace_context"] else None
+        return job
+
+    def create(
+        self,
+        user: str,
+        filename: str,
+        path: str,
+        job_id: str | None = None,
+        file_hash: str | None = None,
+        trace_context: dict | None = None,
+        profile: str | None = None,
+        mode: str = UPDATE,
+        batch_id: str | None = None,
+    ) -> dict:
+        now = time.time()
+        job_id = job_id or uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, user, filename, path, file_hash, trace_context, profile, mode, batch_id, "
+            "status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id, user, filename, path, file_hash,
+                json.dumps(trace_context) if trace_context else None, profile, mode, batch_id, QUEUED, now, now,
+            ),
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict | None:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def list_by_user(self, user: str, limit: int = 50) -> list[dict]:
+        rows = self._query(
+            "SELECT * FROM jobs WHERE user = ? ORDER BY created_at DESC LIMIT ?", (user, limit)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def list_by_status(self, *statuses: str) -> list[dict]:
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self._query(
+            f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at", statuses
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def list_by_batch(self, batch_id: str) -> list[dict]:
+        rows = self._query(
+            "SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid", (batch_id,)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def count_active(self, bulk: bool = False) -> int:
+        """
+        Queued or running jobs, of single uploads or of bulk uploads (which are bounded separately).
+        """
+        rows = self._query(
+            f"SELECT COUNT(*) FROM jobs WHERE status IN (?, ?) AND batch_id IS {'NOT NULL' if bulk else 'NULL'}",
+            ACTIVE_STATUSES,
+        )
+        return rows[0][0]
+
+    def claim(self, job_id: str, pid: int) -> bool:
+        """
+        Atomically move a queued job to running. Returns False if somebody else got it first.
+        """
+        updated = self._execute(
+            "UPDATE jobs SET status = ?, owner_pid = ?, owner_token = ?, updated_at = ? WHERE id = ? AND status = ?",
+            (RUNNING, pid, _process_token(pid), time.time(), job_id, QUEUED),
+        )
+        return updated == 1
+
+    def update(self, job_id: str, **fields) -> None:
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+
+        unknown = set(fields) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown job field(s): {sorted(unknown)}")
+
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def requeue_orphans(self) -> int:
+        """
+        Put back jobs left running by a process that no longer exists (crash, restart).
+        """
+        orphans = [
+            job for job in self.list_by_status(RUNNING) if not _owner_alive(job["owner_pid"], job["owner_token"])
+        ]
+        for job in orphans:
+            self._execute(
+                "UPDATE jobs SET status = ?, stage = NULL, pages_done = 0, owner_pid = NULL, owner_token = NULL, "
+                "updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job["id"], RUNNING),
+            )
+        return len(orphans)
+
+def _process_token(pid: int) -> str | None:
+    """
+    Tells a process apart from a later one with the same PID (PIDs start low again after
+    a restart): the boot id and the start time of the process. None without /proc.
+    """
+    try:
+        boot_id = Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    # starttime is the 22nd field, counted from the state after the (command name)
+    start_time = stat.rsplit(")", 1)[1].split()[19]
+    return f"{boot_id}:{start_time}"
+
+def _owner_alive(pid: int | None, token: str | None) -> bool:
+    if not _pid_alive(pid):
+        return False
+    # jobs claimed before the token was stored, or without /proc: the PID has to do
+    return token is None or _process_token(pid) == token
+
+def _pid_alive(pid: int | None) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def job_upload_path(job_id: str) -> Path:
+    # never derived from the client-supplied filename
+    return Config.UPLOAD_DIR / f"{job_id}.pdf"
+
+def run_ingestion_job(job_id: str) -> str | None:
+    """
+    Entry point of the ingestion worker processes: partition, clean up and chunk the
+    uploaded PDF, then send the chunks to the DB service. Returns the final job status,
+    or None if the job was already claimed by another worker.
+    """
+    from app.db_client import db_upload_stream
+    from app import metrics, tracing
+
+    store = JobStore()
+    if not store.claim(job_id, os.getpid()):
+        return None
+
+    job = store.get(job_id)
+
+    # continues the trace of the upload request
+    span, token = tracing.start_span("ingestion_job", carrier=job["trace_context"], job__id=job_id)
+    error = None
+    # requested by an admin with the upload, see routes.upload
+    profiler = _start_profiler(job_id, job["profile"]) if job["profile"] else None
+
+    try:
+        pdfProcessor, content, previous_ids, current_ids, segment = _prepare_content(store, job, span)
+        start = time.perf_counter()
+        response = db_upload_stream(job["user"], content)
+        # the pipeline runs lazily inside the upload loop, the rest is spent on the DB calls
+        upload_seconds = time.perf_counter() - start - sum(pdfProcessor.get_stage_seconds().values())
+        metrics.PIPELINE_STAGE_SECONDS.labels(stage="upload").observe(max(upload_seconds, 0.0))
+        if response is None:
+            raise RuntimeError("DB service rejected the upload")
+
+        if previous_ids is not None:
+            _remove_stale_chunks(job, previous_ids, current_ids)
+        _update_lexical_index(job, pdfProcessor.filename, segment, previous_ids, current_ids)
+
+        tracing.set_attributes(
+            span,
+            **{f"document__{name}": value for name, value in pdfProcessor.get_document_stats().items()},
+            **{f"stage__{name}_seconds": value for name, value in pdfProcessor.get_stage_seconds().items()},
+        )
+
+        store.update(job_id, status=DONE, stage=None, result=response)
+        logger.info("Ingestion job %s finished for %s", job_id, job["filename"])
+    except Exception as e:
+        logger.error("Ingestion job %s failed: %s", job_id, e)
+        store.update(job_id, status=FAILED, error=str(e))
+        error = e
+    finally:
+        Path(job["path"]).unlink(missing_ok=True)
+        tracing.end_span(span, token, error)
+        if profiler:
+            _save_profile(job_id, job["profile"], profiler.stop())
+
+    return store.get(job_id)["status"]
+
+def run_bulk_ingestion(job_ids: list[str]) -> dict[str, str]:
+    """
+    Entry point of the worker processes for a shard of a bulk upload: the files are
+    processed one after the other and their chunks sent through a single stream of bulk
+    requests, so small documents share DB round trips. A file that fails is skipped - the
+    chunks it already sent are deleted again - and the rest of the shard carries on. Returns the final status of the jobs it claimed.
+    """
+    from app.db_client import db_upload_stream
+    from app import metrics, tracing
+
+    store = JobStore()
+    jobs = [store.get(job_id) for job_id in job_ids if store.claim(job_id, os.getpid())]
+    if not jobs:
+        return {}
+
+    span, token = tracing.start_span(
+        "bulk_ingestion", carrier=jobs[0]["trace_context"], bulk__id=jobs[0]["batch_id"], bulk__files=len(jobs)
+    )
+    statuses = {}
+    # job id -> (job, processor, previous_ids, current_ids, segment, documents), once all its chunks were produced
+    produced = {}
+
+    def fail(job: dict, error: Exception | str) -> None:
+        logger.error("Ingestion job %s (bulk %s) failed: %s", job["id"], job["batch_id"], error)
+        store.update(job["id"], status=FAILED, error=str(error))
+        statuses[job["id"]] = FAILED
+
+    # job id -> ids of the chunks a job sent before it failed, not stored before
+    partial = {}
+
+    def iter_content() -> Iterator[dict]:
+        for job in jobs:
+            previous_ids = None
+            sent = set()
+            try:
+                pdfProcessor, content, previous_ids, current_ids, segment = _prepare_content(store, job, tracing.NOOP_SPAN)
+                for document in content:
+                    sent.add(document["id"])
+                    yield document
+                produced[job["id"]] = (job, pdfProcessor, previous_ids, current_ids, segment, len(sent))
+            except Exception as e:
+                fail(job, e)
+                partial[job["id"]] = sent - (previous_ids or set())
+            finally:
+                Path(job["path"]).unlink(missing_ok=True)
+
+    error = None
+    try:
+        start = time.perf_counter()
+        response = db_upload_stream(jobs[0]["user"], iter_content())
+        _delete_partial_chunks(jobs[0]["user"], partial)
+        stage_seconds = sum(sum(item[1].get_stage_seconds().values()) for item in produced.values())
+        metrics.PIPELINE_STAGE_SECONDS.labels(stage="upload").observe(max(time.perf_counter() - start - stage_seconds, 0.0))
+
+        for job, pdfProcessor, previous_ids, current_ids, segment, documents in produced.values():
+            if response is None:
+                fail(job, "DB service rejected the upload")
+                continue
+
+            try:
+                if previous_ids is not None:
+                    _remove_stale_chunks(job, previous_ids, current_ids)
+                _update_lexical_index(job, pdfProcessor.filename, segment, previous_ids, current_ids)
+            except Exception as e:
+                fail(job, e)
+                continue
+
+            store.update(job["id"], status=DONE, stage=None, result={"documents_uploaded": documents})
+            statuses[job["id"]] = DONE
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # files the upload never got to, because it stopped early
+        for job in jobs:
+            if job["id"] not in statuses:
+                Path(job["path"]).unlink(missing_ok=True)
+                fail(job, error or "DB service rejected the upload")
+        tracing.end_span(span, token, error)
+
+    logger.info(
+        "Bulk ingestion shard of %s finished: %d done, %d failed",
+        jobs[0]["batch_id"], list(statuses.values()).count(DONE), list(statuses.values()).count(FAILED),
+    )
+    return statuses
+
+def _delete_partial_chunks(user: str, partial: dict[str, set[str]]) -> None:
+    """
+    Delete the chunks of the failed files of a bulk upload, once the upload is through:
+    until then some of them may still wait in the batch being filled.
+    """
+    import requests
+    from app.db_client import db_delete_chunks
+
+    for job_id, ids in partial.items():
+        if not ids:
+            continue
+        try:
+            deleted = db_delete_chunks(user, ids) is not None
+        except requests.exceptions.RequestException:
+            deleted = False
+        if not deleted:
+            logger.error("Could not delete the %d chunks ingestion job %s uploaded before it failed", len(ids), job_id)
+
+def _prepare_content(store: JobStore, job: dict, span) -> tuple:
+    """
+    Processor and lazily produced DB documents of a job: the cached chunks of identical
+    content relabelled for this file, or the output of the pipeline. In update mode the
+    chunks already stored are left out; the ids of all chunks are collected in current_ids.
+    previous_ids is None when the stored chunks are unknown, the stored version is then
+    deleted by file name. The
+    documents are added to a segment of the local lexical index on their way, if enabled.
+    Returns (processor, documents, previous_ids, current_ids, segment).
+    """
+    from pdf_processor import PdfProcessor
+    from document_helpers import get_hash_bytes
+    from ingestion_cache import get_cache_key, get_ingestion_cache
+    from dedup import Deduplicator
+    from lexical_index import SegmentWriter
+    from app import tracing
+
+    def report_progress(stage: str, pages_done: int, pages_total: int) -> None:
+        store.update(job["id"], stage=stage, pages_done=pages_done, pages_total=pages_total)
+
+    # read once, PyMuPDF and unstructured both work on the bytes
+    data = Path(job["path"]).read_bytes()
+    pdfProcessor = PdfProcessor(
+        job["path"], "", filename=job["filename"], data=data, progress_callback=report_progress,
+        deduplicator=Deduplicator(user=job["user"], filename=job["filename"]),
+    )
+    tracing.set_attributes(span, document__bytes=len(data), document__pages=pdfProcessor.num_pages)
+
+    cache = get_ingestion_cache()
+    file_hash = job["file_hash"] or get_hash_bytes(data)
+    cache_key = get_cache_key(file_hash, job["user"]) if cache else None
+    cached_chunks = cache.get(cache_key) if cache else None
+
+    if cached_chunks is not None:
+        logger.info("Ingestion cache hit for %s", job["filename"])
+        store.update(job["id"], stage="uploading")
+        chunks = pdfProcessor.relabel_chunks(cached_chunks)
+    else:
+        # chunks are uploaded in batches while the document is being chunked
+        chunks = pdfProcessor.stream()
+        if cache:
+            chunks = cache.put_through(cache_key, chunks)
+
+    tracing.set_attributes(span, cache__hit=cached_chunks is not None)
+
+    previous_ids = _get_previous_chunk_ids(job["user"], pdfProcessor.filename)
+    current_ids = set()
+    if previous_ids is None:
+        logger.warning("Stored chunks of %s unknown, replacing the whole document", pdfProcessor.filename)
+        chunks = _delete_stored_first(chunks, job["user"], pdfProcessor.filename)
+    elif (job["mode"] or UPDATE) == UPDATE:
+        chunks = _skip_unchanged(chunks, previous_ids, current_ids)
+    else:
+        # replaced: every chunk is sent, the stored ones not sent again are deleted after the upload
+        chunks = _skip_unchanged(chunks, set(), current_ids)
+
+    # only the chunks that are going to be uploaded
+    if Config.EMBEDDING_ENABLED:
+        chunks = pdfProcessor.embed_chunks(chunks)
+
+    documents = pdfProcessor.iter_format_data(job["user"], chunks)
+    segment = SegmentWriter() if Config.LEXICAL_INDEX_ENABLED else None
+    if segment is not None:
+        documents = segment.tee(documents)
+
+    return pdfProcessor, documents, previous_ids, current_ids, segment
+
+def _remove_stale_chunks(job: dict, previous_ids: set[str], current_ids: set[str]) -> None:
+    """
+    Delete the stored chunks that are not part of the new version, once it was uploaded
+    (updated or replaced).
+    """
+    from app.db_client import db_delete_chunks
+    from app import metrics
+
+    stale_ids = previous_ids - current_ids
+    if stale_ids and db_delete_chunks(job["user"], stale_ids) is None:
+        raise RuntimeError("DB service rejected the deletion of stale chunks")
+
+    unchanged = len(current_ids & previous_ids)
+    metrics.INCREMENTAL_CHUNKS_TOTAL.labels(result="added").inc(len(current_ids) - unchanged)
+    metrics.INCREMENTAL_CHUNKS_TOTAL.labels(result="unchanged").inc(unchanged)
+    metrics.INCREMENTAL_CHUNKS_TOTAL.labels(result="deleted").inc(len(stale_ids))
+    logger.info(
+        "Updated %s: %d chunks added, %d unchanged, %d deleted",
+        job["filename"], len(current_ids) - unchanged, unchanged, len(stale_ids),
+    )
+
+def _update_lexical_index(job: dict, filename: str, segment, previous_ids: set[str] | None, current_ids: set[str]) -> None:
+    """
+    Apply an upload to the local lexical index of the user, like it was applied to the
+    DB service: the stored version deleted (replaced) or only its stale chunks (updated).
+    The segment holds every chunk sent, which in replace mode includes stored ones.
+    The DB service stays the source of truth, a failure here is only logged.
+    """
+    from lexical_index import get_lexical_index
+
+    index = get_lexical_index(job["user"])
+    if index is None or segment is None:
+        return
+
+    try:
+        if previous_ids is None or job["mode"] == REPLACE:
+            index.commit(segment, delete_filenames=[filename])
+        else:
+            index.commit(segment, delete_ids=previous_ids - current_ids)
+    except Exception as e:
+        logger.warning("Updating the lexical index with %s failed: %s", filename, e)
+
+def _get_previous_chunk_ids(user: str, filename: str) -> set[str] | None:
+    """
+    Ids of the stored chunks of the file, to update it incrementally or delete the ones a
+    new version does not have. None if the DB service could not tell.
+    """
+    import requests
+    from app.db_client import db_get_chunk_ids
+
+    try:
+        return db_get_chunk_ids(user, filename)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Listing the stored chunks of %s failed: %s", filename, e)
+        return None
+
+def _delete_stored_first(chunks: Iterable[dict], user: str, filename: str) -> Iterator[dict]:
+    """
+    The chunks, with the stored version of the file deleted right before the first one is
+    passed on. Without its chunk ids it can only be deleted by file name, which would take
+    the new chunks with it after the upload: a document that fails before its first chunk
+    (e.g. in partitioning) keeps its stored version.
+    """
+    from app.db_client import db_delete
+
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if db_delete(user, filename) is None:
+        raise RuntimeError("DB service rejected the deletion of the stored document")
+
+    if first is not None:
+        yield first
+    yield from chunks
+
+def _skip_unchanged(chunks: Iterable[dict], previous_ids: set[str], current_ids: set[str]) -> Iterator[dict]:
+    """
+    Chunks whose (content-based) id is not stored yet. Collects the ids of all chunks.
+    """
+    for chunk in chunks:
+        current_ids.add(chunk["id"])
+        if chunk["id"] not in previous_ids:
+            yield chunk
+
+def _start_profiler(job_id: str, mode: str):
+    """
+    The profiler requested for a job, started - None if it cannot run (e.g. cProfile is
+    already active in this worker), the job then runs without it.
+    """
+    from app import profiling
+
+    try:
+        return profiling.create_profiler(mode).start()
+    except Exception as e:
+        logger.warning("Running job %s without the %s profile: %s", job_id, mode, e)
+        return None
+
+def _save_profile(job_id: str, mode: str, profiler) -> None:
+    from app import profiling
+
+    path = profiling.get_job_profile_path(job_id, profiling.DEFAULT_FORMATS[mode])
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(profiler.render(profiling.DEFAULT_FORMATS[mode]))
+        logger.info("Saved %s profile of job %s to %s", mode, job_id, path)
+    except OSError as e:
+        logger.error("Could not save the profile of job %s: %s", job_id, e)
+
+class JobQueue:
+    """
+    Bounded pool of worker processes running ingestion jobs in the background.
+    The pool is only created on first use, so it is never shared across a fork.
+    With a dedicated runner (INGESTION_RUNNER=process, see app.ingestion_runner) the jobs
+    are only queued in the store here and run by the runner's queue.
+    """
+    def __init__(self, max_workers: int | None = None, max_queued: int | None = None, runner: bool | None = None) -> None:
+        self.max_workers = max_workers or Config.INGESTION_WORKERS
+        self.max_queued = max_queued or Config.INGESTION_QUEUE_SIZE
+        # hand the jobs over to the dedicated ingestion runner instead of running them here
+        self.runner = Config.INGESTION_RUNNER == "process" if runner is None else runner
+        self._store = None
+        self._executor = None
+        self._lock = threading.Lock()
+        # dispatched to the pool, not finished yet
+        self._pending = set()
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore()
+        return self._store
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                from app import metrics
+                # forked, so the workers share the models loaded before (see ingestion_runner.main)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("fork"),
+                    initializer=metrics.init_pool_process,
+                )
+            return self._executor
+
+    def start(self) -> None:
+        """
+        Resume the jobs that were queued or interrupted before the last shutdown.
+        """
+        if self.runner:
+            from app.ingestion_runner import ensure_running
+            ensure_running()
+            return
+
+        requeued = self.store.requeue_orphans()
+        resumed = self.dispatch_queued()
+        if resumed:
+            logger.info("Resumed %d ingestion job(s) (%d interrupted)", resumed, requeued)
+
+    def dispatch_queued(self) -> int:
+        """
+        Run the queued jobs not dispatched yet, the files of a bulk upload in shards.
+        Returns the number of jobs dispatched.
+        """
+        with self._lock:
+            jobs = [job for job in self.store.list_by_status(QUEUED) if job["id"] not in self._pending]
+
+        batches = {}
+        for job in jobs:
+            if job["batch_id"] is None:
+                self._dispatch(job["id"])
+            else:
+                batches.setdefault(job["batch_id"], []).append(job)
+
+        for batch in batches.values():
+            sizes = {job["id"]: _file_size(job["path"]) for job in batch}
+            for shard in _shard(list(sizes), sizes, self.max_workers):
+                self._dispatch_bulk(shard)
+
+        return len(jobs)
+
+    def submit(
+        self,
+        user: str,
+        filename: str,
+        path: str,
+        job_id: str | None = None,
+        file_hash: str | None = None,
+        profile: str | None = None,
+        mode: str = UPDATE,
+    ) -> dict:
+        from app import tracing
+
+        if self.store.count_active() >= self.max_queued:
+            raise QueueFullError(f"Ingestion queue is full ({self.max_queued} jobs)")
+
+        job = self.store.create(user, filename, path, job_id, file_hash, tracing.inject(), profile, mode)
+        if self.runner:
+            self._ensure_runner()
+        else:
+            self._dispatch(job["id"])
+        return job
+
+    def _ensure_runner(self) -> None:
+        # it picks the new jobs up from the store; started again if it is gone
+        from app.ingestion_runner import ensure_running
+        ensure_running()
+
+    def submit_bulk(self, user: str, files: list[dict], mode: str = UPDATE) -> tuple[str, list[dict]]:
+        """
+        Queue one job per file (dicts with filename, path, job_id, file_hash and size) and
+        run them in shards, each shard in one worker (see run_bulk_ingestion). Returns the
+        batch id and the jobs, in the order of the files.
+        """
+        from app import tracing
+
+        if self.store.count_active(bulk=True) + len(files) > Config.BULK_QUEUE_SIZE:
+            raise QueueFullError(f"Bulk ingestion queue is full ({Config.BULK_QUEUE_SIZE} files)")
+
+        batch_id = uuid.uuid4().hex
+        trace_context = tracing.inject()
+        jobs = [
+            self.store.create(
+                user, file["filename"], file["path"], file["job_id"], file["file_hash"],
+                trace_context, mode=mode, batch_id=batch_id,
+            )
+            for file in files
+        ]
+
+        if self.runner:
+            self._ensure_runner()
+            return batch_id, jobs
+
+        sizes = {file["job_id"]: file["size"] for file in files}
+        for shard in _shard([job["id"] for job in jobs], sizes, self.max_workers):
+            self._dispatch_bulk(shard)
+
+        return batch_id, jobs
+
+    def _dispatch(self, job_id: str) -> None:
+        with self._lock:
+            self._pending.add(job_id)
+        try:
+            future = self._get_executor().submit(run_ingestion_job, job_id)
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed) - replace the pool and try once more
+            logger.error("Ingestion pool is broken, restarting it")
+            self.shutdown(wait=False)
+            self.store.requeue_orphans()
+            future = self._get_executor().submit(run_ingestion_job, job_id)
+
+        future.add_done_callback(partial(self._on_done, job_id))
+
+    def _dispatch_bulk(self, job_ids: list[str]) -> None:
+        with self._lock:
+            self._pending.update(job_ids)
+        try:
+            future = self._get_executor().submit(run_bulk_ingestion, job_ids)
+        except BrokenProcessPool:
+            logger.error("Ingestion pool is broken, restarting it")
+            self.shutdown(wait=False)
+            self.store.requeue_orphans()
+            future = self._get_executor().submit(run_bulk_ingestion, job_ids)
+
+        future.add_done_callback(partial(self._on_bulk_done, job_ids))
+
+    def _on_bulk_done(self, job_ids: list[str], future: Future) -> None:
+        from app import metrics
+        from app.search_cache import invalidate_user
+
+        with self._lock:
+            self._pending.difference_update(job_ids)
+        if future.cancelled():
+            # still queued in the store
+            return
+
+        if future.exception():
+            logger.error("Bulk ingestion worker crashed: %s", future.exception())
+            statuses = dict.fromkeys(job_ids, FAILED)
+        else:
+            statuses = future.result()
+
+        for status in statuses.values():
+            metrics.PDF_UPLOAD_TOTAL.labels(status="success" if status == DONE else "error").inc()
+
+        job = self.store.get(job_ids[0])
+        if job:
+            invalidate_user(job["user"])
+
+    def _on_done(self, job_id: str, future: Future) -> None:
+        from app import metrics
+        from app.search_cache import invalidate_user
+
+        with self._lock:
+            self._pending.discard(job_id)
+        if future.cancelled():
+            return
+
+        if future.exception():
+            logger.error("Ingestion worker crashed: %s", future.exception())
+            status = FAILED
+        else:
+            status = future.result()
+
+        if status in (DONE, FAILED):
+            metrics.PDF_UPLOAD_TOTAL.labels(
+                status="success" if status == DONE else "error"
+            ).inc()
+
+            # even a failed job may have indexed some batches already
+            job = self.store.get(job_id)
+            if job:
+                invalidate_user(job["user"])
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        # outside the lock, the done callbacks of cancelled futures take it
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _shard(job_ids: list[str], sizes: dict[str, int], workers: int) -> list[list[str]]:
+    """
+    Split a batch into shards of similar total size, at least one per worker (so the batch
+    uses every core) and small enough that single uploads are not starved behind them.
+    """
+    count = max(min(workers, len(job_ids)), math.ceil(len(job_ids) / Config.BULK_SHARD_FILES))
+    shards = [[] for _ in range(count)]
+    totals = [0] * count
+
+    # largest files first, each into the currently smallest shard
+    for job_id in sorted(job_ids, key=lambda job_id: sizes[job_id], reverse=True):
+        index = totals.index(min(totals))
+        shards[index].append(job_id)
+        totals[index] += sizes[job_id]
+
+    return shards
+
+job_queue = JobQueue()
@@ -0,0 +1,99 @@
+import time
+import requests
+from config import Config
+from app import metrics
+from app.search_cache import cached_search, cached_search_async
+from lexical_index import LexicalIndex, get_lexical_index
+import app.logger as logger
+
+# the upstream answers, the local index only when it fails or times out
+FALLBACK = "fallback"
+# the local index answers, the upstream only when it finds nothing
+FAST = "fast"
+# both, results fused by reciprocal rank
+HYBRID = "hybrid"
+MODES = (FALLBACK, FAST, HYBRID)
+
+# reciprocal rank fusion constant
+RRF_K = 60
+
+def search_local(index: LexicalIndex, query: str) -> list[dict]:
+    start = time.perf_counter()
+    hits = index.search(query)
+    metrics.LOCAL_SEARCH_LATENCY.observe(time.perf_counter() - start)
+    return hits
+
+def fuse(upstream: list[dict], local: list[dict]) -> list[dict]:
+    """
+    Reciprocal rank fusion of two lists of search hits, by _id. The scores of the
+    fused hits are their fusion scores.
+    """
+    scores = {}
+    hits = {}
+    for results in (upstream, local):
+        for rank, hit in enumerate(results):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0) + 1 / (RRF_K + rank + 1)
+            hits.setdefault(hit["_id"], hit)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:max(len(upstream), Config.LEXICAL_SEARCH_SIZE)]
+    return [hits[id] | {"_score": scores[id]} for id in ranked]
+
+def _combine(index: LexicalIndex, query: str, result) -> list[dict] | None:
+    if result is None:
+        metrics.LOCAL_SEARCH_TOTAL.labels(mode=Config.LEXICAL_SEARCH_MODE, result="fallback").inc()
+        return search_local(index, query)
+
+    if Config.LEXICAL_SEARCH_MODE == HYBRID and isinstance(result, list):
+        metrics.LOCAL_SEARCH_TOTAL.labels(mode=HYBRID, result="fused").inc()
+        return fuse(result, search_local(index, query))
+
+    return result
+
+def search(user: str, query: str, upstream) -> list[dict] | None:
+    """
+    Search the chunks of the user with the upstream search function and/or the local
+    lexical index, per LEXICAL_SEARCH_MODE. Local results are never cached.
+    """
+    index = get_lexical_index(user)
+    if index is None:
+        return cached_search(user, query, upstream)
+
+    if Config.LEXICAL_SEARCH_MODE == FAST:
+        hits = search_local(index, query)
+        metrics.LOCAL_SEARCH_TOTAL.labels(mode=FAST, result="hit" if hits else "miss").inc()
+        # documents uploaded before the index was enabled are only found upstream
+        return hits or cached_search(user, query, upstream)
+
+    # a degraded upstream must not hold the request for the full read timeout
+    timed = lambda user, query: upstream(user, query, timeout=Config.LEXICAL_UPSTREAM_TIMEOUT)
+    try:
+        result = cached_search(user, query, timed)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Upstream search failed, answering from the local index: %s", e)
+        result = None
+
+    return _combine(index, query, result)
+
+async def search_async(user: str, query: str, upstream) -> list[dict] | None:
+    """
+    search() for a coroutine upstream search function.
+    """
+    import httpx
+
+    index = get_lexical_index(user)
+    if index is None:
+        return await cached_search_async(user, query, upstream)
+
+    if Config.LEXICAL_SEARCH_MODE == FAST:
+        hits = search_local(index, query)
+        metrics.LOCAL_SEARCH_TOTAL.labels(mode=FAST, result="hit" if hits else "miss").inc()
+        return hits or await cached_search_async(user, query, upstream)
+
+    timed = lambda user, query: upstream(user, query, timeout=Config.LEXICAL_UPSTREAM_TIMEOUT)
+    try:
+        result = await cached_search_async(user, query, timed)
+    except httpx.HTTPError as e:
+        logger.warning("Upstream search failed, answering from the local index: %s", e)
+        result = None
+
+    return _combine(index, query, result)
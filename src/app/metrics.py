@@ -1,4 +1,6 @@
-from prometheus_client import Counter, Histogram
+import os
+from multiprocessing import util
+from prometheus_client import Counter, Gauge, Histogram, multiprocess
 
 # ── generic HTTP stats ────────────────────────────────────────────────────────
 HTTP_REQUESTS_TOTAL = Counter(
@@ -14,8 +16,98 @@ HTTP_REQUEST_LATENCY = Histogram(
     buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
 )
 
+def observe_request(method, endpoint, http_status, elapsed):
+    HTTP_REQUESTS_TOTAL.labels(
+        method=method,
+        endpoint=endpoint,
+        http_status=http_status,
+    ).inc()
+
+    HTTP_REQUEST_LATENCY.labels(
+        method=method,
+        endpoint=endpoint,
+    ).observe(elapsed)
+
+# ── upstream services (db, auth) ──────────────────────────────────────────────
+UPSTREAM_REQUEST_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of requests to upstream services in seconds",
+    ["upstream", "endpoint", "http_status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+UPSTREAM_INFLIGHT_REQUESTS   = Gauge("upstream_inflight_requests", "Requests in flight per upstream", ["upstream"], multiprocess_mode="livesum")
+UPSTREAM_POOL_SIZE           = Gauge("upstream_pool_size", "Pooled keep-alive connections per upstream", ["upstream"], multiprocess_mode="livesum")
+UPSTREAM_POOL_OVERFLOW_TOTAL = Counter("upstream_pool_overflow_total", "Requests sent while the connection pool was exhausted", ["upstream"])
+UPSTREAM_RETRIES_TOTAL       = Counter("upstream_retries_total", "Retried upstream requests", ["upstream"])
+DB_UPLOAD_BYTES_TOTAL        = Counter("db_upload_bytes_total", "Bytes of bulk uploads before (raw) and after (wire) compression", ["format", "compression", "stage"])
+
+# ── token introspection cache ─────────────────────────────────────────────────
+AUTH_CACHE_TOTAL   = Counter("auth_cache_total", "Token lookups by cache result", ["result"])
+AUTH_CACHE_ENTRIES = Gauge("auth_cache_entries", "Tokens currently cached", multiprocess_mode="livesum")
+
+# ── search result cache ───────────────────────────────────────────────────────
+SEARCH_CACHE_TOTAL         = Counter("search_cache_total", "Search cache lookups", ["result"])
+SEARCH_CACHE_SAVED_SECONDS = Counter("search_cache_saved_seconds_total", "Upstream search latency saved by cache hits")
+SEARCH_CACHE_BYTES         = Gauge("search_cache_bytes", "Approximate size of the cached search results", multiprocess_mode="livesum")
+LOCAL_SEARCH_TOTAL         = Counter("local_search_total", "Searches answered with the local lexical index", ["mode", "result"])
+LOCAL_SEARCH_LATENCY = Histogram(
+    "local_search_duration_seconds",
+    "Latency of local lexical index searches in seconds",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
 # ── business specific counters ────────────────────────────────────────────────
 PDF_UPLOAD_TOTAL     = Counter("pdf_upload_total",     "Number of PDF uploads",     ["status"])
 PDF_DELETE_TOTAL     = Counter("pdf_delete_total",     "Number of PDF deletions",  ["status"])
 SEARCH_TOTAL         = Counter("search_total",         "Number of /search calls",  ["status"])
-CHUNKS_CREATED_TOTAL = Counter("chunks_created_total", "Chunks produced from docs")
\ No newline at end of file
+CHUNKS_CREATED_TOTAL = Counter("chunks_created_total", "Chunks produced from docs")
+CHUNKS_CREATED_BY_TYPE_TOTAL = Counter("chunks_created_by_type_total", "Chunks produced from docs, text and table chunks", ["type"])
+EMBEDDED_CHUNKS_TOTAL = Counter("embedded_chunks_total", "Chunks embedded before the upload", ["backend"])
+DEDUP_TEXTS_TOTAL = Counter("dedup_texts_total", "Repeated elements and sentences left out of the chunks", ["level"])
+DEDUP_BYTES_AVOIDED_TOTAL = Counter("dedup_bytes_avoided_total", "Bytes of text left out of the chunks as repeated", ["level"])
+DEDUP_CHUNKS_AVOIDED_TOTAL = Counter("dedup_chunks_avoided_total", "Chunks the repeated text would have filled (estimated from the average chunk size)")
+BULK_UPLOAD_FILES_TOTAL = Counter("bulk_upload_files_total", "Files of bulk uploads by outcome", ["status"])
+INCREMENTAL_CHUNKS_TOTAL = Counter("incremental_chunks_total", "Chunks of re-uploaded documents by diff result", ["result"])
+PDF_PAGES_BY_STRATEGY = Counter("pdf_pages_by_strategy_total", "PDF pages partitioned, by strategy", ["strategy"])
+
+# ── ingestion pipeline, observed once per document ────────────────────────────
+PIPELINE_STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent per document in each stage of the ingestion pipeline",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+PARTITION_SECONDS = Histogram(
+    "pdf_partition_duration_seconds",
+    "Time spent partitioning a page range, by strategy (hi_res = layout detection and OCR)",
+    ["strategy"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+DOCUMENT_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DOCUMENT_PAGES    = Histogram("document_pages", "Pages per processed document", buckets=DOCUMENT_SIZE_BUCKETS)
+DOCUMENT_ELEMENTS = Histogram("document_elements", "Partitioned elements per processed document", buckets=DOCUMENT_SIZE_BUCKETS)
+DOCUMENT_TABLES   = Histogram("document_tables", "Tables per processed document", buckets=(0,) + DOCUMENT_SIZE_BUCKETS)
+DOCUMENT_CHUNKS   = Histogram("document_chunks", "Chunks per processed document", buckets=DOCUMENT_SIZE_BUCKETS)
+
+# ── ingestion cache ───────────────────────────────────────────────────────────
+INGESTION_CACHE_TOTAL           = Counter("ingestion_cache_total", "Ingestion cache lookups", ["result"])
+INGESTION_CACHE_EVICTIONS_TOTAL = Counter("ingestion_cache_evictions_total", "Ingestion cache entries evicted")
+INGESTION_CACHE_BYTES           = Gauge("ingestion_cache_bytes", "Size of the ingestion cache on disk", multiprocess_mode="mostrecent")
+
+# ── NLP models ────────────────────────────────────────────────────────────────
+MODEL_LOAD_SECONDS = Gauge("model_load_seconds", "Time spent loading a model", ["model"], multiprocess_mode="max")
+MODEL_MEMORY_BYTES = Gauge("model_memory_bytes", "RSS growth caused by loading a model", ["model"], multiprocess_mode="max")
+
+# ── process lifecycle (multiprocess mode) ─────────────────────────────────────
+def mark_process_dead(pid: int | None = None) -> None:
+    """
+    Drop the live gauges of an exited process from what /metrics aggregates.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+def init_pool_process() -> None:
+    """
+    ProcessPoolExecutor initializer: the pool process drops its live gauges when it exits.
+    """
+    util.Finalize(None, mark_process_dead, args=(os.getpid(),), exitpriority=0)
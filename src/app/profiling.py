@@ -0,0 +1,164 @@
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from config import Config
+
+SAMPLING = "sampling"
+CPROFILE = "cprofile"
+MODES = (SAMPLING, CPROFILE)
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    "collapsed": ("text/plain; charset=utf-8", "collapsed.txt"),
+    "pstats": ("application/octet-stream", "pstats"),
+    "text": ("text/plain; charset=utf-8", "txt"),
+}
+DEFAULT_FORMATS = {SAMPLING: "collapsed", CPROFILE: "pstats"}
+
+class ProfilerBusyError(Exception):
+    pass
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread records the Python stacks of the other
+    threads every interval. Counts are kept per collapsed stack ("outer;...;inner"), the
+    input format of flamegraph.pl and speedscope. Only costs anything while it runs.
+    """
+    def __init__(self, interval: float | None = None, exclude_threads: set[int] = frozenset()) -> None:
+        self.interval = interval or Config.PROFILE_SAMPLE_INTERVAL
+        self.exclude_threads = exclude_threads
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self) -> None:
+        excluded = self.exclude_threads | {threading.get_ident()}
+        names = {}
+        while not self._stop.wait(self.interval):
+            threads = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in excluded:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_filename, code.co_firstlineno, code.co_name)
+                    if key not in names:
+                        names[key] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(names[key])
+                    frame = frame.f_back
+
+                stack.append(threads.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def render(self, format: str = "collapsed") -> bytes:
+        if format == "collapsed":
+            lines = (f"{stack} {count}" for stack, count in self.stacks.most_common())
+            return "\n".join(lines).encode("utf-8")
+
+        if format == "text":
+            return self._summary().encode("utf-8")
+
+        raise ValueError(f"The sampling profiler cannot render {format!r}")
+
+    def _summary(self, limit: int = 50) -> str:
+        """
+        Functions with the most samples on top of the stack (self) and anywhere in it (total).
+        """
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames[1:]):
+                total[frame] += count
+
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms", "", "self   total  function"]
+        for frame, count in total.most_common(limit):
+            lines.append(f"{own[frame] / max(self.samples, 1):6.1%} {count / max(self.samples, 1):6.1%}  {frame}")
+        return "\n".join(lines)
+
+class CProfiler:
+    """
+    Deterministic profile (cProfile) of the calling thread.
+    """
+    def __init__(self) -> None:
+        self._profile = cProfile.Profile()
+
+    def start(self) -> "CProfiler":
+        try:
+            self._profile.enable()
+        except ValueError as e:
+            # another profiler is active in this thread
+            raise ProfilerBusyError(str(e)) from e
+        return self
+
+    def stop(self) -> "CProfiler":
+        self._profile.disable()
+        return self
+
+    def render(self, format: str = "pstats") -> bytes:
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        if format == "pstats":
+            # same content as Stats.dump_stats(), loadable with pstats/snakeviz/flameprof
+            return marshal.dumps(stats.stats)
+
+        if format == "text":
+            stats.sort_stats("cumulative").print_stats(50)
+            return stream.getvalue().encode("utf-8")
+
+        raise ValueError(f"cProfile cannot render {format!r}")
+
+def create_profiler(mode: str) -> SamplingProfiler | CProfiler:
+    if mode == SAMPLING:
+        return SamplingProfiler()
+    if mode == CPROFILE:
+        return CProfiler()
+    raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {MODES}")
+
+_window_lock = threading.Lock()
+
+def profile_window(seconds: float) -> SamplingProfiler:
+    """
+    Sample the other threads of this worker process for a time window. One window at a time.
+    Ingestion runs in other processes and is never part of it, see run_ingestion_job.
+    """
+    if not _window_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profile of this worker is already being recorded")
+
+    try:
+        profiler = SamplingProfiler(exclude_threads={threading.get_ident()}).start()
+        time.sleep(seconds)
+        return profiler.stop()
+    finally:
+        _window_lock.release()
+
+def get_job_profile_path(job_id: str, format: str) -> Path:
+    return Config.PROFILES_DIR / f"{job_id}.{FORMATS[format][1]}"
+
+def _short_path(filename: str) -> str:
+    # path relative to site-packages or the source tree, enough to locate the code
+    for marker in ("site-packages/", "src/"):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return filename
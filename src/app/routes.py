@@ -1,10 +1,17 @@
-from flask import Blueprint, request, jsonify, g, render_template
-from app.decorators import auth_route
+from flask import Blueprint, Response, request, jsonify, g, render_template, send_file
+from app.decorators import admin_route, auth_route, is_admin
 from app.db_client import *
-from app import metrics
-from pdf_processor import PdfProcessor
-from config import Config
+from app import metrics, profiling
+from app.jobs import UPDATE, UPLOAD_MODES, QueueFullError, job_queue, job_upload_path
+from app.local_search import search as search_chunks
+from app.search_cache import invalidate_user
+from app.uploads import ArchiveTooLargeError, extract_pdfs, is_pdf, is_zip
+from dedup import forget_document
+from lexical_index import remove_document
 import json
+import uuid
+import zipfile
+from pathlib import Path
 
 main_bp = Blueprint('main', __name__)
 
@@ -23,32 +30,167 @@ def upload():
     if not file.filename:
         return 'No file selected for uploading', 400
 
-    # temporary save file
-    file_path = os.path.join(Config.UPLOAD_DIR, file.filename)
-    file.save(file_path)
+    # update (default) sends only the chunks that changed since the stored version
+    mode = request.form.get('mode', UPDATE)
+    if mode not in UPLOAD_MODES:
+        return jsonify({"error": f"mode must be one of {list(UPLOAD_MODES)}"}), 400
 
+    # admins can have the ingestion job profiled, see /debug/profile/jobs/<job_id>
+    profile = request.headers.get('X-Profile')
+    if profile:
+        if not is_admin(g.user):
+            return jsonify({"error": "Admin privileges required for X-Profile"}), 403
+        if profile not in profiling.MODES:
+            return jsonify({"error": f"X-Profile must be one of {list(profiling.MODES)}"}), 400
+
+    # the body was streamed into the upload directory and hashed by UploadRequest,
+    # keep the file until the background job has processed it
     id = g.user.get('username', 'User')
+    job_id = uuid.uuid4().hex
+    file_path = file.stream.persist(job_upload_path(job_id))
 
-    # process and ingest document
-    pdfProcessor = PdfProcessor(file_path, "")
-    pdfProcessor.process()
-    content = pdfProcessor.format_data(index_name=id)
+    try:
+        job = job_queue.submit(id, file.filename, str(file_path), job_id, file.stream.sha256, profile, mode)
+    except QueueFullError as e:
+        file_path.unlink(missing_ok=True)
+        metrics.PDF_UPLOAD_TOTAL.labels(status="rejected").inc()
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "30"}
 
-    # delete file after processing
-    os.remove(file_path)
+    logger.info("Queued ingestion job %s for %s", job["id"], file.filename)
 
-    logger.info(json.dumps(content, indent=4))
+    return jsonify({"job_id": job["id"], "status": job["status"]}), 202
 
-    response = db_upload(id, content)
+@main_bp.route('/upload/bulk', methods=['POST'])
+@auth_route
+def upload_bulk():
+    files = request.files.getlist('files')
+    if not files:
+        return 'No files part in the request', 400
 
-    # business metric
-    metrics.PDF_UPLOAD_TOTAL.labels(
-        status="success" if response else "error"
-    ).inc()
+    mode = request.form.get('mode', UPDATE)
+    if mode not in UPLOAD_MODES:
+        return jsonify({"error": f"mode must be one of {list(UPLOAD_MODES)}"}), 400
 
-    logger.info(json.dumps(response, indent=4))
+    # one manifest entry per PDF, in the order of the request (archives in entry order)
+    manifest = []
+    accepted = []
+    filenames = set()
 
-    return jsonify({"content": response}), 200
+    def add(filename, stream):
+        if filename in filenames:
+            # the DB service identifies documents by file name
+            manifest.append({"filename": filename, "status": "rejected", "error": "duplicate file name"})
+            return
+        filenames.add(filename)
+        entry = {"filename": filename, "job_id": uuid.uuid4().hex}
+        manifest.append(entry)
+        accepted.append((entry, stream))
+
+    # bytes extracted from the archives so far, bounded by BULK_MAX_TOTAL_BYTES
+    extracted = 0
+
+    for file in files:
+        if is_zip(file.filename or "", file.mimetype):
+            try:
+                entries = extract_pdfs(file.stream, Config.MAX_CONTENT_LENGTH, Config.BULK_MAX_TOTAL_BYTES - extracted)
+                for filename, stream, error in entries:
+                    if error:
+                        manifest.append({"filename": filename, "status": "rejected", "error": error})
+                    else:
+                        extracted += stream.size
+                        add(filename, request.track_upload(stream))
+                    if len(accepted) > Config.BULK_MAX_FILES:
+                        break
+            except zipfile.BadZipFile as e:
+                manifest.append({"filename": file.filename, "status": "rejected", "error": f"invalid archive: {e}"})
+            except ArchiveTooLargeError as e:
+                # nothing of the request is kept, the files extracted so far included
+                request.discard_uploads()
+                return jsonify({"error": f"{file.filename}: {e} (at most {Config.BULK_MAX_TOTAL_BYTES} bytes extracted per bulk upload)"}), 413
+        elif is_pdf(file.filename or "", file.mimetype):
+            add(file.filename, file.stream)
+        else:
+            manifest.append({"filename": file.filename, "status": "rejected", "error": "not a PDF or ZIP file"})
+
+        if len(accepted) > Config.BULK_MAX_FILES:
+            request.discard_uploads()
+            return jsonify({"error": f"At most {Config.BULK_MAX_FILES} files per bulk upload"}), 413
+
+    metrics.BULK_UPLOAD_FILES_TOTAL.labels(status="rejected").inc(len(manifest) - len(accepted))
+    if not accepted:
+        return jsonify({"error": "No PDF files in the request", "files": manifest}), 400
+
+    id = g.user.get('username', 'User')
+    jobs = []
+    for entry, stream in accepted:
+        path = stream.persist(job_upload_path(entry["job_id"]))
+        jobs.append({
+            "filename": entry["filename"], "path": str(path), "job_id": entry["job_id"],
+            "file_hash": stream.sha256, "size": stream.size,
+        })
+
+    try:
+        batch_id, queued = job_queue.submit_bulk(id, jobs, mode)
+    except QueueFullError as e:
+        for job in jobs:
+            Path(job["path"]).unlink(missing_ok=True)
+        metrics.BULK_UPLOAD_FILES_TOTAL.labels(status="rejected").inc(len(jobs))
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "60"}
+
+    for (entry, _), job in zip(accepted, queued):
+        entry["status"] = job["status"]
+    metrics.BULK_UPLOAD_FILES_TOTAL.labels(status="accepted").inc(len(queued))
+    logger.info("Queued bulk ingestion %s of %d files for %s", batch_id, len(queued), id)
+
+    return jsonify({"batch_id": batch_id, "files": manifest}), 202
+
+@main_bp.route('/jobs/batches/<batch_id>', methods=['GET'])
+@auth_route
+def get_batch(batch_id):
+    id = g.user.get('username', 'User')
+
+    jobs = job_queue.store.list_by_batch(batch_id)
+    if not jobs or jobs[0]["user"] != id:
+        return jsonify({"error": "Batch not found"}), 404
+
+    statuses = [job["status"] for job in jobs]
+    return jsonify({
+        "batch_id": batch_id,
+        "counts": {status: statuses.count(status) for status in set(statuses)},
+        "files": [_format_job(job) for job in jobs],
+    }), 200
+
+@main_bp.route('/jobs', methods=['GET'])
+@auth_route
+def list_jobs():
+    id = g.user.get('username', 'User')
+
+    return jsonify({"jobs": [_format_job(job) for job in job_queue.store.list_by_user(id)]}), 200
+
+@main_bp.route('/jobs/<job_id>', methods=['GET'])
+@auth_route
+def get_job(job_id):
+    id = g.user.get('username', 'User')
+
+    job = job_queue.store.get(job_id)
+    if not job or job["user"] != id:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(_format_job(job)), 200
+
+def _format_job(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "pages_done": job["pages_done"],
+        "pages_total": job["pages_total"],
+        "error": job["error"],
+        "content": job["result"],
+    }
 
 @main_bp.route('/delete', methods=['POST'])
 @auth_route
@@ -60,6 +202,10 @@ def delete():
         return "No filename provided", 400
 
     response = db_delete(id, filename)
+    if response:
+        invalidate_user(id)
+        forget_document(id, filename)
+        remove_document(id, filename)
 
     metrics.PDF_DELETE_TOTAL.labels(
         status="success" if response else "error"
@@ -75,7 +221,7 @@ def search():
     id = g.user.get('username', 'User')
     query = request.form.get('query')
 
-    response = db_search(id, query)
+    response = search_chunks(id, query, db_search)
 
     metrics.SEARCH_TOTAL.labels(
         status="success" if response else "error"
@@ -106,3 +252,48 @@ def get_profile():
     id = g.user.get('username', 'User')
 
     return jsonify({ "username": id }), 200
+
+@main_bp.route('/debug/profile', methods=['POST'])
+@admin_route
+def profile_worker():
+    """
+    Sample the threads of the worker serving this request for a time window. Only covers
+    request handling: ingestion jobs run in other processes (the ingestion pool, or the
+    ingestion runner) - profile them per upload with the X-Profile header.
+    """
+    try:
+        seconds = float(request.values.get('seconds', 10))
+    except ValueError:
+        return jsonify({"error": "seconds must be a number"}), 400
+    if not 0 < seconds <= Config.PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be in (0, {Config.PROFILE_MAX_SECONDS:g}]"}), 400
+
+    format = request.values.get('format', 'collapsed')
+    if format not in ('collapsed', 'text'):
+        return jsonify({"error": "format must be 'collapsed' or 'text'"}), 400
+
+    try:
+        profiler = profiling.profile_window(seconds)
+    except profiling.ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+
+    mimetype, extension = profiling.FORMATS[format]
+    return Response(
+        profiler.render(format),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=worker-{os.getpid()}.{extension}"},
+    )
+
+@main_bp.route('/debug/profile/jobs/<job_id>', methods=['GET'])
+@admin_route
+def get_job_profile(job_id):
+    job = job_queue.store.get(job_id)
+    if not job or not job["profile"]:
+        return jsonify({"error": "No profile requested for this job"}), 404
+
+    format = profiling.DEFAULT_FORMATS[job["profile"]]
+    path = profiling.get_job_profile_path(job_id, format)
+    if not path.exists():
+        return jsonify({"error": "The job has not finished yet", "status": job["status"]}), 409
+
+    return send_file(path, mimetype=profiling.FORMATS[format][0], as_attachment=True, download_name=path.name)
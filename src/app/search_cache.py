@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+from config import Config
+from app import metrics
+import app.logger as logger
+
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', query or '')).strip()
+
+class UserGenerations:
+    """
+    A counter per user, bumped whenever the user's documents change, in a SQLite file
+    shared by all processes of the host (the jobs database by default). Cached results
+    remember the generation they were computed in, so an upload or a deletion handled by
+    one worker also invalidates what the other workers cached. Replicas on other hosts
+    need a shared SearchCacheBackend (or a shared jobs database).
+    """
+    def __init__(self, db_path: str | os.PathLike | None = None) -> None:
+        self.db_path = str(db_path or Config.JOBS_DB)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_generations (user TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per thread, opened again in a forked child
+        conn, pid = getattr(self._local, "conn", None), getattr(self._local, "pid", None)
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, user: str) -> int:
+        row = self._connect().execute("SELECT generation FROM search_generations WHERE user = ?", (user,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user: str) -> None:
+        self._connect().execute(
+            "INSERT INTO search_generations (user, generation) VALUES (?, 1) "
+            "ON CONFLICT (user) DO UPDATE SET generation = generation + 1",
+            (user,),
+        )
+
+class SearchCacheBackend(ABC):
+    """
+    Storage of search results per (user, normalized query). Implement this to share the
+    cache between replicas (e.g. on top of Redis); LocalSearchCache is the default.
+    """
+    @abstractmethod
+    def get(self, user: str, query: str, generation: int = 0) -> tuple[Any, float] | None:
+        """
+        The cached result and the upstream latency it took to compute, None on a miss
+        (or if it was cached in another generation of the user's documents).
+        """
+        pass
+
+    @abstractmethod
+    def set(self, user: str, query: str, result: Any, latency: float, generation: int = 0) -> None:
+        pass
+
+    @abstractmethod
+    def invalidate_user(self, user: str) -> None:
+        pass
+
+class LocalSearchCache(SearchCacheBackend):
+    """
+    In-process LRU cache with a TTL, bounded by the (JSON) size of the cached results.
+    Entries of an older generation of the user's documents are misses.
+    """
+    def __init__(self, ttl: float, max_bytes: int) -> None:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], tuple[float, int, Any, float, int]] = OrderedDict()
+        self._user_keys: dict[str, set[tuple[str, str]]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, user: str, query: str, generation: int = 0) -> tuple[Any, float] | None:
+        key = (user, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, _, result, latency, entry_generation = entry
+            if expires_at <= time.monotonic() or entry_generation != generation:
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return result, latency
+
+    def set(self, user: str, query: str, result: Any, latency: float, generation: int = 0) -> None:
+        size = len(json.dumps(result, ensure_ascii=False))
+        if size > self.max_bytes:
+            return
+
+        key = (user, query)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, result, latency, generation)
+            self._user_keys.setdefault(user, set()).add(key)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+            metrics.SEARCH_CACHE_BYTES.set(self._bytes)
+
+    def invalidate_user(self, user: str) -> None:
+        with self._lock:
+            for key in list(self._user_keys.get(user, ())):
+                self._remove(key)
+            metrics.SEARCH_CACHE_BYTES.set(self._bytes)
+
+    def _remove(self, key: tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        self._bytes -= entry[1]
+        user_keys = self._user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[0]]
+
+_backend = None
+_generations = None
+
+def get_generations() -> UserGenerations:
+    global _generations
+    if _generations is None:
+        _generations = UserGenerations()
+    return _generations
+
+def _current_generation(user: str) -> int | None:
+    try:
+        return get_generations().get(user)
+    except sqlite3.Error as e:
+        # without the shared generation a cached result may be stale, the upstream answers
+        logger.warning("Search cache generations unavailable, not caching: %s", e)
+        return None
+
+def get_search_cache() -> SearchCacheBackend | None:
+    global _backend
+    if not Config.SEARCH_CACHE_ENABLED:
+        return None
+
+    if _backend is None:
+        _backend = LocalSearchCache(Config.SEARCH_CACHE_TTL, Config.SEARCH_CACHE_MAX_BYTES)
+    return _backend
+
+def set_search_cache(backend: SearchCacheBackend | None) -> None:
+    """
+    Plug in a different (e.g. shared) backend.
+    """
+    global _backend
+    _backend = backend
+
+def cached_search(user: str, query: str, search) -> Any:
+    """
+    Return the cached result of search(user, query), or call it and cache a successful result.
+    """
+    cache = get_search_cache()
+    # read before the upstream call: a change meanwhile makes the cached result a miss
+    generation = _current_generation(user) if cache is not None else None
+    if generation is None:
+        return search(user, query)
+
+    normalized = normalize_query(query)
+    cached = cache.get(user, normalized, generation)
+    if cached is not None:
+        result, latency = cached
+        metrics.SEARCH_CACHE_TOTAL.labels(result="hit").inc()
+        metrics.SEARCH_CACHE_SAVED_SECONDS.inc(latency)
+        return result
+
+    metrics.SEARCH_CACHE_TOTAL.labels(result="miss").inc()
+    start = time.perf_counter()
+    result = search(user, query)
+    if result:
+        cache.set(user, normalized, result, time.perf_counter() - start, generation)
+
+    return result
+
+async def cached_search_async(user: str, query: str, search) -> Any:
+    """
+    cached_search for a coroutine search function. The generation is read in a thread, a
+    SQLite read must not stall the event loop.
+    """
+    cache = get_search_cache()
+    # read before the upstream call: a change meanwhile makes the cached result a miss
+    generation = await asyncio.to_thread(_current_generation, user) if cache is not None else None
+    if generation is None:
+        return await search(user, query)
+
+    normalized = normalize_query(query)
+    cached = cache.get(user, normalized, generation)
+    if cached is not None:
+        result, latency = cached
+        metrics.SEARCH_CACHE_TOTAL.labels(result="hit").inc()
+        metrics.SEARCH_CACHE_SAVED_SECONDS.inc(latency)
+        return result
+
+    metrics.SEARCH_CACHE_TOTAL.labels(result="miss").inc()
+    start = time.perf_counter()
+    result = await search(user, query)
+    if result:
+        cache.set(user, normalized, result, time.perf_counter() - start, generation)
+
+    return result
+
+def invalidate_user(user: str) -> None:
+    """
+    Drop the user's cached results in every process of the host (through the shared
+    generation) and in this one.
+    """
+    cache = get_search_cache()
+    if cache is None:
+        return
+
+    try:
+        get_generations().bump(user)
+    except sqlite3.Error as e:
+        logger.error("Could not invalidate the cached searches of %s in other workers: %s", user, e)
+    cache.invalidate_user(user)
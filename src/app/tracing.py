@@ -0,0 +1,116 @@
+import os
+from contextlib import contextmanager
+from typing import Any, Iterator
+from config import Config
+import app.logger as logger
+
+try:
+    from opentelemetry import context, propagate, trace
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # tracing is optional
+    trace = None
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict[str, Any]) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+_tracer = None
+_configured_pid = None
+
+def enabled() -> bool:
+    return Config.TRACING_ENABLED and trace is not None
+
+def get_tracer():
+    """
+    The tracer of this process. The SDK is set up on first use in every process (web
+    worker or ingestion worker), exporting over OTLP as configured by the standard
+    OTEL_* environment variables, if the SDK and the exporter are installed.
+    """
+    global _tracer, _configured_pid
+    if _configured_pid != os.getpid():
+        _configured_pid = os.getpid()
+        _configure_sdk()
+        _tracer = trace.get_tracer("business-logic")
+    return _tracer
+
+def _configure_sdk() -> None:
+    if not isinstance(trace.get_tracer_provider(), trace.ProxyTracerProvider):
+        # already configured, e.g. by opentelemetry-instrument
+        return
+
+    try:
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError as e:
+        logger.warning("Tracing is enabled but the OpenTelemetry SDK is not installed: %s", e)
+        return
+
+    resource = Resource.create({SERVICE_NAME: os.environ.get("OTEL_SERVICE_NAME", "business-logic")})
+    provider = TracerProvider(resource=resource)
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    """
+    Child span of the current span, a no-op when tracing is disabled.
+    """
+    if not enabled():
+        yield NOOP_SPAN
+        return
+
+    with get_tracer().start_as_current_span(name, attributes=_clean(attributes)) as current:
+        yield current
+
+def start_span(name: str, carrier: dict | None = None, **attributes) -> tuple[Any, Any]:
+    """
+    Start a span and make it current until end_span() - for spans that begin and end in
+    different callbacks (request hooks). A carrier from inject() continues a trace started
+    in another process.
+    """
+    if not enabled():
+        return NOOP_SPAN, None
+
+    parent = propagate.extract(carrier) if carrier else None
+    current = get_tracer().start_span(name, context=parent, attributes=_clean(attributes))
+    token = context.attach(trace.set_span_in_context(current))
+    return current, token
+
+def end_span(current: Any, token: Any, error: BaseException | None = None) -> None:
+    if current is NOOP_SPAN:
+        return
+
+    if error is not None:
+        current.record_exception(error)
+        current.set_status(Status(StatusCode.ERROR, str(error)))
+    current.end()
+    if token is not None:
+        context.detach(token)
+
+def inject() -> dict[str, str] | None:
+    """
+    Context of the current span, to be passed to another process (e.g. with a job).
+    """
+    if not enabled():
+        return None
+
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier or None
+
+def set_attributes(current: Any, **attributes) -> None:
+    current.set_attributes(_clean(attributes))
+
+def _clean(attributes: dict[str, Any]) -> dict[str, Any]:
+    # OpenTelemetry attribute names are dotted, values cannot be None
+    return {key.replace("__", "."): value for key, value in attributes.items() if value is not None}
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator
+from flask import Request
+from config import Config
+
+class HashingFile:
+    """
+    Uniquely named file in the upload directory that hashes (SHA-256) the data while
+    the multipart parser writes it.
+    """
+    def __init__(self, directory: str | Path) -> None:
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False)
+        self.path = Path(self._file.name)
+        self.persisted = False
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def write(self, data: bytes) -> int:
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # seek, read, close, ... of the underlying file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def persist(self, path: str | Path) -> Path:
+        """
+        Move the received file to its final location, it is no longer cleaned up with the request.
+        """
+        self._file.flush()
+        os.replace(self.path, path)
+        self.path = Path(path)
+        self.persisted = True
+        return self.path
+
+    def discard(self) -> None:
+        self._file.close()
+        if not self.persisted:
+            self.path.unlink(missing_ok=True)
+
+class UploadRequest(Request):
+    """
+    Streams uploaded files straight into the upload directory (instead of memory or an
+    anonymous temp file), hashing them on the way. Files that were not persisted by the
+    view are removed when the request ends, whatever happened while handling it.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingFile(Config.UPLOAD_DIR)
+        self.__dict__.setdefault("_upload_streams", []).append(stream)
+        return stream
+
+    def track_upload(self, stream: HashingFile) -> HashingFile:
+        """
+        Clean up a file created by the view (e.g. extracted from an archive) like the uploads.
+        """
+        self.__dict__.setdefault("_upload_streams", []).append(stream)
+        return stream
+
+    def discard_uploads(self) -> None:
+        for stream in self.__dict__.get("_upload_streams", []):
+            stream.discard()
+
+def is_pdf(filename: str, mimetype: str | None = None) -> bool:
+    return filename.lower().endswith(".pdf") or mimetype == "application/pdf"
+
+def is_zip(filename: str, mimetype: str | None = None) -> bool:
+    return filename.lower().endswith(".zip") or mimetype in ("application/zip", "application/x-zip-compressed")
+
+class ArchiveTooLargeError(ValueError):
+    pass
+
+def extract_pdfs(
+    archive: BinaryIO, max_bytes: int, max_total_bytes: int, max_ratio: float | None = None
+) -> Iterator[tuple[str, HashingFile | None, str | None]]:
+    """
+    PDFs of a ZIP archive, extracted one at a time into the upload directory (hashed on the
+    way, like the uploads). Yields (filename, file, None), or (filename, None, error) for the
+    entries that are skipped. Other entries, directories and macOS metadata are ignored.
+    Raises ArchiveTooLargeError before writing anything if the declared sizes of the PDFs
+    add up to more than max_total_bytes or to more than max_ratio times their compressed
+    size, and while extracting once more than max_total_bytes were written.
+    """
+    max_ratio = Config.BULK_MAX_COMPRESSION_RATIO if max_ratio is None else max_ratio
+    with zipfile.ZipFile(archive) as entries:
+        pdfs = [
+            info for info in entries.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/") and is_pdf(posixpath.basename(info.filename))
+        ]
+        extracted = [info for info in pdfs if not info.flag_bits & 0x1 and info.file_size <= max_bytes]
+        declared = sum(info.file_size for info in extracted)
+        if declared > max_total_bytes:
+            raise ArchiveTooLargeError(f"its PDFs add up to more than {max_total_bytes} bytes")
+        if declared > max_ratio * max(sum(info.compress_size for info in extracted), 1):
+            raise ArchiveTooLargeError(f"its PDFs expand more than {max_ratio:g} times")
+
+        total = 0
+        for info in pdfs:
+            filename = posixpath.basename(info.filename)
+            if info.flag_bits & 0x1:
+                yield filename, None, "encrypted archive entry"
+                continue
+            # the entry is never decompressed beyond its declared size
+            if info.file_size > max_bytes:
+                yield filename, None, f"larger than {max_bytes} bytes"
+                continue
+
+            file = HashingFile(Config.UPLOAD_DIR)
+            try:
+                with entries.open(info) as entry:
+                    shutil.copyfileobj(entry, file, 1024 * 1024)
+            except (zipfile.BadZipFile, zlib.error, OSError, EOFError) as e:
+                file.discard()
+                yield filename, None, f"could not be extracted: {e}"
+                continue
+
+            total += file.size
+            if total > max_total_bytes:
+                file.discard()
+                raise ArchiveTooLargeError(f"its PDFs add up to more than {max_total_bytes} bytes")
+
+            yield filename, file, None
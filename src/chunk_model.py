@@ -0,0 +1,170 @@
+from collections.abc import Mapping
+from sys import intern
+from typing import Any, Iterable, Iterator
+
+def _intern(value: str | None) -> str | None:
+    return intern(value) if isinstance(value, str) else value
+
+class ChunkSource:
+    """
+    What the chunks of a document share: the document fields (url, type, filename),
+    interned, and the text of its tables, stored once per table_id.
+    """
+    __slots__ = ("url", "type", "filename", "tables")
+
+    def __init__(self, url: str | None, type: str | None, filename: str | None) -> None:
+        self.url = _intern(url)
+        self.type = _intern(type)
+        self.filename = _intern(filename)
+        # table_id -> markdown text of the table
+        self.tables = {}
+
+class Chunk(Mapping):
+    """
+    A chunk of a document. Reads like the chunk dict of the bulk format - id, text, url,
+    type, filename, page_number, table_id, table_text; _index and _id first once it is
+    formatted for an index; extra fields (e.g. the embedding) last - but only keeps its
+    own fields: the document fields and the table text are looked up in its source when
+    read, i.e. when the chunk is serialized.
+    """
+    __slots__ = ("id", "text", "page_number", "table_id", "source", "index", "extra")
+
+    FIELDS = ("id", "text", "url", "type", "filename", "page_number", "table_id", "table_text")
+    _OWN_FIELDS = frozenset(("id", "text", "page_number", "table_id"))
+    _SOURCE_FIELDS = frozenset(("url", "type", "filename"))
+
+    def __init__(
+        self,
+        id: str | None,
+        text: str,
+        page_number: int | None,
+        table_id: str | None,
+        source: ChunkSource,
+        index: str | None = None,
+        extra: dict[str, Any] | None = None,
+    ) -> None:
+        self.id = id
+        self.text = text
+        self.page_number = page_number
+        self.table_id = table_id
+        self.source = source
+        self.index = index
+        self.extra = extra
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping, source: ChunkSource) -> "Chunk":
+        """
+        A chunk of the source with the own fields of a chunk dict (e.g. read back from the
+        ingestion cache); its table text is added to the source if not known yet.
+        """
+        table_id = mapping.get("table_id")
+        if table_id is not None and mapping.get("table_text") is not None:
+            source.tables.setdefault(table_id, mapping["table_text"])
+
+        extra = {
+            key: value for key, value in mapping.items()
+            if key not in cls.FIELDS and key not in ("_index", "_id")
+        }
+        return cls(mapping.get("id"), mapping["text"], mapping.get("page_number"), table_id, source, extra=extra or None)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._OWN_FIELDS:
+            return getattr(self, key)
+        if key in self._SOURCE_FIELDS:
+            return getattr(self.source, key)
+        if key == "table_text":
+            return self.source.tables.get(self.table_id) if self.table_id is not None else None
+        if self.index is not None and key in ("_index", "_id"):
+            return self.index if key == "_index" else self.id
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        if self.index is not None:
+            yield "_index"
+            yield "_id"
+        yield from self.FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return (2 if self.index is not None else 0) + len(self.FIELDS) + len(self.extra or ())
+
+    def __repr__(self) -> str:
+        return f"Chunk(id={self.id!r}, page_number={self.page_number!r}, table_id={self.table_id!r}, text={self.text[:40]!r})"
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        The chunk expanded into a dict (like dict(chunk), faster).
+        """
+        data = {"_index": self.index, "_id": self.id} if self.index is not None else {}
+        source = self.source
+        data.update(
+            id=self.id,
+            text=self.text,
+            url=source.url,
+            type=source.type,
+            filename=source.filename,
+            page_number=self.page_number,
+            table_id=self.table_id,
+            table_text=source.tables.get(self.table_id) if self.table_id is not None else None,
+        )
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def _copy(self, index: str | None, extra: dict[str, Any] | None) -> "Chunk":
+        return Chunk(self.id, self.text, self.page_number, self.table_id, self.source, index, extra)
+
+    def for_index(self, index: str) -> "Chunk":
+        """
+        The chunk in the bulk format of an index (with _index and _id).
+        """
+        return self._copy(index, self.extra)
+
+    def with_fields(self, **fields: Any) -> "Chunk":
+        """
+        A copy with extra fields, the chunk itself is left unchanged.
+        """
+        return self._copy(self.index, (self.extra or {}) | fields)
+
+def to_json(value: Any) -> Any:
+    """
+    json.dumps default: chunks (and other mappings) are expanded into dicts while they
+    are serialized.
+    """
+    if isinstance(value, Chunk):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def compact(chunk: Mapping, tables_written: set[str]) -> dict[str, Any]:
+    """
+    The chunk as a dict, with the table text only on the first chunk of every table
+    (tables_written collects the tables seen). Chunk.from_mapping reads the chunks back
+    in order.
+    """
+    data = chunk.to_dict() if isinstance(chunk, Chunk) else dict(chunk)
+    table_id = data.get("table_id")
+    if table_id is not None:
+        if table_id in tables_written:
+            data.pop("table_text", None)
+        tables_written.add(table_id)
+    return data
+
+def share_tables(documents: Iterable[Mapping]) -> tuple[list[dict[str, Any]], dict[str, str]]:
+    """
+    The documents without their table text, and the text of every table they reference,
+    for a bulk request that carries each table once (the receiver puts it back by table_id).
+    """
+    contents = []
+    tables = {}
+    for document in documents:
+        data = document.to_dict() if isinstance(document, Chunk) else dict(document)
+        table_text = data.pop("table_text", None)
+        if data.get("table_id") is not None and table_text is not None:
+            tables[data["table_id"]] = table_text
+        contents.append(data)
+    return contents, tables
@@ -5,11 +5,140 @@ class Config:
     SRC_DIR = Path(__file__).resolve().parent
     UPLOAD_DIR = SRC_DIR.parent / "uploads"
     LOGS_DIR = SRC_DIR.parent / "logs"
-    DEBUG = True
+    DEBUG = os.environ.get('DEBUG', 'true').lower() == 'true'
     CORS_HEADERS = 'Content-Type'
+    # uploads are streamed to disk, so the limit is not bound by memory
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_BYTES', 256 * 1024 * 1024))
 
     SPACY_MODEL = "ro_core_news_lg"
     MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    # sentence segmentation: stream all elements through nlp.pipe, "parser" or "senter" boundaries
+    SPACY_BATCH_SENTENCIZE = os.environ.get('SPACY_BATCH_SENTENCIZE', 'true').lower() == 'true'
+    SPACY_SENTENCE_COMPONENT = os.environ.get('SPACY_SENTENCE_COMPONENT', 'parser')
+    SPACY_BATCH_SIZE = int(os.environ.get('SPACY_BATCH_SIZE', '64'))
+    SPACY_N_PROCESS = int(os.environ.get('SPACY_N_PROCESS', '1'))
+    # sentences per batched tokenizer call while chunking
+    TOKENIZE_BATCH_SIZE = int(os.environ.get('TOKENIZE_BATCH_SIZE', '256'))
+    # bump whenever a change to the pipeline changes the produced chunks
+    PIPELINE_VERSION = "5"
+    # load the models when the app starts instead of on the first upload
+    PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', 'true').lower() == 'true'
+
+    # keep-alive connection pools to the db and auth services
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '20'))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '30'))
+    DB_READ_TIMEOUT = float(os.environ.get('DB_READ_TIMEOUT', '120'))
+    HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+    HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', '0.2'))
+
+    # token -> userinfo cache in front of the auth service, 0 disables it
+    AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+    AUTH_NEGATIVE_CACHE_TTL = float(os.environ.get('AUTH_NEGATIVE_CACHE_TTL', '10'))
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+
+    # search results per (user, query), invalidated by the user's uploads and deletions
+    SEARCH_CACHE_ENABLED = os.environ.get('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+    SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', '300'))
+    SEARCH_CACHE_MAX_BYTES = int(os.environ.get('SEARCH_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+    # local BM25 index of the chunks uploaded from now on, per user; search modes: fallback
+    # (when the upstream fails or takes longer than LEXICAL_UPSTREAM_TIMEOUT), fast (local
+    # first), hybrid (both, fused)
+    LEXICAL_INDEX_ENABLED = os.environ.get('LEXICAL_INDEX_ENABLED', 'false').lower() == 'true'
+    LEXICAL_INDEX_DIR = Path(os.environ.get('LEXICAL_INDEX_DIR', SRC_DIR.parent / "lexical_index"))
+    LEXICAL_INDEX_MAX_SEGMENTS = int(os.environ.get('LEXICAL_INDEX_MAX_SEGMENTS', '16'))
+    LEXICAL_INDEX_OPEN_USERS = int(os.environ.get('LEXICAL_INDEX_OPEN_USERS', '256'))
+    LEXICAL_SEARCH_MODE = os.environ.get('LEXICAL_SEARCH_MODE', 'fallback')
+    LEXICAL_SEARCH_SIZE = int(os.environ.get('LEXICAL_SEARCH_SIZE', '10'))
+    LEXICAL_UPSTREAM_TIMEOUT = float(os.environ.get('LEXICAL_UPSTREAM_TIMEOUT', '2'))
+
+    # background ingestion
+    JOBS_DB = Path(os.environ.get('JOBS_DB', SRC_DIR.parent / "jobs.sqlite3"))
+    INGESTION_WORKERS = int(os.environ.get('INGESTION_WORKERS', '2'))
+    INGESTION_QUEUE_SIZE = int(os.environ.get('INGESTION_QUEUE_SIZE', '32'))
+    # inline: every process serving requests runs the jobs it queues in its own pool;
+    # process: one dedicated ingestion runner per jobs database runs all of them (the
+    # default of the prefork server, whose web workers are recycled), polling for new jobs
+    INGESTION_RUNNER = os.environ.get('INGESTION_RUNNER', 'inline')
+    INGESTION_POLL_INTERVAL = float(os.environ.get('INGESTION_POLL_INTERVAL', '0.5'))
+    # bulk uploads: files per request (also counting ZIP entries), files queued from bulk
+    # uploads, files per shard run by one worker
+    BULK_MAX_FILES = int(os.environ.get('BULK_MAX_FILES', '1000'))
+    # bytes extracted from the ZIP archives of one bulk upload, and how much more than their
+    # compressed size the PDFs of an archive may take (checked before extracting anything)
+    BULK_MAX_TOTAL_BYTES = int(os.environ.get('BULK_MAX_TOTAL_BYTES', 1024 * 1024 * 1024))
+    BULK_MAX_COMPRESSION_RATIO = float(os.environ.get('BULK_MAX_COMPRESSION_RATIO', '100'))
+    BULK_QUEUE_SIZE = int(os.environ.get('BULK_QUEUE_SIZE', '5000'))
+    BULK_SHARD_FILES = int(os.environ.get('BULK_SHARD_FILES', '50'))
+
+    # chunks per bulk request sent to the DB service while the document is being chunked
+    DB_UPLOAD_BATCH_SIZE = int(os.environ.get('DB_UPLOAD_BATCH_SIZE', '200'))
+    DB_UPLOAD_RETRIES = int(os.environ.get('DB_UPLOAD_RETRIES', '3'))
+    # send the text of a table once per bulk request ("tables": {table_id: text}) instead of
+    # with every chunk of the table; the db-service must put it back
+    DB_UPLOAD_SHARED_TABLES = os.environ.get('DB_UPLOAD_SHARED_TABLES', 'false').lower() == 'true'
+    # wire format of the bulk requests: json (what the db-service accepts today) or, opt-in
+    # for a db-service that reads it, ndjson (streamed line by line while encoded, with
+    # DB_UPLOAD_COMPRESSION identity, gzip or zstd - zstd needs the zstandard package); a
+    # db-service that rejects a format gets the next one, down to plain json
+    DB_UPLOAD_FORMAT = os.environ.get('DB_UPLOAD_FORMAT', 'json')
+    DB_UPLOAD_COMPRESSION = os.environ.get('DB_UPLOAD_COMPRESSION', 'identity')
+    DB_UPLOAD_COMPRESSION_LEVEL = int(os.environ['DB_UPLOAD_COMPRESSION_LEVEL']) if os.environ.get('DB_UPLOAD_COMPRESSION_LEVEL') else None
+
+    # page-parallel partitioning, 1 worker = partition the whole file at once. The processes
+    # are per ingestion worker, so INGESTION_WORKERS x PARTITION_WORKERS of them run at most;
+    # capped to the cores shared out between the ingestion workers
+    PARTITION_WORKERS = min(
+        int(os.environ.get('PARTITION_WORKERS', '1')),
+        max((os.cpu_count() or 1) // max(INGESTION_WORKERS, 1), 1),
+    )
+    PARTITION_PAGES_PER_SHARD = int(os.environ.get('PARTITION_PAGES_PER_SHARD', '8'))
+
+    # per-page strategy: fast text extraction unless the page needs OCR or layout detection
+    ADAPTIVE_STRATEGY = os.environ.get('ADAPTIVE_STRATEGY', 'true').lower() == 'true'
+    OCR_MIN_TEXT_CHARS = int(os.environ.get('OCR_MIN_TEXT_CHARS', '20'))
+    HI_RES_MIN_IMAGE_AREA = float(os.environ.get('HI_RES_MIN_IMAGE_AREA', '0.05'))
+
+    # chunks of already processed files, keyed by content hash
+    INGESTION_CACHE_ENABLED = os.environ.get('INGESTION_CACHE_ENABLED', 'true').lower() == 'true'
+    INGESTION_CACHE_DIR = Path(os.environ.get('INGESTION_CACHE_DIR', SRC_DIR.parent / "cache"))
+    INGESTION_CACHE_MAX_BYTES = int(os.environ.get('INGESTION_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # embeddings attached to the chunks before the upload (Config.MODEL_NAME on CPU), backends:
+    # torch, torch-int8, onnx, onnx-int8 (need onnxruntime); 0 threads = cores / ingestion workers
+    EMBEDDING_ENABLED = os.environ.get('EMBEDDING_ENABLED', 'false').lower() == 'true'
+    EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', '32'))
+    # chunks sorted by length together, so batches need little padding
+    EMBEDDING_WINDOW = int(os.environ.get('EMBEDDING_WINDOW', '256'))
+    # the max_seq_length sentence-transformers uses for the model
+    EMBEDDING_MAX_TOKENS = int(os.environ.get('EMBEDDING_MAX_TOKENS', '128'))
+    EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', '0'))
+    EMBEDDING_FIELD = os.environ.get('EMBEDDING_FIELD', 'embedding')
+    EMBEDDING_ONNX_DIR = Path(os.environ.get('EMBEDDING_ONNX_DIR', SRC_DIR.parent / "models"))
+
+    # boilerplate removal between cleanup and chunking (off, collapse = keep the first copy,
+    # skip = drop every copy): texts and sentences repeated on DEDUP_MIN_PAGES pages, texts
+    # exactly or with a MinHash similarity of DEDUP_SIMILARITY; off until validated on real data
+    DEDUP_POLICY = os.environ.get('DEDUP_POLICY', 'off')
+    DEDUP_MIN_PAGES = int(os.environ.get('DEDUP_MIN_PAGES', '3'))
+    DEDUP_SIMILARITY = float(os.environ.get('DEDUP_SIMILARITY', '0.8'))
+    DEDUP_MIN_CHARS = int(os.environ.get('DEDUP_MIN_CHARS', '25'))
+    # also texts found in DEDUP_MIN_DOCUMENTS other documents of the user
+    DEDUP_ACROSS_DOCUMENTS = os.environ.get('DEDUP_ACROSS_DOCUMENTS', 'false').lower() == 'true'
+    DEDUP_MIN_DOCUMENTS = int(os.environ.get('DEDUP_MIN_DOCUMENTS', '3'))
+    DEDUP_DB = Path(os.environ.get('DEDUP_DB', SRC_DIR.parent / "fingerprints.sqlite3"))
+
+    # OpenTelemetry spans per request and ingestion job (needs opentelemetry-sdk and the OTLP
+    # exporter, configured through the standard OTEL_* variables)
+    TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+
+    # usernames allowed to use the admin endpoints (on-demand profiling), comma separated
+    ADMIN_USERS = frozenset(filter(None, (user.strip() for user in os.environ.get('ADMIN_USERS', '').split(','))))
+    PROFILES_DIR = Path(os.environ.get('PROFILES_DIR', SRC_DIR.parent / "profiles"))
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '120'))
 
 Config.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 Config.LOGS_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,306 @@
+from hashlib import blake2b
+from itertools import islice
+from pathlib import Path
+from typing import Iterable
+import re
+import sqlite3
+import time
+import numpy as np
+from config import Config
+
+OFF = "off"
+# keep the first copy of a repeated text, drop the others
+COLLAPSE = "collapse"
+# drop every copy of a repeated text
+SKIP = "skip"
+POLICIES = (OFF, COLLAPSE, SKIP)
+
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+
+def normalize(text: str, mask_digits: bool = False) -> str:
+    """
+    Case and whitespace insensitive form of a text. Masking the digits makes page headers
+    and footers ("Pagina 3 din 12") of different pages identical.
+    """
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return _DIGITS.sub("#", text) if mask_digits else text
+
+def get_fingerprint(normalized: str) -> str:
+    return blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+class MinHasher:
+    """
+    MinHash signatures of the word n-grams of a text: the share of equal positions of two
+    signatures estimates the Jaccard similarity of the texts. Signatures are split into
+    bands for LSH, texts sharing a band are candidate near-duplicates.
+    """
+    def __init__(self, num_perm: int = 64, bands: int = 16, ngram: int = 3, seed: int = 1) -> None:
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits; a must be odd
+        self._a = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+
+    def signature(self, normalized: str) -> np.ndarray:
+        words = normalized.split()
+        shingles = {" ".join(words[i:i + self.ngram]) for i in range(max(len(words) - self.ngram + 1, 1))}
+        values = np.array(
+            [int.from_bytes(blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles],
+            dtype=np.uint64,
+        )
+        with np.errstate(over="ignore"):
+            hashes = (self._a[:, None] * values[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashes.min(axis=1)
+
+    def band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [
+            band.to_bytes(1, "little") + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+class FingerprintStore:
+    """
+    Fingerprints of the text elements of every user's documents (SQLite, shared by the
+    worker processes), to recognise the boilerplate of a user across documents.
+    """
+    def __init__(self, db_path: str | Path | None = None) -> None:
+        self.db_path = str(db_path or Config.DEDUP_DB)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    user        TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    filename    TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    PRIMARY KEY (user, fingerprint, filename)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_document ON fingerprints (user, filename)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def known(self, user: str, filename: str, fingerprints: Iterable[str], min_documents: int) -> set[str]:
+        """
+        The fingerprints found in at least min_documents other documents of the user.
+        """
+        known = set()
+        fingerprints = iter(set(fingerprints))
+        conn = self._connect()
+        try:
+            while batch := list(islice(fingerprints, 500)):
+                placeholders = ", ".join("?" for _ in batch)
+                rows = conn.execute(
+                    f"SELECT fingerprint FROM fingerprints WHERE user = ? AND filename != ? "
+                    f"AND fingerprint IN ({placeholders}) GROUP BY fingerprint HAVING COUNT(*) >= ?",
+                    (user, filename, *batch, min_documents),
+                ).fetchall()
+                known.update(row[0] for row in rows)
+        finally:
+            conn.close()
+        return known
+
+    def replace(self, user: str, filename: str, fingerprints: Iterable[str]) -> None:
+        """
+        Store the fingerprints of a (new version of a) document.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM fingerprints WHERE user = ? AND filename = ?", (user, filename))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO fingerprints (user, fingerprint, filename, created_at) VALUES (?, ?, ?, ?)",
+                    ((user, fingerprint, filename, now) for fingerprint in set(fingerprints)),
+                )
+        finally:
+            conn.close()
+
+    def forget(self, user: str, filename: str) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM fingerprints WHERE user = ? AND filename = ?", (user, filename))
+        finally:
+            conn.close()
+
+def forget_document(user: str, filename: str) -> None:
+    """
+    Drop the fingerprints of a deleted document, if they are collected at all.
+    """
+    if Config.DEDUP_ACROSS_DOCUMENTS:
+        FingerprintStore().forget(user, filename)
+
+class Deduplicator:
+    """
+    Finds the boilerplate of a document - letterheads, page headers and footers,
+    disclaimers - before it is chunked:
+
+    * elements whose text (exactly, after normalize(), or nearly, by MinHash/LSH) is
+      repeated on at least min_pages pages, or found in other documents of the user
+      (DEDUP_ACROSS_DOCUMENTS), are collapsed to their first copy or skipped (policy);
+    * sentences repeated on at least min_pages pages (counted by count_sentences first)
+      likewise.
+
+    Texts shorter than min_chars (except page headers and footers) are never considered.
+    Counts what was dropped.
+    """
+    # texts with fewer words are only compared exactly
+    MINHASH_MIN_WORDS = 8
+
+    def __init__(
+        self,
+        policy: str | None = None,
+        user: str | None = None,
+        filename: str | None = None,
+        store: FingerprintStore | None = None,
+    ) -> None:
+        self.policy = policy or Config.DEDUP_POLICY
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown deduplication policy {self.policy!r}, expected one of {POLICIES}")
+
+        self.user = user
+        self.filename = filename
+        if store is None and user and Config.DEDUP_ACROSS_DOCUMENTS:
+            store = FingerprintStore()
+        self.store = store
+        self.min_pages = Config.DEDUP_MIN_PAGES
+        self.min_chars = Config.DEDUP_MIN_CHARS
+        self.similarity = Config.DEDUP_SIMILARITY
+        self._minhasher = MinHasher()
+        # sentence fingerprint -> pages it is found on, see count_sentences
+        self._sentence_pages = {}
+        # repeated sentences whose first copy was kept
+        self._sentences_kept = set()
+        # level (element, sentence) -> [texts dropped, bytes dropped]
+        self.dropped = {"element": [0, 0], "sentence": [0, 0]}
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy != OFF
+
+    def select(self, texts: list[tuple[str, int | None, bool]]) -> list[bool]:
+        """
+        Whether to keep each (text, page_number, mask_digits) of a document, in order.
+        """
+        keep = [True] * len(texts)
+        if not self.enabled:
+            return keep
+
+        # fingerprint -> indices of the texts, in order
+        copies = {}
+        fingerprints = {}
+        for index, (text, _, mask_digits) in enumerate(texts):
+            normalized = normalize(text, mask_digits)
+            # page headers and footers are short, but boilerplate by definition
+            if mask_digits or len(normalized) >= self.min_chars:
+                fingerprints[index] = get_fingerprint(normalized)
+                copies.setdefault(fingerprints[index], []).append(index)
+
+        clusters = self._cluster(copies, texts)
+        known = self._get_known(copies)
+
+        for members in clusters:
+            pages = {texts[index][1] for index in members}
+            if len(pages) < self.min_pages and not any(fingerprints[index] in known for index in members):
+                continue
+
+            for index in members[1:] if self.policy == COLLAPSE else members:
+                keep[index] = False
+                self._count("element", texts[index][0])
+
+        if self.store is not None:
+            self.store.replace(self.user, self.filename, copies)
+
+        return keep
+
+    def _cluster(self, copies: dict[str, list[int]], texts: list[tuple[str, int | None, bool]]) -> list[list[int]]:
+        """
+        Group the exact copies that are near-duplicates of each other (union-find over the
+        fingerprints of the LSH candidates). Returns the indices of every group, in order.
+        """
+        parents = {fingerprint: fingerprint for fingerprint in copies}
+
+        def find(fingerprint: str) -> str:
+            while parents[fingerprint] != fingerprint:
+                parents[fingerprint] = parents[parents[fingerprint]]
+                fingerprint = parents[fingerprint]
+            return fingerprint
+
+        signatures = {}
+        buckets = {}
+        for fingerprint, indices in copies.items():
+            text, _, mask_digits = texts[indices[0]]
+            normalized = normalize(text, mask_digits)
+            if len(normalized.split()) < self.MINHASH_MIN_WORDS:
+                continue
+
+            signatures[fingerprint] = signature = self._minhasher.signature(normalized)
+            for key in self._minhasher.band_keys(signature):
+                for candidate in buckets.setdefault(key, []):
+                    if find(candidate) != find(fingerprint) and \
+                            MinHasher.similarity(signatures[candidate], signature) >= self.similarity:
+                        parents[find(fingerprint)] = find(candidate)
+                buckets[key].append(fingerprint)
+
+        clusters = {}
+        for fingerprint, indices in copies.items():
+            clusters.setdefault(find(fingerprint), []).extend(indices)
+        return [sorted(indices) for indices in clusters.values()]
+
+    def _get_known(self, copies: dict[str, list[int]]) -> set[str]:
+        if self.store is None:
+            return set()
+        return self.store.known(self.user, self.filename, copies, Config.DEDUP_MIN_DOCUMENTS)
+
+    def count_sentences(self, sentences: Iterable[tuple[str, int | None]]) -> None:
+        """
+        First pass over the (text, page_number) of every sentence of the document: the pages
+        each sentence is found on.
+        """
+        if not self.enabled:
+            return
+
+        for text, page_number in sentences:
+            normalized = normalize(text)
+            if len(normalized) >= self.min_chars:
+                self._sentence_pages.setdefault(get_fingerprint(normalized), set()).add(page_number)
+
+    def keep_sentence(self, text: str, page_number: int | None) -> bool:
+        """
+        False for a sentence found on at least min_pages pages of the document (except its
+        first copy when collapsing). Sentences that were not counted are kept.
+        """
+        if not self.enabled:
+            return True
+
+        normalized = normalize(text)
+        if len(normalized) < self.min_chars:
+            return True
+
+        fingerprint = get_fingerprint(normalized)
+        if len(self._sentence_pages.get(fingerprint, ())) < self.min_pages:
+            return True
+        if self.policy == COLLAPSE and fingerprint not in self._sentences_kept:
+            self._sentences_kept.add(fingerprint)
+            return True
+
+        self._count("sentence", text)
+        return False
+
+    def _count(self, level: str, text: str) -> None:
+        self.dropped[level][0] += 1
+        self.dropped[level][1] += len(text.encode("utf-8"))
@@ -1,5 +1,6 @@
 from enum import Enum
 import hashlib
+import json
 from unstructured.documents.elements import ElementType, Element, Table
 class ElementCategory(Enum):
     TEXTUAL = "Textual"
@@ -53,9 +54,28 @@ def classify_element(element_type):
 def get_hash(string: str) -> int:
     return hashlib.sha256(string.encode('utf-8')).hexdigest()
 
+def get_hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def get_file_hash(path: str, block_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(block_size):
+            sha256.update(block)
+    return sha256.hexdigest()
+
 def get_id(url: str, chunk_number: int) -> str:
     hash = get_hash(url)
     return f'{hash}-{chunk_number}'
 
+def get_chunk_id(chunk: dict) -> str:
+    """
+    Content-based chunk id: hash of the file name, the table (its id already hashes its
+    text) and the text of the chunk, so an unchanged chunk keeps its id across versions of
+    the document - also when pages were inserted before it. The page number is left out:
+    a chunk that only moved keeps the page number it was stored with.
+    """
+    return get_hash(json.dumps([chunk["filename"], chunk["table_id"], chunk["text"]], ensure_ascii=False))
+
 def get_table_id(table_markdown: str) -> str:
     return get_hash(table_markdown)
@@ -1,17 +1,34 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-import spacy
+from typing import Callable, Iterable, Iterator
 from spacy import Language
 from transformers import AutoTokenizer
 from logging import Logger
 from urllib.parse import unquote
 from config import Config
 from utils import get_logger
+from model_registry import registry
+from dedup import Deduplicator
+from chunk_model import Chunk, ChunkSource, to_json
 import os
 import re
 import json
+import time
+from contextlib import contextmanager
+from itertools import islice
 from document_helpers import *
 
+# pipeline components that sentence boundaries depend on
+SENTENCE_COMPONENTS = ("tok2vec", "parser", "senter", "sentencizer")
+
+# stage -> stages run (and timed) inside it, reported separately
+NESTED_STAGES = {
+    "cleanup": ("table_cleanup",),
+    "chunking": ("sentencize", "tokenize"),
+}
+
+_EXHAUSTED = object()
+
 class DocumentProcessor(ABC):
     def __init__(
         self, 
@@ -20,25 +37,39 @@ class DocumentProcessor(ABC):
         nlp: Language = None,
         tokenizer: AutoTokenizer = None,
         max_tokens: int = 512,
-        logger: Logger = None
+        logger: Logger = None,
+        progress_callback: Callable[[str, int, int], None] = None,
+        filename: str | None = None,
+        deduplicator: Deduplicator | None = None,
     ) -> None:
         self.path = path if isinstance(path, str) else path.as_posix()
         # decode percent-encoded/URL-encoded filename -> get diacritics
-        self.filename = unquote(Path(self.path).name)
+        self.filename = unquote(filename or Path(self.path).name)
         self.url = url
-        self.nlp = nlp or spacy.load(Config.SPACY_MODEL)
-        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(Config.MODEL_NAME)
-        self.max_tokens = max_tokens or tokenizer.model_max_length
+        self.nlp = nlp or registry.get_nlp()
+        self.tokenizer = tokenizer or registry.get_tokenizer()
+        self.max_tokens = max_tokens or self.tokenizer.model_max_length
         self.sentences = None
         self.chunks = []
         self.num_chunks = 0
         self._logger = logger or get_logger(Path(__file__).resolve().stem)
+        self._progress_callback = progress_callback
+        # stage -> seconds spent in it, see _timed
+        self.stage_seconds = {}
+        # content id -> chunks with that id so far, see _set_chunk_id
+        self._chunk_ids = {}
+        # boilerplate removal, see PdfProcessor.deduplicate
+        self.deduplicator = deduplicator or Deduplicator(filename=self.filename)
+        # bytes of text in the chunks produced
+        self.chunk_text_bytes = 0
+        self._source = None
 
     @abstractmethod
-    def process(self) -> None:
+    def process(self, collect: bool = True) -> None:
         """
         Implementation of document processing logic.
-        This should include partitioning, cleanup and chunking.
+        This should include partitioning, cleanup and chunking. With collect=False the
+        chunking step is left to the caller (see stream()).
         """
         pass
 
@@ -50,17 +81,175 @@ class DocumentProcessor(ABC):
     def perform_chunking(self) -> None:
         pass
 
-    def format_data(self, index_name: str) -> list[dict[str, str]]:
+    @property
+    def source(self) -> ChunkSource:
+        """
+        Document fields and table texts shared by the chunks (created once the subclass
+        has set its type).
+        """
+        if self._source is None:
+            self._source = ChunkSource(self.url, getattr(self, "type", None), self.filename)
+        return self._source
+
+    def _report_progress(self, stage: str, pages_done: int, pages_total: int) -> None:
+        """
+        Notify the caller (e.g. the ingestion job) about the pipeline progress.
+        """
+        if not self._progress_callback:
+            return
+
+        try:
+            self._progress_callback(stage, pages_done, pages_total)
+        except Exception as e:
+            self._logger.warning(f"Progress callback failed: {str(e)}")
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        """
+        Add the time spent in the block to the stage (stages can be entered many times).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - start
+
+    def _timed_iter(self, iterable: Iterable, stage: str) -> Iterator:
+        """
+        Add the time spent producing the items of a lazy iterable to the stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self._timed(stage):
+                item = next(iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    @contextmanager
+    def _stage(self, stage: str, **attributes) -> Iterator[None]:
+        """
+        Timed pipeline stage, traced as a span when tracing is enabled.
+        """
+        from app import tracing
+
+        with tracing.span(f"pipeline.{stage}", **attributes), self._timed(stage):
+            yield
+
+    def get_stage_seconds(self) -> dict[str, float]:
+        """
+        Time spent per stage, the stages of NESTED_STAGES without their nested stages.
+        """
+        stages = dict(self.stage_seconds)
+        for stage, nested in NESTED_STAGES.items():
+            if stage in stages:
+                stages[stage] = max(stages[stage] - sum(stages.get(name, 0.0) for name in nested), 0.0)
+        return stages
+
+    def get_document_stats(self) -> dict[str, int]:
+        """
+        Size of the processed document (pages, elements, tables, chunks - what the type knows).
+        """
+        return {"chunks": self.num_chunks}
+
+    def record_metrics(self) -> None:
+        """
+        Observe the stage timings and the size of the processed document.
+        """
+        from app import metrics
+
+        for stage, seconds in self.get_stage_seconds().items():
+            metrics.PIPELINE_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+        histograms = {
+            "pages": metrics.DOCUMENT_PAGES,
+            "elements": metrics.DOCUMENT_ELEMENTS,
+            "tables": metrics.DOCUMENT_TABLES,
+            "chunks": metrics.DOCUMENT_CHUNKS,
+        }
+        for name, value in self.get_document_stats().items():
+            if name in histograms:
+                histograms[name].observe(value)
+
+        bytes_avoided = 0
+        for level, (count, size) in self.deduplicator.dropped.items():
+            metrics.DEDUP_TEXTS_TOTAL.labels(level=level).inc(count)
+            metrics.DEDUP_BYTES_AVOIDED_TOTAL.labels(level=level).inc(size)
+            bytes_avoided += size
+        if bytes_avoided and self.chunk_text_bytes:
+            metrics.DEDUP_CHUNKS_AVOIDED_TOTAL.inc(bytes_avoided / (self.chunk_text_bytes / self.num_chunks))
+
+    @abstractmethod
+    def iter_chunks(self) -> Iterator[Chunk]:
+        """
+        Chunks of the partitioned and cleaned up document, produced lazily.
+        """
+        pass
+
+    def stream(self) -> Iterator[Chunk]:
+        """
+        Run the whole pipeline, yielding the chunks as they are produced instead of
+        collecting them in self.chunks.
+        """
+        self.process(collect=False)
+        yield from self._timed_iter(self.iter_chunks(), "chunking")
+        self.record_metrics()
+
+    def embed_chunks(self, chunks: Iterable[Chunk], embedder=None) -> Iterator[Chunk]:
+        """
+        Attach the embedding of its text to every chunk (Config.EMBEDDING_FIELD). Chunks are
+        embedded in windows of EMBEDDING_WINDOW, so batches of similar lengths can be formed
+        without holding the whole document.
+        """
+        from app import metrics
+
+        embedder = embedder or registry.get_embedder()
+        chunks = iter(chunks)
+        seconds = 0.0
+        count = 0
+
+        while window := list(islice(chunks, Config.EMBEDDING_WINDOW)):
+            start = time.perf_counter()
+            vectors = embedder.embed([chunk["text"] for chunk in window])
+            seconds += time.perf_counter() - start
+            count += len(window)
+            for chunk, vector in zip(window, vectors):
+                # a copy, the chunks may also be on their way into the ingestion cache
+                yield chunk.with_fields(**{Config.EMBEDDING_FIELD: vector.tolist()})
+
+        # recorded here, the pipeline metrics are observed before the last window is embedded
+        self.stage_seconds["embedding"] = seconds
+        metrics.PIPELINE_STAGE_SECONDS.labels(stage="embedding").observe(seconds)
+        metrics.EMBEDDED_CHUNKS_TOTAL.labels(backend=embedder.backend).inc(count)
+
+    def format_data(self, index_name: str) -> list[Chunk]:
         """
         Format data for OpenSearch bulk ingestion.
         """
         if not self.chunks: return None
 
-        return [
-            {"_index": index_name, "_id": chunk["id"]} | chunk
-            for chunk in self.chunks
-        ]
-    
+        return list(self.iter_format_data(index_name, self.chunks))
+
+    def iter_format_data(self, index_name: str, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        """
+        The chunks in the bulk format of the index, expanded when serialized (see chunk_model.to_json).
+        """
+        for chunk in chunks:
+            yield chunk.for_index(index_name)
+
+    def load_chunks(self, chunks: Iterable[dict[str, str | int]]) -> None:
+        self.chunks = list(self.relabel_chunks(chunks))
+
+    def relabel_chunks(self, chunks: Iterable[dict[str, str | int]]) -> Iterator[Chunk]:
+        """
+        Reuse chunks produced from identical content (e.g. cached), relabelled for this document.
+        """
+        self.num_chunks = 0
+        self._chunk_ids = {}
+        for chunk in chunks:
+            self.num_chunks += 1
+            yield self._set_chunk_id(Chunk.from_mapping(chunk, self.source))
+
     def export_chunked_document(self, output_filepath: str | None = None):
         if not self.chunks:
             self._logger.error(f"Cannot export chunks to json. No chunks found. Please call process() first.")
@@ -72,7 +261,7 @@ class DocumentProcessor(ABC):
             output_filepath = os.path.join(dir_path, filename)
 
         with open(output_filepath, "w+") as file:
-            json.dump(self.chunks, file, indent=4, ensure_ascii=False)
+            json.dump(self.chunks, file, indent=4, ensure_ascii=False, default=to_json)
         
         self._logger.info(f"Saved chunked document to {output_filepath}")
 
@@ -85,7 +274,8 @@ class DocumentProcessor(ABC):
         text = self._cleanup_text(text)
 
         try:
-            doc = self.nlp(text)
+            with self._timed("sentencize"):
+                doc = self.nlp(text)
             sents = [str(sentence) for sentence in doc.sents]
             sentences = self._format_sentences(sents, page_number=page_number)
         except Exception as e:
@@ -93,76 +283,135 @@ class DocumentProcessor(ABC):
 
         return sentences
 
+    def _sentencize_batch(self, texts: Iterable[tuple[str, int | None]]) -> Iterator[list[dict[str, str | int]]]:
+        """
+        Sentence segmentation of many (text, page_number) pairs, streamed through nlp.pipe.
+        Only the components needed for sentence boundaries are run: either the dependency parser
+        (with tok2vec) of the shared pipeline, or the lighter senter-only pipeline.
+        Yields the sentences of every text, in order.
+        """
+        if Config.SPACY_SENTENCE_COMPONENT == "senter":
+            nlp = registry.get_sentence_nlp()
+            disable = []
+        else:
+            nlp = self.nlp
+            disable = [name for name in nlp.pipe_names if name not in SENTENCE_COMPONENTS]
+
+        docs = nlp.pipe(
+            ((self._cleanup_text(text), page_number) for text, page_number in texts),
+            as_tuples=True,
+            batch_size=Config.SPACY_BATCH_SIZE,
+            n_process=Config.SPACY_N_PROCESS,
+            disable=disable,
+        )
+
+        for doc, page_number in self._timed_iter(docs, "sentencize"):
+            sents = [str(sentence) for sentence in doc.sents]
+            yield self._format_sentences(sents, page_number=page_number)
+
     def _split_sentences_into_chunks(
         self,
         sentences: list[dict[str, str | int]],
         table_id: str | None = None,
         table_text: str | None = None,
-    ) -> None:
+    ) -> list[Chunk]:
+        return list(self._iter_sentence_chunks(sentences, table_id, table_text))
+
+    def _iter_sentence_chunks(
+        self,
+        sentences: Iterable[dict[str, str | int]],
+        table_id: str | None = None,
+        table_text: str | None = None,
+    ) -> Iterator[Chunk]:
         """
         Split text into chunks of sentences, taking into account the maximum sequence length of
         the model (max_tokens). This is the context window for embedding purposes - any text
         exceeding that will get truncated, the information will be lost.
+
+        Sentences are consumed and tokenized in batches of TOKENIZE_BATCH_SIZE, chunks are yielded
+        as soon as they are complete.
         """
-        if not sentences: return []
-        chunks = []
+        sentences = iter(sentences)
         current_chunk = []
         current_tokens_count = 0
-        current_page = sentences[0]["page_number"]
-
-        for sentence in sentences:
-            sentence_tokens = self.tokenizer.encode(sentence["text"], add_special_tokens=False)
-            sentence_tokens_count = len(sentence_tokens)
-    
-            # save current chunk
-            if current_tokens_count + sentence_tokens_count > self.max_tokens:
-                self.num_chunks += 1
-                chunks.append(
-                    self._format_chunk(
+        current_page = None
+        first_sentence = True
+
+        while batch := list(islice(sentences, Config.TOKENIZE_BATCH_SIZE)):
+            if first_sentence:
+                current_page = batch[0]["page_number"]
+                first_sentence = False
+
+            with self._timed("tokenize"):
+                token_counts, encodings = self._tokenize_sentences([sentence["text"] for sentence in batch])
+
+            for sentence, sentence_tokens_count, encoding in zip(batch, token_counts, encodings):
+                # save current chunk
+                if current_tokens_count + sentence_tokens_count > self.max_tokens:
+                    self.num_chunks += 1
+                    yield self._format_chunk(
                         sentences=current_chunk,
-                        chunk_number=self.num_chunks,
                         page_number=current_page,
                         table_id=table_id,
                         table_text=table_text,
                     )
-                )
-                current_chunk = []
-                current_tokens_count = 0
-                current_page = sentence["page_number"]
-            
-            # split current sentence if it is too long
-            if sentence_tokens_count > self.max_tokens:
-                tokens = self.tokenizer.tokenize(sentence["text"])
-                for i in range(0, len(tokens), self.max_tokens):
-                    substring = self.tokenizer.convert_tokens_to_string(tokens[i:i+self.max_tokens])
-                    self.num_chunks += 1
-                    chunks.append(
-                        self._format_chunk(
+                    current_chunk = []
+                    current_tokens_count = 0
+                    current_page = sentence["page_number"]
+
+                # split current sentence if it is too long
+                if sentence_tokens_count > self.max_tokens:
+                    for substring in self._split_long_sentence(sentence["text"], encoding):
+                        self.num_chunks += 1
+                        yield self._format_chunk(
                             sentences=[substring],
-                            chunk_number=self.num_chunks,
                             page_number=current_page,
                             table_id=table_id,
                             table_text=table_text,
                         )
-                    )
-                continue
+                    continue
 
-            current_chunk.append(sentence["text"])
-            current_tokens_count += sentence_tokens_count
+                current_chunk.append(sentence["text"])
+                current_tokens_count += sentence_tokens_count
 
         if current_chunk:
             self.num_chunks += 1
-            chunks.append(
-                self._format_chunk(
-                    sentences=current_chunk,
-                    chunk_number=self.num_chunks,
-                    page_number=current_page,
-                    table_id=table_id,
-                    table_text=table_text
-                )
+            yield self._format_chunk(
+                sentences=current_chunk,
+                page_number=current_page,
+                table_id=table_id,
+                table_text=table_text,
             )
-        
-        return chunks
+
+    def _tokenize_sentences(self, texts: list[str]) -> tuple[list[int], list]:
+        """
+        Count the tokens of every sentence with a single batched call of the (Rust) fast tokenizer.
+        The encodings are kept, so that oversized sentences can be split without tokenizing
+        them again.
+        """
+        if not self.tokenizer.is_fast:
+            token_counts = [len(self.tokenizer.encode(text, add_special_tokens=False)) for text in texts]
+            return token_counts, [None] * len(texts)
+
+        encoding = self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_attention_mask=False,
+            verbose=False,                  # long sentences are expected, they get split below
+        )
+        token_counts = [len(ids) for ids in encoding["input_ids"]]
+
+        return token_counts, encoding.encodings
+
+    def _split_long_sentence(self, text: str, encoding=None) -> list[str]:
+        """
+        Split a sentence into pieces of at most max_tokens tokens.
+        """
+        tokens = encoding.tokens if encoding is not None else self.tokenizer.tokenize(text)
+        return [
+            self.tokenizer.convert_tokens_to_string(tokens[i:i+self.max_tokens])
+            for i in range(0, len(tokens), self.max_tokens)
+        ]
 
     def _cleanup_text(self, text: str) -> str:
         # remove extra whitespace
@@ -185,18 +434,23 @@ class DocumentProcessor(ABC):
     def _format_chunk(
         self,
         sentences: list[str],
-        chunk_number: int,
         page_number: int,
         table_id: str | None = None,
         table_text: str | None = None,
-    ) -> dict[str, str | int]:
-        return {
-            "id": get_id(self.filename, chunk_number),
-            "text": " ".join(sentences),
-            "url": self.url,
-            "type": self.type,
-            "filename": self.filename,
-            "page_number": page_number,
-            "table_id": table_id,
-            "table_text": table_text,
-        }
+    ) -> Chunk:
+        text = " ".join(sentences)
+        self.chunk_text_bytes += len(text.encode("utf-8"))
+        if table_id is not None:
+            # stored once, not on every chunk of the table
+            self.source.tables.setdefault(table_id, table_text)
+        return self._set_chunk_id(Chunk(None, text, page_number, table_id, self.source))
+
+    def _set_chunk_id(self, chunk: Chunk) -> Chunk:
+        """
+        Identical chunks within the document (e.g. a repeated disclaimer) get an occurrence suffix.
+        """
+        chunk_id = get_chunk_id(chunk)
+        occurrence = self._chunk_ids.get(chunk_id, 0)
+        self._chunk_ids[chunk_id] = occurrence + 1
+        chunk.id = f"{chunk_id}-{occurrence}" if occurrence else chunk_id
+        return chunk
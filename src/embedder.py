@@ -0,0 +1,168 @@
+from pathlib import Path
+import os
+import re
+import numpy as np
+from config import Config
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+TORCH = "torch"
+# dynamic int8 quantization of the linear layers
+TORCH_INT8 = "torch-int8"
+# onnxruntime, with the model exported (and quantized) on first use
+ONNX = "onnx"
+ONNX_INT8 = "onnx-int8"
+BACKENDS = (TORCH, TORCH_INT8, ONNX, ONNX_INT8)
+
+class Embedder:
+    """
+    Sentence embeddings of Config.MODEL_NAME on CPU, computed like sentence-transformers
+    does for it (mean of the token embeddings, max_tokens tokens), so the vectors match
+    query embeddings computed elsewhere.
+
+    Texts are sorted by length and embedded in batches of similar lengths, each padded
+    only to its longest text.
+    """
+    def __init__(
+        self,
+        backend: str | None = None,
+        batch_size: int | None = None,
+        max_tokens: int | None = None,
+        threads: int | None = None,
+        tokenizer=None,
+    ) -> None:
+        from model_registry import registry
+
+        self.backend = backend or Config.EMBEDDING_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {self.backend!r}, expected one of {BACKENDS}")
+
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.max_tokens = max_tokens or Config.EMBEDDING_MAX_TOKENS
+        self.threads = threads or Config.EMBEDDING_THREADS or max(os.cpu_count() // Config.INGESTION_WORKERS, 1)
+        self.tokenizer = tokenizer or registry.get_tokenizer()
+
+        if self.backend in (ONNX, ONNX_INT8):
+            self._session = self._load_onnx()
+        else:
+            self._model = self._load_torch()
+
+    def _load_torch(self):
+        import torch
+        from transformers import AutoModel
+
+        torch.set_num_threads(self.threads)
+        try:
+            # one inference at a time per process, parallelism is inside the operators
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # only possible before the first parallel work of the process
+            pass
+
+        model = AutoModel.from_pretrained(Config.MODEL_NAME).eval()
+        if self.backend == TORCH_INT8:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_onnx(self):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError(f"The {self.backend} embedding backend needs onnxruntime: {e}") from e
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        path = get_onnx_path(quantized=self.backend == ONNX_INT8)
+        return onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Embeddings of the texts (float32, one row per text, in order).
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # tokenized once, padded per batch
+        encodings = self.tokenizer(texts, truncation=True, max_length=self.max_tokens)
+        order = np.argsort([len(ids) for ids in encodings["input_ids"]], kind="stable")
+        vectors = None
+
+        for start in range(0, len(texts), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            batch = self._embed_batch([{name: encodings[name][index] for name in encodings} for index in indices])
+            if vectors is None:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[indices] = batch
+
+        return vectors
+
+    def _embed_batch(self, encodings: list[dict[str, list[int]]]) -> np.ndarray:
+        if self.backend in (ONNX, ONNX_INT8):
+            inputs = self.tokenizer.pad(encodings, return_tensors="np")
+            names = {input.name for input in self._session.get_inputs()}
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in names}
+            token_embeddings = self._session.run(["last_hidden_state"], feed)[0]
+            return _mean_pooling(token_embeddings, inputs["attention_mask"])
+
+        import torch
+
+        inputs = self.tokenizer.pad(encodings, return_tensors="pt")
+        with torch.inference_mode():
+            token_embeddings = self._model(**inputs).last_hidden_state
+        return _mean_pooling(token_embeddings.float().numpy(), inputs["attention_mask"].numpy())
+
+def _mean_pooling(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[..., None].astype(np.float32)
+    return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+def get_onnx_path(quantized: bool = False) -> Path:
+    """
+    ONNX export of Config.MODEL_NAME (int8 quantized or not), created on first use and
+    shared by the worker processes.
+    """
+    name = re.sub(r"[^\w.-]+", "_", Config.MODEL_NAME)
+    path = Config.EMBEDDING_ONNX_DIR / f"{name}{'-int8' if quantized else ''}.onnx"
+    if path.exists():
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # written under a temporary name and renamed, workers may export concurrently
+    temporary = path.with_suffix(f".{os.getpid()}.tmp")
+    if quantized:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(get_onnx_path(quantized=False), temporary, weight_type=QuantType.QInt8)
+    else:
+        _export_onnx(temporary)
+
+    os.replace(temporary, path)
+    logger.info(f"Exported {Config.MODEL_NAME} to {path}")
+    return path
+
+def _export_onnx(path: Path) -> None:
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    model = AutoModel.from_pretrained(Config.MODEL_NAME).eval()
+    tokenizer = AutoTokenizer.from_pretrained(Config.MODEL_NAME)
+    inputs = tokenizer(["export"], return_tensors="pt")
+    # in the order of the forward() parameters, passed by name
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            ({name: inputs[name] for name in names},),
+            str(path),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in names},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
@@ -0,0 +1,70 @@
+"""
+Production launcher: gunicorn -c src/gunicorn.conf.py
+
+The app is loaded once in the master process and shared copy-on-write by the forked
+workers. Workers are recycled after
+MAX_REQUESTS requests to contain memory growth, and Prometheus runs in multiprocess
+mode so /metrics aggregates all workers. The ingestion jobs run in a dedicated runner
+process (see app.ingestion_runner), so recycling a worker never interrupts them; the runner
+loads the spaCy model and the tokenizer and shares them with its pool processes, the web
+workers do not load them at all.
+"""
+import gc
+import os
+import shutil
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+
+# must be set before prometheus_client is imported by the app
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/business-logic-metrics")
+# ingestion jobs are resumed by the runner the workers start, never in the master (see post_fork)
+os.environ["DEFER_JOB_RECOVERY"] = "true"
+os.environ.setdefault("INGESTION_RUNNER", "process")
+os.environ.setdefault("DEBUG", "false")
+
+# metrics files of a previous run would be aggregated into the new one
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+chdir = str(SRC_DIR)
+bind = f"{os.environ.get('HOSTNAME', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+
+if os.environ.get("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "app.asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "run:app"
+    worker_class = "gthread"
+    threads = int(os.environ.get("WEB_THREADS", "8"))
+
+workers = int(os.environ.get("WEB_WORKERS", "2"))
+preload_app = True
+
+# restart a worker after this many requests (+ jitter, so they don't all restart at once)
+max_requests = int(os.environ.get("MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", "100"))
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+
+accesslog = "-"
+
+def when_ready(server):
+    # everything allocated so far (models included) is moved out of the GC's reach, so
+    # collections in the workers don't touch - and copy - the shared pages
+    gc.collect()
+    gc.freeze()
+
+def post_fork(server, worker):
+    # starts the ingestion runner, unless it is running
+    from app.jobs import job_queue
+    job_queue.start()
+
+def on_exit(server):
+    from app.ingestion_runner import stop
+    stop()
+
+def child_exit(server, worker):
+    # the pool processes of the ingestion runner clean up after themselves (metrics.init_pool_process)
+    from app import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,161 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterable, Iterator
+import gzip
+import json
+import os
+import tempfile
+import threading
+from config import Config
+from chunk_model import compact
+from document_helpers import get_hash
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+def get_cache_key(file_hash: str, user: str | None = None) -> str:
+    """
+    Chunks only depend on the file content and on the pipeline producing them (including
+    its partitioning, sentence segmentation and deduplication settings) - and on the
+    user's other documents when boilerplate is also learnt from them.
+    """
+    # the strategy of every page
+    partitioning = f"{Config.ADAPTIVE_STRATEGY}:{Config.OCR_MIN_TEXT_CHARS}:{Config.HI_RES_MIN_IMAGE_AREA}"
+    # the page ranges partitioned together
+    shards = Config.PARTITION_PAGES_PER_SHARD if Config.PARTITION_WORKERS > 1 else 0
+    # the sentence boundaries
+    sentences = f"{Config.SPACY_BATCH_SENTENCIZE}:{Config.SPACY_SENTENCE_COMPONENT}"
+    dedup = f"{Config.DEDUP_POLICY}:{Config.DEDUP_MIN_PAGES}:{Config.DEDUP_SIMILARITY}:{Config.DEDUP_MIN_CHARS}"
+    if Config.DEDUP_ACROSS_DOCUMENTS and Config.DEDUP_POLICY != "off":
+        dedup += f":{Config.DEDUP_MIN_DOCUMENTS}:{user}"
+
+    return get_hash(
+        f"{file_hash}:{Config.PIPELINE_VERSION}:{Config.SPACY_MODEL}:{Config.MODEL_NAME}:{partitioning}:{shards}:{sentences}:{dedup}"
+    )
+
+class CacheStore(ABC):
+    """
+    Storage backend for the chunks produced from a document, keyed by content.
+    """
+    @abstractmethod
+    def get(self, key: str) -> Iterator[dict] | None:
+        """
+        The cached chunks, None on a miss.
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key: str, chunks: Iterable[dict]) -> None:
+        pass
+
+    def put_through(self, key: str, chunks: Iterable[dict]) -> Iterator[dict]:
+        """
+        Pass the chunks through to the caller and store them once all were consumed.
+        Nothing is stored if the caller stops early (e.g. because of an error).
+        """
+        stored = []
+        for chunk in chunks:
+            stored.append(chunk)
+            yield chunk
+        self.put(key, stored)
+
+class DiskCacheStore(CacheStore):
+    """
+    Gzipped JSON lines files in a local directory, evicted least recently used first
+    once their total size exceeds max_bytes. The text of a table is only written with
+    its first chunk. Writes are atomic, so the directory can
+    be shared by several worker processes.
+    """
+    SUFFIX = ".jsonl.gz"
+
+    def __init__(self, directory: str | Path, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.SUFFIX}"
+
+    def get(self, key: str) -> Iterator[dict] | None:
+        from app import metrics
+
+        path = self._path(key)
+        try:
+            file = gzip.open(path, "rt", encoding="utf-8")
+            # mtime is the LRU clock
+            os.utime(path)
+        except FileNotFoundError:
+            metrics.INGESTION_CACHE_TOTAL.labels(result="miss").inc()
+            return None
+
+        metrics.INGESTION_CACHE_TOTAL.labels(result="hit").inc()
+        return self._read(file)
+
+    def _read(self, file) -> Iterator[dict]:
+        with file:
+            for line in file:
+                yield json.loads(line)
+
+    def put(self, key: str, chunks: Iterable[dict]) -> None:
+        for _ in self.put_through(key, chunks):
+            pass
+
+    def put_through(self, key: str, chunks: Iterable[dict]) -> Iterator[dict]:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        tables_written = set()
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as file:
+                for chunk in chunks:
+                    file.write(json.dumps(compact(chunk, tables_written), ensure_ascii=False))
+                    file.write("\n")
+                    yield chunk
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self._evict()
+
+    def _evict(self) -> None:
+        from app import metrics
+
+        with self._lock:
+            entries = []
+            for path in self.directory.glob(f"*{self.SUFFIX}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total_bytes -= size
+                metrics.INGESTION_CACHE_EVICTIONS_TOTAL.inc()
+
+            metrics.INGESTION_CACHE_BYTES.set(total_bytes)
+
+_store = None
+
+def get_ingestion_cache() -> CacheStore | None:
+    """
+    The configured cache store, None when caching is disabled.
+    """
+    global _store
+    if not Config.INGESTION_CACHE_ENABLED:
+        return None
+
+    if _store is None:
+        _store = DiskCacheStore(Config.INGESTION_CACHE_DIR, Config.INGESTION_CACHE_MAX_BYTES)
+    return _store
+
+def set_ingestion_cache(store: CacheStore | None) -> None:
+    """
+    Plug in a different cache store (e.g. a shared one).
+    """
+    global _store
+    _store = store
@@ -0,0 +1,435 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from hashlib import blake2b, sha256
+from pathlib import Path
+from typing import Iterable, Iterator
+import fcntl
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import unicodedata
+import numpy as np
+from config import Config
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+_PHRASE = re.compile(r'"([^"]+)"')
+# combining diacritical marks, left over from the decomposition of accented letters
+_MARKS = re.compile(r"[\u0300-\u036f]")
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase words without diacritics, so "situații" matches "situatii".
+    """
+    text = text.lower()
+    if not text.isascii():
+        text = _MARKS.sub("", unicodedata.normalize("NFKD", text))
+    return _TOKEN.findall(text)
+
+def _term_hash(term: str) -> int:
+    return int.from_bytes(blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+class SegmentWriter:
+    """
+    Builds an immutable segment from documents in the upload format ({"_index", "_id",
+    ...chunk}): the postings of every term (doc numbers and term frequencies, terms
+    identified by a 64-bit hash), the length of every document and the stored documents.
+    """
+    def __init__(self) -> None:
+        self.ids = []
+        self.filenames = {}
+        self._lengths = []
+        self._documents = []
+        # one (term, document number, term frequency) per posting, in document order
+        self._terms = []
+        self._numbers = []
+        self._frequencies = []
+        self._hashes = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, document: dict) -> None:
+        number = len(self.ids)
+        # the embeddings are not searched here, and would make up most of the stored bytes
+        unstored = ("_index", "_id", Config.EMBEDDING_FIELD)
+        source = {key: value for key, value in document.items() if key not in unstored}
+        text = " ".join(str(source.get(field) or "") for field in ("text", "filename"))
+
+        frequencies = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            term = self._hashes.get(token)
+            if term is None:
+                term = self._hashes[token] = _term_hash(token)
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        self._terms.extend(frequencies)
+        self._numbers.extend([number] * len(frequencies))
+        self._frequencies.extend(frequencies.values())
+
+        self.ids.append(document["_id"])
+        self.filenames.setdefault(source.get("filename") or "", []).append(number)
+        self._lengths.append(len(tokens))
+        self._documents.append(json.dumps({"_id": document["_id"], "_source": source}, ensure_ascii=False).encode("utf-8"))
+
+    def tee(self, documents: Iterable[dict]) -> Iterator[dict]:
+        """
+        Pass the documents through (e.g. to the upload), adding every one to the segment.
+        """
+        for document in documents:
+            self.add(document)
+            yield document
+
+    def write(self, directory: Path) -> dict:
+        """
+        Write the segment files into a new directory. Returns its manifest entry.
+        """
+        terms = np.array(self._terms, dtype=np.uint64)
+        # stable: the postings of a term stay in document order
+        order = np.argsort(terms, kind="stable")
+        terms, starts = np.unique(terms[order], return_index=True)
+        offsets = np.append(starts, len(order)).astype(np.uint64)
+        postings = np.array(self._numbers, dtype=np.uint32)[order]
+        frequencies = np.minimum(np.array(self._frequencies, dtype=np.int64)[order], 65535).astype(np.uint16)
+
+        lengths = np.array(self._lengths, dtype=np.uint32)
+        return _write_segment(directory, terms, offsets, postings, frequencies, lengths, self._documents, self.ids, self.filenames)
+
+def _write_segment(
+    directory: Path,
+    terms: np.ndarray,
+    offsets: np.ndarray,
+    postings: np.ndarray,
+    frequencies: np.ndarray,
+    lengths: np.ndarray,
+    documents: list[bytes],
+    ids: list[str],
+    filenames: dict[str, list[int]],
+) -> dict:
+    directory.mkdir(parents=True)
+    document_offsets = np.zeros(len(documents) + 1, dtype=np.uint64)
+    np.cumsum([len(document) for document in documents], out=document_offsets[1:])
+
+    np.save(directory / "terms.npy", terms)
+    np.save(directory / "offsets.npy", offsets)
+    np.save(directory / "postings.npy", postings)
+    np.save(directory / "frequencies.npy", frequencies)
+    np.save(directory / "lengths.npy", lengths)
+    np.save(directory / "document_offsets.npy", document_offsets)
+    with open(directory / "documents.jsonl", "wb") as file:
+        file.write(b"".join(documents))
+    with open(directory / "meta.json", "w", encoding="utf-8") as file:
+        json.dump({"ids": ids, "filenames": filenames}, file, ensure_ascii=False)
+
+    return {
+        "name": directory.name,
+        "documents": len(ids),
+        "length": int(lengths.sum()),
+        "deleted": None,
+        "deleted_documents": 0,
+        "deleted_length": 0,
+    }
+
+class _Segment:
+    """
+    Read side of a segment, memory-mapped.
+    """
+    def __init__(self, directory: Path, entry: dict) -> None:
+        self.entry = entry
+        self.terms = np.load(directory / "terms.npy", mmap_mode="r")
+        self.offsets = np.load(directory / "offsets.npy", mmap_mode="r")
+        self.postings = np.load(directory / "postings.npy", mmap_mode="r")
+        self.frequencies = np.load(directory / "frequencies.npy", mmap_mode="r")
+        self.lengths = np.load(directory / "lengths.npy", mmap_mode="r")
+        self.document_offsets = np.load(directory / "document_offsets.npy", mmap_mode="r")
+        self.deleted = np.load(directory / entry["deleted"]).astype(bool) if entry["deleted"] else None
+        with open(directory / "documents.jsonl", "rb") as file:
+            self._documents = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if entry["documents"] else b""
+
+    def lookup(self, term: int) -> tuple[np.ndarray, np.ndarray] | None:
+        index = int(np.searchsorted(self.terms, np.uint64(term)))
+        if index == len(self.terms) or self.terms[index] != np.uint64(term):
+            return None
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.postings[start:end], self.frequencies[start:end]
+
+    def stored(self, number: int) -> bytes:
+        start, end = int(self.document_offsets[number]), int(self.document_offsets[number + 1])
+        return self._documents[start:end]
+
+    def document(self, number: int) -> dict:
+        return json.loads(self.stored(number))
+
+class LexicalIndex:
+    """
+    BM25 index of the chunks of one user, in a directory of immutable segments (one per
+    upload, merged when there are too many) and a manifest listing them. Deletions mark
+    documents in a per-segment tombstone bitmap. Writers (ingestion workers, deletes) are
+    serialized by a file lock, readers pick up a new manifest on their next search.
+    """
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory: str | Path, max_segments: int | None = None) -> None:
+        self.directory = Path(directory)
+        self.max_segments = max_segments or Config.LEXICAL_INDEX_MAX_SEGMENTS
+        self._segments = []
+        self._version = None
+        self._lock = threading.Lock()
+
+    # ── writing ───────────────────────────────────────────────────────────────
+    @contextmanager
+    def _write_lock(self) -> Iterator[dict]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield self._read_manifest()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.directory / self.MANIFEST, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"generation": 0, "next_segment": 0, "segments": []}
+
+    def _write_manifest(self, manifest: dict) -> None:
+        manifest["generation"] += 1
+        temporary = self.directory / f"{self.MANIFEST}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(temporary, self.directory / self.MANIFEST)
+
+    def commit(
+        self,
+        writer: SegmentWriter | None = None,
+        delete_filenames: Iterable[str] = (),
+        delete_ids: Iterable[str] = (),
+    ) -> None:
+        """
+        Atomically delete documents (by file name or id) and add the documents of the writer.
+        """
+        delete_filenames, delete_ids = set(delete_filenames), set(delete_ids)
+        with self._write_lock() as manifest:
+            obsolete = []
+            if delete_filenames or delete_ids:
+                obsolete = self._delete(manifest, delete_filenames, delete_ids)
+
+            if writer is not None and len(writer):
+                name = f"segment-{manifest['next_segment']:06d}"
+                manifest["next_segment"] += 1
+                manifest["segments"].append(writer.write(self.directory / name))
+
+            if len(manifest["segments"]) > self.max_segments:
+                obsolete += self._merge(manifest)
+
+            self._write_manifest(manifest)
+
+        # open readers keep their memory maps of the removed files
+        for path in obsolete:
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    def _delete(self, manifest: dict, filenames: set[str], ids: set[str]) -> list[Path]:
+        obsolete = []
+        for entry in manifest["segments"]:
+            directory = self.directory / entry["name"]
+            with open(directory / "meta.json", encoding="utf-8") as file:
+                meta = json.load(file)
+
+            numbers = [number for filename in filenames for number in meta["filenames"].get(filename, ())]
+            if ids:
+                numbers += [number for number, document_id in enumerate(meta["ids"]) if document_id in ids]
+            if not numbers:
+                continue
+
+            deleted = np.zeros(entry["documents"], dtype=np.uint8)
+            if entry["deleted"]:
+                deleted[:] = np.load(directory / entry["deleted"])
+                obsolete.append(directory / entry["deleted"])
+            deleted[numbers] = 1
+
+            entry["deleted"] = f"deleted-{manifest['generation'] + 1}.npy"
+            entry["deleted_documents"] = int(deleted.sum())
+            entry["deleted_length"] = int(np.load(directory / "lengths.npy")[deleted.astype(bool)].sum())
+            np.save(directory / entry["deleted"], deleted)
+
+        # segments without live documents are dropped
+        for entry in [entry for entry in manifest["segments"] if entry["deleted_documents"] == entry["documents"]]:
+            manifest["segments"].remove(entry)
+            obsolete.append(self.directory / entry["name"])
+
+        return obsolete
+
+    def _merge(self, manifest: dict) -> list[Path]:
+        """
+        Rewrite the smallest segments (and those mostly deleted) into one, without the
+        deleted documents, so that half of max_segments remain. The postings are merged
+        as arrays, documents are not tokenized again.
+        """
+        live = lambda entry: entry["documents"] - entry["deleted_documents"]
+        segments = sorted(manifest["segments"], key=live)
+        count = len(segments) - self.max_segments // 2 + 1
+        merged = segments[:count] + [
+            entry for entry in segments[count:] if entry["deleted_documents"] > entry["documents"] / 2
+        ]
+
+        terms, postings, frequencies, lengths = [], [], [], []
+        documents, ids, filenames = [], [], {}
+        for entry in merged:
+            directory = self.directory / entry["name"]
+            segment = _Segment(directory, entry)
+            with open(directory / "meta.json", encoding="utf-8") as file:
+                meta = json.load(file)
+
+            # old document number -> new one, -1 for deleted documents
+            live = ~segment.deleted if segment.deleted is not None else np.ones(entry["documents"], dtype=bool)
+            numbers = np.full(entry["documents"], -1, dtype=np.int64)
+            numbers[live] = len(ids) + np.arange(int(live.sum()))
+
+            renumbered = numbers[segment.postings]
+            kept = renumbered >= 0
+            terms.append(np.repeat(segment.terms, np.diff(segment.offsets).astype(np.int64))[kept])
+            postings.append(renumbered[kept])
+            frequencies.append(np.asarray(segment.frequencies)[kept])
+            lengths.append(np.asarray(segment.lengths)[live])
+
+            for number in np.flatnonzero(live):
+                documents.append(segment.stored(number))
+                ids.append(meta["ids"][number])
+            for filename, old_numbers in meta["filenames"].items():
+                new_numbers = [int(numbers[number]) for number in old_numbers if numbers[number] >= 0]
+                if new_numbers:
+                    filenames.setdefault(filename, []).extend(new_numbers)
+
+        terms, postings, frequencies = np.concatenate(terms), np.concatenate(postings), np.concatenate(frequencies)
+        # by term, then document
+        order = np.lexsort((postings, terms))
+        terms, postings, frequencies = terms[order], postings[order].astype(np.uint32), frequencies[order]
+        unique, starts = np.unique(terms, return_index=True)
+        offsets = np.append(starts, len(terms)).astype(np.uint64)
+
+        name = f"segment-{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        manifest["segments"] = [entry for entry in manifest["segments"] if entry not in merged]
+        manifest["segments"].append(_write_segment(
+            self.directory / name, unique, offsets, postings, frequencies,
+            np.concatenate(lengths), documents, ids, filenames,
+        ))
+        logger.info(f"Merged {len(merged)} segments of {self.directory.name} into {name} ({len(ids)} documents)")
+
+        return [self.directory / entry["name"] for entry in merged]
+
+    # ── searching ─────────────────────────────────────────────────────────────
+    def _refresh(self) -> list[_Segment]:
+        """
+        The open segments, reopened if the manifest changed since the last search.
+        """
+        try:
+            stat = os.stat(self.directory / self.MANIFEST)
+        except FileNotFoundError:
+            return []
+
+        version = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if version != self._version:
+                manifest = self._read_manifest()
+                self._segments = [_Segment(self.directory / entry["name"], entry) for entry in manifest["segments"]]
+                self._version = version
+            return self._segments
+
+    def search(self, query: str, size: int | None = None) -> list[dict]:
+        """
+        Best documents for the query by BM25, as search hits ({"_id", "_score", "_source"}).
+        Quoted words are required, the others only add to the score.
+        """
+        size = size or Config.LEXICAL_SEARCH_SIZE
+        segments = self._refresh()
+        terms = {_term_hash(token): token for token in tokenize(query)}
+        required = {_term_hash(token) for phrase in _PHRASE.findall(query) for token in tokenize(phrase)}
+        if not segments or not terms:
+            return []
+
+        documents = sum(segment.entry["documents"] - segment.entry["deleted_documents"] for segment in segments)
+        length = sum(segment.entry["length"] - segment.entry["deleted_length"] for segment in segments)
+        average_length = length / max(documents, 1)
+
+        postings = [{term: segment.lookup(term) for term in terms} for segment in segments]
+        idf = {}
+        for term in terms:
+            frequency = sum(len(found[term][0]) for found in postings if found[term] is not None)
+            idf[term] = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+
+        candidates = []
+        for segment, found in zip(segments, postings):
+            if required and any(found[term] is None for term in required):
+                continue
+
+            scores = np.zeros(segment.entry["documents"], dtype=np.float32)
+            matched = np.zeros(segment.entry["documents"], dtype=np.uint8) if required else None
+            for term, result in found.items():
+                if result is None:
+                    continue
+                numbers, frequencies = result
+                frequencies = frequencies.astype(np.float32)
+                norm = K1 * (1 - B + B * segment.lengths[numbers] / average_length)
+                scores[numbers] += idf[term] * frequencies * (K1 + 1) / (frequencies + norm)
+                if term in required:
+                    matched[numbers] += 1
+
+            if required:
+                scores[matched < len(required)] = 0
+            if segment.deleted is not None:
+                scores[segment.deleted] = 0
+
+            hits = np.flatnonzero(scores)
+            if len(hits) > size:
+                hits = hits[np.argpartition(scores[hits], -size)[-size:]]
+            candidates.extend((float(scores[number]), segment, int(number)) for number in hits)
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [
+            segment.document(number) | {"_score": score}
+            for score, segment, number in candidates[:size]
+        ]
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(user: str) -> LexicalIndex | None:
+    """
+    The index of the user, None when the local index is disabled. The open indexes of
+    the most recent users are kept.
+    """
+    if not Config.LEXICAL_INDEX_ENABLED:
+        return None
+
+    with _indexes_lock:
+        index = _indexes.get(user)
+        if index is None:
+            # never derived from the user name directly
+            directory = Config.LEXICAL_INDEX_DIR / sha256(user.encode("utf-8")).hexdigest()[:32]
+            index = _indexes[user] = LexicalIndex(directory)
+            while len(_indexes) > Config.LEXICAL_INDEX_OPEN_USERS:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(user)
+        return index
+
+def remove_document(user: str, filename: str) -> None:
+    index = get_lexical_index(user)
+    if index is not None:
+        index.commit(delete_filenames=[filename])
@@ -0,0 +1,97 @@
+import threading
+import time
+from typing import Any, Callable
+import spacy
+from spacy import Language
+from transformers import AutoTokenizer
+from config import Config
+from utils import get_logger, get_rss_bytes
+
+logger = get_logger(__name__)
+
+# components of the trained pipelines that sentence segmentation with senter does not need
+SENTER_EXCLUDE = ["tagger", "morphologizer", "parser", "lemmatizer", "trainable_lemmatizer", "attribute_ruler", "ner"]
+
+class ModelRegistry:
+    """
+    Process-wide cache of the heavy NLP models used by the document processors.
+    Every model is loaded at most once per process; concurrent callers asking for a
+    model that is still loading block until the first load finishes.
+    """
+    def __init__(self) -> None:
+        self._models: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._model_locks: dict[str, threading.Lock] = {}
+
+    def get_nlp(self) -> Language:
+        return self._get("spacy", lambda: spacy.load(Config.SPACY_MODEL))
+
+    def get_sentence_nlp(self) -> Language:
+        """
+        Trimmed copy of the spaCy pipeline that only runs the statistical sentence segmenter.
+        """
+        return self._get("spacy-senter", self._load_sentence_nlp)
+
+    def get_tokenizer(self) -> AutoTokenizer:
+        return self._get("tokenizer", lambda: AutoTokenizer.from_pretrained(Config.MODEL_NAME))
+
+    def get_embedder(self):
+        """
+        Embedding model of the chunks, see embedder.Embedder.
+        """
+        from embedder import Embedder
+        return self._get("embedder", Embedder)
+
+    def warmup(self) -> None:
+        """
+        Load every model eagerly, e.g. at application startup.
+        """
+        self.get_nlp()
+        self.get_tokenizer()
+        if Config.SPACY_SENTENCE_COMPONENT == "senter":
+            self.get_sentence_nlp()
+        if Config.EMBEDDING_ENABLED:
+            self.get_embedder()
+
+    def _load_sentence_nlp(self) -> Language:
+        nlp = spacy.load(Config.SPACY_MODEL, exclude=SENTER_EXCLUDE)
+        if "senter" in nlp.disabled:
+            nlp.enable_pipe("senter")
+        return nlp
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def _get(self, name: str, loader: Callable[[], Any]) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model_lock = self._model_locks.setdefault(name, threading.Lock())
+
+        # load different models in parallel, but each model only once
+        with model_lock:
+            model = self._models.get(name)
+            if model is None:
+                model = self._load(name, loader)
+                self._models[name] = model
+
+        return model
+
+    def _load(self, name: str, loader: Callable[[], Any]) -> Any:
+        from app import metrics
+
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        model = loader()
+        elapsed = time.perf_counter() - start
+        rss_delta = max(get_rss_bytes() - rss_before, 0)
+
+        metrics.MODEL_LOAD_SECONDS.labels(model=name).set(elapsed)
+        metrics.MODEL_MEMORY_BYTES.labels(model=name).set(rss_delta)
+        logger.info(f"Loaded model {name} in {elapsed:.2f}s (+{rss_delta / 2**20:.1f} MiB RSS)")
+
+        return model
+
+registry = ModelRegistry()
@@ -1,12 +1,14 @@
 from spacy import Language
-import re
+from typing import Callable, Iterator
+from itertools import groupby
+import time
 import pymupdf
 from utils import *
 from document_helpers import *
 from transformers import AutoTokenizer
-from bs4 import BeautifulSoup
-import pandas as pd
-from io import StringIO
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 import os
 os.environ["EXTRACT_TABLE_AS_CELLS"] = "True"
 os.environ["TABLE_IMAGE_CROP_PAD"] = "20"
@@ -15,7 +17,56 @@ import matplotlib.pyplot as plt
 from PIL import Image
 from unstructured.partition.pdf import partition_pdf
 from unstructured.documents.coordinates import PixelSpace
+from unstructured.documents.elements import assign_and_map_hash_ids
+from config import Config
 from document_processor import DocumentProcessor
+from table_model import TableModel
+from chunk_model import Chunk
+from dedup import Deduplicator
+
+HI_RES = "hi_res"
+FAST = "fast"
+
+# elements carrying page numbers, compared without their digits when deduplicating
+PAGE_FURNITURE = (ElementType.PAGE_HEADER, ElementType.PAGE_FOOTER, ElementType.HEADER, ElementType.FOOTER)
+
+_partition_pool = None
+
+def _get_partition_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes are kept alive between documents, so the layout and OCR models
+    they load stay warm. One pool per ingestion worker, of Config.PARTITION_WORKERS
+    processes; they are spawned, the ingestion worker (itself a pool child) is never forked.
+    """
+    from app import metrics
+
+    global _partition_pool
+    if _partition_pool is None:
+        _partition_pool = ProcessPoolExecutor(
+            max_workers=Config.PARTITION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=metrics.init_pool_process,
+        )
+    return _partition_pool
+
+def _partition_shard(pdf_bytes: bytes, first_page: int, metadata_filename: str, **kwargs) -> list[Element]:
+    """
+    Partition a page range extracted from a larger PDF. Page numbers are shifted back to
+    the numbering of the original document and the element ids are recomputed from them.
+    """
+    start = time.perf_counter()
+    elements = partition_pdf(file=BytesIO(pdf_bytes), metadata_filename=metadata_filename, **kwargs)
+    _observe_partition(kwargs.get("strategy", HI_RES), start)
+
+    for element in elements:
+        if element.metadata.page_number is not None:
+            element.metadata.page_number += first_page
+
+    return assign_and_map_hash_ids(elements)
+
+def _observe_partition(strategy: str, start: float) -> None:
+    from app import metrics
+    metrics.PARTITION_SECONDS.labels(strategy=strategy).observe(time.perf_counter() - start)
 
 class PdfProcessor(DocumentProcessor):
     def __init__(
@@ -25,32 +76,115 @@ class PdfProcessor(DocumentProcessor):
         nlp: Language = None,
         tokenizer: AutoTokenizer = None,
         max_tokens: int = 512,
-        logger: logging.Logger = None
+        logger: logging.Logger = None,
+        progress_callback: Callable[[str, int, int], None] = None,
+        filename: str | None = None,
+        data: bytes | None = None,
+        deduplicator: Deduplicator | None = None,
     ) -> None:
-        super().__init__(path, url, nlp, tokenizer, max_tokens, logger)
+        super().__init__(path, url, nlp, tokenizer, max_tokens, logger, progress_callback, filename, deduplicator)
         self.type = "pdf"
         self.ocr_path = None
         self.bw_path = None
-        self.document = self._init_document(path)
-        self._needs_ocr = not any([page.get_text() for page in self.document])
+        # contents of the file when already in memory, so it is not read again from disk
+        self.data = data
+        self.document = self._init_document(path, data)
         self.num_pages = len(self.document)
+        self.page_strategies = None
         self.elements = None
+        # element id -> table parsed from its HTML, see _get_table_model
+        self.table_models = {}
 
-    def _init_document(self, path: str) -> None:
+    def _init_document(self, path: str, data: bytes | None = None) -> pymupdf.Document:
+        if data is not None:
+            return pymupdf.open(stream=data, filetype="pdf")
         return pymupdf.open(path, filetype="pdf")
+
+    def _classify_pages(self) -> list[str]:
+        """
+        Pick a partitioning strategy for every page. Pages with a text layer and without
+        tables or large images are extracted with the fast strategy, scanned pages and
+        pages with tables or figures go through hi_res layout detection and OCR.
+        """
+        if not Config.ADAPTIVE_STRATEGY:
+            return [HI_RES] * self.num_pages
+
+        return [self._classify_page(page) for page in self.document]
+
+    def _classify_page(self, page: pymupdf.Page) -> str:
+        # no (usable) text layer - scanned page, needs OCR
+        if len(page.get_text().strip()) < Config.OCR_MIN_TEXT_CHARS:
+            return HI_RES
+
+        page_area = abs(page.rect) or 1
+        for image in page.get_image_info():
+            if abs(pymupdf.Rect(image["bbox"]) & page.rect) / page_area >= Config.HI_RES_MIN_IMAGE_AREA:
+                return HI_RES
+
+        if page.find_tables().tables:
+            return HI_RES
+
+        return FAST
     
-    def process(self) -> None:
-        self.partition_pdf()
-        self.cleanup()
-        self.perform_chunking()
+    def process(self, collect: bool = True) -> None:
+        self._report_progress("partitioning", 0, self.num_pages)
+        with self._stage("partitioning", document__pages=self.num_pages):
+            self.partition_pdf()
+        self._report_progress("cleanup", self.num_pages, self.num_pages)
+        with self._stage("cleanup", document__elements=len(self.elements or [])):
+            self.cleanup()
+        with self._stage("dedup", dedup__policy=self.deduplicator.policy):
+            self.deduplicate()
+        self._report_progress("chunking", self.num_pages, self.num_pages)
+        if collect:
+            self.perform_chunking()
+            self.record_metrics()
 
     def partition_pdf(self) -> None:
         """
         Parse the PDF into a list of elements using lanchain unstructured.
         Detect complex layout in the document using OCR-based and Transformer-based models.
+
+        Consecutive pages sharing a strategy (see _classify_pages) are partitioned together.
+        With PARTITION_WORKERS > 1 these page ranges are further split into shards of
+        PARTITION_PAGES_PER_SHARD pages which are partitioned in parallel. The results are
+        merged back in page order.
         """
-        self.elements = partition_pdf(
-            filename=self.path,
+        self.page_strategies = self._classify_pages()
+        parallel = Config.PARTITION_WORKERS > 1
+        shards = self._get_page_shards(Config.PARTITION_PAGES_PER_SHARD if parallel else self.num_pages)
+
+        if len(shards) == 1:
+            strategy = shards[0][2]
+            start = time.perf_counter()
+            if self.data is not None:
+                self.elements = partition_pdf(
+                    file=BytesIO(self.data), metadata_filename=self.path, **self._partition_kwargs(strategy)
+                )
+            else:
+                self.elements = partition_pdf(filename=self.path, **self._partition_kwargs(strategy))
+            _observe_partition(strategy, start)
+        elif parallel:
+            self.elements = self._partition_parallel(shards)
+        else:
+            self.elements = self._partition_serial(shards)
+
+        from app import metrics
+        for strategy in set(self.page_strategies):
+            metrics.PDF_PAGES_BY_STRATEGY.labels(strategy=strategy).inc(self.page_strategies.count(strategy))
+
+        self._logger.info(f"Partitioned PDF {self.path}.")
+
+    def _partition_kwargs(self, strategy: str = HI_RES) -> dict:
+        if strategy == FAST:
+            return dict(
+                url=None,
+                languages=["ron"],
+                strategy="fast",                            # text layer only, no layout model or OCR
+                max_partition=None,
+            )
+
+        return dict(
             url=None,                                       # run inference locally, must have unstructured[local-inference] installed
             languages=["ron"],                              # use Romanian Tesseract language pack for OCR
             infer_table_structure=True,                     # extract tables
@@ -61,7 +195,71 @@ class PdfProcessor(DocumentProcessor):
             max_partition=None,
         )
 
-        self._logger.info(f"Partitioned PDF {self.path}.")
+    def _shard_kwargs(self, start: int, end: int, strategy: str) -> dict:
+        kwargs = self._partition_kwargs(strategy)
+        if strategy == HI_RES:
+            # figures are named after the (shard-local) page number, keep shards apart
+            kwargs["extract_image_block_output_dir"] = os.path.join("figures", f"pages-{start + 1}-{end}")
+
+        return kwargs
+
+    def _get_page_shards(self, pages_per_shard: int) -> list[tuple[int, int, str]]:
+        """
+        Split the document into [start, end) ranges of zero-based page indices with the
+        same strategy, at most pages_per_shard pages long.
+        """
+        pages_per_shard = max(pages_per_shard, 1)
+        shards = []
+        start = 0
+
+        for page in range(1, self.num_pages + 1):
+            if (
+                page == self.num_pages
+                or page - start == pages_per_shard
+                or self.page_strategies[page] != self.page_strategies[start]
+            ):
+                shards.append((start, page, self.page_strategies[start]))
+                start = page
+
+        return shards
+
+    def _extract_pages(self, start: int, end: int) -> bytes:
+        shard = pymupdf.open()
+        shard.insert_pdf(self.document, from_page=start, to_page=end - 1)
+        pdf_bytes = shard.tobytes()
+        shard.close()
+
+        return pdf_bytes
+
+    def _partition_serial(self, shards: list[tuple[int, int, str]]) -> list[Element]:
+        elements = []
+        for start, end, strategy in shards:
+            kwargs = self._shard_kwargs(start, end, strategy)
+            elements.extend(_partition_shard(self._extract_pages(start, end), start, self.path, **kwargs))
+            self._report_progress("partitioning", end, self.num_pages)
+
+        return elements
+
+    def _partition_parallel(self, shards: list[tuple[int, int, str]]) -> list[Element]:
+        pool = _get_partition_pool()
+        futures = {}
+
+        for start, end, strategy in shards:
+            kwargs = self._shard_kwargs(start, end, strategy)
+            future = pool.submit(_partition_shard, self._extract_pages(start, end), start, self.path, **kwargs)
+            futures[future] = (start, end)
+
+        results = {}
+        pages_done = 0
+        for future in as_completed(futures):
+            start, end = futures[future]
+            results[start] = future.result()
+            pages_done += end - start
+            self._report_progress("partitioning", pages_done, self.num_pages)
+
+        self._logger.info(f"Partitioned {len(shards)} shards of {self.path} in parallel.")
+
+        return [element for start in sorted(results) for element in results[start]]
 
     def perform_chunking(self) -> None:
         """
@@ -74,32 +272,68 @@ class PdfProcessor(DocumentProcessor):
         """
         if not self.elements: return None
 
-        sentences = []
-        for element in self.elements:
-            element_category = classify_element(element.category)
-
-            if element_category == ElementCategory.TABLE:
-                self.chunks.extend(self._split_sentences_into_chunks(sentences))
-                sentences.clear()
-                self.chunks.extend(self._get_table_chunks(element))
-            
-            elif element_category in [ElementCategory.TABLE, ElementCategory.TEXTUAL]:
-                sentences.extend(self._sentencize(element.text, element.metadata.page_number))
-
-        # use the sentences to build text chunks
-        new_chunks = self._split_sentences_into_chunks(sentences)
-        self.chunks.extend(new_chunks)
-        from app import metrics
-        metrics.CHUNKS_CREATED_TOTAL.inc(len(new_chunks))
-
-    def _get_table_chunks(self, table: Table) -> str:
-        df = self._convert_table_to_dataframe(table)
+        self.chunks.extend(self._timed_iter(self.iter_chunks(), "chunking"))
 
-        df_string = ' ; '.join(df.columns.astype(str).values.flatten())
-        df_string += ' ; '.join(df.astype(str).values.flatten())
+    def iter_chunks(self) -> Iterator[Chunk]:
+        """
+        Lazy version of perform_chunking: elements are turned into sentences and sentences
+        into chunks as the caller consumes them. Tables are chunked on their own and end the
+        run of text sentences preceding them.
+        """
+        if not self.elements: return
+
+        elements = [
+            element for element in self.elements
+            if classify_element(element.category) in [ElementCategory.TABLE, ElementCategory.TEXTUAL]
+        ]
+        texts = (
+            (self._get_element_text(element), element.metadata.page_number)
+            for element in elements
+        )
 
-        sentences = self._sentencize(df_string, table.metadata.page_number)
+        if Config.SPACY_BATCH_SENTENCIZE:
+            element_sentences = self._sentencize_batch(texts)
+        else:
+            element_sentences = (self._sentencize(text, page_number) for text, page_number in texts)
+
+        if self.deduplicator.enabled:
+            # the repeated sentences are only known once all of them were counted
+            element_sentences = list(element_sentences)
+            self.deduplicator.count_sentences(
+                (sentence["text"], sentence["page_number"])
+                for element, sentences in zip(elements, element_sentences)
+                if classify_element(element.category) != ElementCategory.TABLE
+                for sentence in sentences
+            )
 
+        from app import metrics
+        is_table = lambda pair: classify_element(pair[0].category) == ElementCategory.TABLE
+
+        for table_group, pairs in groupby(zip(elements, element_sentences), key=is_table):
+            if table_group:
+                for table, sentences in pairs:
+                    for chunk in self._get_table_chunks(table, sentences):
+                        metrics.CHUNKS_CREATED_BY_TYPE_TOTAL.labels(type="table").inc()
+                        yield chunk
+            else:
+                sentences = (
+                    sentence for _, text_sentences in pairs for sentence in text_sentences
+                    if self.deduplicator.keep_sentence(sentence["text"], sentence["page_number"])
+                )
+                for chunk in self._iter_sentence_chunks(sentences):
+                    metrics.CHUNKS_CREATED_TOTAL.inc()
+                    metrics.CHUNKS_CREATED_BY_TYPE_TOTAL.labels(type="text").inc()
+                    yield chunk
+
+    def _get_element_text(self, element: Element) -> str:
+        if classify_element(element.category) == ElementCategory.TABLE:
+            return self._get_table_string(element)
+        return element.text
+
+    def _get_table_string(self, table: Table) -> str:
+        return self._get_table_model(table).to_text()
+
+    def _get_table_chunks(self, table: Table, sentences: list[dict[str, str | int]]) -> str:
         table_text = self._format_table_text(table)
         table_id = get_table_id(table_text)
         table_chunks = self._split_sentences_into_chunks(sentences, table_id, table_text)
@@ -110,15 +344,16 @@ class PdfProcessor(DocumentProcessor):
         """
         Convert table to markdown format, clean and compact.
         """
-        # markdown = convert_table_to_dataframe(table).to_markdown(index=False)
-        df = self._convert_table_to_dataframe(table)
-        markdown = df.to_markdown(index=False)
-
-        # remove whitespace, make markdown more compact
-        markdown = re.sub(r' +', ' ', markdown)
-        markdown = re.sub(r'\|:[-]{3,}', '|:--', markdown)
+        return self._get_table_model(table).to_markdown()
 
-        return markdown
+    def _get_table_model(self, table: Table) -> TableModel:
+        """
+        The table parsed from its HTML, once per element (cleanup() leaves the cleaned one).
+        """
+        model = self.table_models.get(table.id)
+        if model is None:
+            model = self.table_models[table.id] = TableModel.from_html(table.metadata.text_as_html)
+        return model
 
     def _plot_page_with_boxes(self, page: pymupdf.Page, elements: list) -> None:
         # page -> pixmap -> PIL image
@@ -154,7 +389,7 @@ class PdfProcessor(DocumentProcessor):
         plt.show()
 
     def render_page(self, page_number: int) -> None:
-        page = pymupdf.open(self.path).load_page(page_number - 1)
+        page = self.document.load_page(page_number - 1)
         page_elements = [element for element in self.elements if element.metadata.page_number == page_number]
 
         self._plot_page_with_boxes(page, page_elements)
@@ -165,76 +400,50 @@ class PdfProcessor(DocumentProcessor):
 
         for element in self.elements:
             if element.category == ElementType.TABLE:
-                self._cleanup_table(element)
+                with self._timed("table_cleanup"):
+                    self._cleanup_table(element)
             else:
                 self._cleanup_textual_element(element)
 
+    def deduplicate(self) -> None:
+        """
+        Leave out the text elements repeated across pages (letterheads, page headers and
+        footers, disclaimers) according to the deduplication policy, before chunking.
+        """
+        if not self.elements or not self.deduplicator.enabled:
+            return
+
+        textual = [
+            element for element in self.elements
+            if classify_element(element.category) == ElementCategory.TEXTUAL and element.text
+        ]
+        keep = self.deduplicator.select([
+            (element.text, element.metadata.page_number, element.category in PAGE_FURNITURE)
+            for element in textual
+        ])
+
+        dropped = {id(element) for element, kept in zip(textual, keep) if not kept}
+        if dropped:
+            self.elements = [element for element in self.elements if id(element) not in dropped]
+            self._logger.info(f"Left out {len(dropped)} repeated elements of {self.filename}")
+
     def _cleanup_table(self, table: Element) -> None:
-        html_content = table.metadata.text_as_html
+        model = TableModel.from_html(table.metadata.text_as_html)
         if table.metadata.table_as_cells:
-            html_content = self._fix_table_cell_text(table)
-
-        soup = BeautifulSoup(html_content, "html.parser")
+            model.fix_cell_text()
 
-        # remove extraneous '|' characters from text
-        for element in soup.find_all(["td", "th"]):
-            element.string = re.sub(r"\|+", " ", element.get_text(strip=True))
+        model.clean_cells()
+        model.fix_emails(table.text)
 
-        cleaned_html = soup.prettify()
-        
-        # handle email addresses
-        email_regex = r"[\w\.-]+@[\w\.-]+\.[a-zA-Z]{2,}"
-        email_addresses = re.findall(email_regex, table.text)
-        if email_addresses:
-            for email_address in email_addresses:
-                index = email_address.find("@") + 1
-                domain = email_address[index:]
-                cleaned_html = re.sub(r"\([\w\.-]+{}".format(domain), f"@{domain}", cleaned_html, count=1)
+        self.table_models[table.id] = model
+        table.metadata.text_as_html = model.to_html()
 
-        table.metadata.text_as_html = cleaned_html
+    def get_document_stats(self) -> dict[str, int]:
+        return super().get_document_stats() | {
+            "pages": self.num_pages,
+            "elements": len(self.elements or []),
+            "tables": len(self.table_models),
+        }
 
     def _cleanup_textual_element(self, element: Element) -> None:
         element.text = self._cleanup_text(element.text)
-    
-    def _fix_table_cell_text(self, table, delimiter=" L ") -> str:
-        """
-        Move text after a delimiter to the text below in the same column.
-        This is very much hardcoded.
-        """
-        if not table.metadata.text_as_html:
-            return table.metadata.text_as_html
-
-        soup = BeautifulSoup(table.metadata.text_as_html, "html.parser")
-        rows = soup.find_all("tr")
-
-        for row_idx, row in enumerate(rows[:-1]):
-            cells = row.find_all("td")
-            next_row_cells = rows[row_idx + 1].find_all("td")
-
-            for col_idx, cell in enumerate(cells):
-                if not cell.string:
-                    continue
-
-                # do some cleanup - hardcoded
-                cell.string = re.sub(r'^L ', '', cell.string)
-
-                if delimiter in cell.string:
-                    # split the cell text using the delimiter
-                    parts = cell.string.rsplit(delimiter)
-                    # keep the first part in the current cell
-                    cell.string = parts[0].strip()
-
-                    # move the rest to the next row in the same column
-                    if col_idx < len(next_row_cells):
-                        next_row_cells[col_idx].string = parts[1].strip() + " " + next_row_cells[col_idx].string
-
-        return str(soup)
-
-    def _convert_table_to_dataframe(self, table: Table) -> str:
-        df = pd.read_html(StringIO(table.metadata.text_as_html), encoding='utf-8')[0]
-
-        # cleanup missing values
-        df.columns = ['' if "Unnamed" in str(col) else str(col) for col in df.columns]
-        df = df.fillna('')
-
-        return df
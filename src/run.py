@@ -1,10 +1,18 @@
-from app import create_app
 import os
 
-app = create_app()
-
 HOSTNAME = os.environ.get('HOSTNAME', '0.0.0.0')
 PORT = int(os.environ.get('PORT', '5000'))
+# "wsgi" (Flask) or "asgi" (async I/O-bound endpoints, served by uvicorn)
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+if SERVER_MODE == 'asgi':
+    if __name__ == '__main__':
+        import uvicorn
+        uvicorn.run("app.asgi:app", host=HOSTNAME, port=PORT)
+else:
+    from app import create_app
+
+    app = create_app()
 
-if __name__ == '__main__':
-    app.run(host=HOSTNAME, port=PORT, debug=True)
\ No newline at end of file
+    if __name__ == '__main__':
+        app.run(host=HOSTNAME, port=PORT, debug=True)
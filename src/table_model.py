@@ -0,0 +1,254 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+from tabulate import tabulate
+
+EMAIL_REGEX = r"[\w\.-]+@[\w\.-]+\.[a-zA-Z]{2,}"
+
+def _normalize_whitespace(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+class _TableParser(HTMLParser):
+    """
+    Collects the cells of an HTML table as (text, is_header, colspan, rowspan) per row.
+    Nested tags are flattened into the text of their cell.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+        self._in_thead = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "thead":
+            self._in_thead = True
+        elif tag == "tr":
+            self._end_row()
+            self._row = []
+        elif tag in ("td", "th"):
+            self._end_cell()
+            if self._row is None:
+                self._row = []
+            attrs = dict(attrs)
+            self._cell = {
+                "text": [],
+                "header": tag == "th" or self._in_thead,
+                "colspan": _get_span(attrs.get("colspan")),
+                "rowspan": _get_span(attrs.get("rowspan")),
+            }
+        elif tag == "br" and self._cell is not None:
+            self._cell["text"].append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th"):
+            self._end_cell()
+        elif tag == "tr":
+            self._end_row()
+        elif tag == "thead":
+            self._end_row()
+            self._in_thead = False
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell["text"].append(data)
+
+    def close(self):
+        super().close()
+        self._end_row()
+
+    def _end_cell(self) -> None:
+        if self._cell is not None:
+            self._cell["text"] = _normalize_whitespace("".join(self._cell["text"]))
+            self._row.append(self._cell)
+            self._cell = None
+
+    def _end_row(self) -> None:
+        self._end_cell()
+        if self._row:
+            self.rows.append(self._row)
+        self._row = None
+
+def _get_span(value: str | None) -> int:
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+class TableModel:
+    """
+    Rectangular grid of the cell texts of a table, built once from the HTML produced by
+    unstructured. Spanned cells are repeated in every row/column they cover. The cell
+    fixes, the cleanup and every text representation of the table (flattened text for
+    sentence segmentation, compact markdown for the chunks, HTML for the element) work
+    on this grid, so the HTML is parsed a single time.
+    """
+    def __init__(self, rows: list[list[str]], num_header_rows: int = 0) -> None:
+        width = max((len(row) for row in rows), default=0)
+        self.rows = [row + [""] * (width - len(row)) for row in rows]
+        self.num_header_rows = num_header_rows
+
+    @classmethod
+    def from_html(cls, html: str | None) -> "TableModel":
+        if not html:
+            return cls([])
+
+        parser = _TableParser()
+        parser.feed(html)
+        parser.close()
+
+        rows = []
+        # column -> (text, rows left) of cells spanning down from a previous row
+        pending = {}
+        for parsed_row in parser.rows:
+            row = []
+            cells = iter(parsed_row)
+            col = 0
+            while True:
+                if col in pending:
+                    text, left = pending[col]
+                    row.append(text)
+                    if left > 1:
+                        pending[col] = (text, left - 1)
+                    else:
+                        del pending[col]
+                    col += 1
+                    continue
+
+                cell = next(cells, None)
+                if cell is None:
+                    if any(c >= col for c in pending):
+                        # a spanned cell further right, leave this column empty
+                        row.append("")
+                        col += 1
+                        continue
+                    break
+
+                for _ in range(cell["colspan"]):
+                    row.append(cell["text"])
+                    if cell["rowspan"] > 1:
+                        pending[col] = (cell["text"], cell["rowspan"] - 1)
+                    col += 1
+            rows.append(row)
+
+        # header rows: the <thead>, otherwise a first row made only of <th> cells
+        num_header_rows = 0
+        for parsed_row in parser.rows:
+            if not all(cell["header"] for cell in parsed_row):
+                break
+            num_header_rows += 1
+        if num_header_rows == len(parser.rows):
+            num_header_rows = 0
+
+        return cls(rows, num_header_rows)
+
+    @property
+    def width(self) -> int:
+        return len(self.rows[0]) if self.rows else 0
+
+    @property
+    def header(self) -> list[str]:
+        """
+        Column names, the header rows of a multi-row header joined per column.
+        """
+        columns = []
+        for col in range(self.width):
+            parts = []
+            for row in self.rows[:self.num_header_rows]:
+                if row[col] and row[col] not in parts:
+                    parts.append(row[col])
+            columns.append(" ".join(parts))
+        return columns
+
+    @property
+    def body(self) -> list[list[str]]:
+        return self.rows[self.num_header_rows:]
+
+    def fix_cell_text(self, delimiter: str = " L ") -> None:
+        """
+        Move text after a delimiter to the cell below in the same column.
+        This is very much hardcoded.
+        """
+        body = self.body
+        for row_idx, row in enumerate(body):
+            next_row = body[row_idx + 1] if row_idx + 1 < len(body) else None
+
+            for col_idx, text in enumerate(row):
+                if not text:
+                    continue
+
+                # do some cleanup - hardcoded
+                text = re.sub(r'^L ', '', text)
+
+                if next_row is not None and delimiter in text:
+                    # keep the first part, move the rest to the next row
+                    first, rest = text.split(delimiter, 1)
+                    text = first.strip()
+                    next_row[col_idx] = f"{rest.strip()} {next_row[col_idx]}".strip()
+
+                row[col_idx] = text
+
+    def clean_cells(self) -> None:
+        """
+        Remove extraneous '|' characters from the cell text.
+        """
+        for row in self.rows:
+            for col_idx, text in enumerate(row):
+                if "|" in text:
+                    row[col_idx] = _normalize_whitespace(re.sub(r"\|+", " ", text))
+
+    def fix_emails(self, text: str) -> None:
+        """
+        Restore the '@' of the email addresses found in the element text, which the table
+        structure recognition tends to read as '('.
+        """
+        for email_address in re.findall(EMAIL_REGEX, text or ""):
+            domain = email_address[email_address.find("@") + 1:]
+            pattern = re.compile(r"\([\w\.-]+{}".format(domain))
+            self._replace_first(pattern, f"@{domain}")
+
+    def _replace_first(self, pattern: re.Pattern, replacement: str) -> None:
+        for row in self.rows:
+            for col_idx, text in enumerate(row):
+                fixed, count = pattern.subn(replacement, text, count=1)
+                if count:
+                    row[col_idx] = fixed
+                    return
+
+    def to_text(self) -> str:
+        """
+        Flattened cell texts, the input of sentence segmentation.
+        """
+        cells = [column for column in self.header if column] if self.num_header_rows else []
+        cells.extend(text for row in self.body for text in row if text)
+        return " ; ".join(cells)
+
+    def to_markdown(self) -> str:
+        """
+        Markdown table, clean and compact.
+        """
+        if not self.rows:
+            return ""
+
+        headers = self.header if self.num_header_rows else [""] * self.width
+        markdown = tabulate(self.body, headers=headers, tablefmt="pipe", disable_numparse=True)
+
+        # remove whitespace, make markdown more compact
+        markdown = re.sub(r' +', ' ', markdown)
+        markdown = re.sub(r'\|:[-]{3,}', '|:--', markdown)
+
+        return markdown
+
+    def to_html(self) -> str:
+        html = ["<table>"]
+        if self.num_header_rows:
+            html.append("<thead>")
+            for row in self.rows[:self.num_header_rows]:
+                html.append("<tr>" + "".join(f"<th>{escape(text)}</th>" for text in row) + "</tr>")
+            html.append("</thead>")
+        html.append("<tbody>")
+        for row in self.body:
+            html.append("<tr>" + "".join(f"<td>{escape(text)}</td>" for text in row) + "</tr>")
+        html.append("</tbody></table>")
+
+        return "".join(html)
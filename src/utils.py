@@ -28,3 +28,16 @@ def get_logger(
             logger.addHandler(streamHandler)
 
     return logger
+
+def get_rss_bytes() -> int:
+    """
+    Current resident set size of this process, in bytes.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # not on Linux - fall back to the peak RSS (KiB on Linux, bytes on macOS)
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024